@@ -1,16 +1,31 @@
 import streamlit as st
 import pandas as pd
+import copy
 import io
 import os
-import re
-import unicodedata
+import time
 import difflib
-import datetime
-
-# --- CONFIGURACIÓN DE PÁGINA ---
-st.set_page_config(page_title="BUKizador v3", page_icon="✈️", layout="centered")
-
-st.markdown("""
+import traceback
+
+from PIL import Image
+
+from pipeline import (
+    limpiar_serie, detectar_fila_fechas, fechas_de_fila, codificar_con_match, aplicar_resoluciones, procesar_carga,
+    obtener_plantillas, recortar_grilla, clave_snapshot, hashes_hojas_360, llenar_plantilla, detectar_problemas, estado_colaboradores,
+    es_csv, validar, resumen_aproximados,
+)
+from indice_siglas import TOLERANCIA_SUGERIDA
+from trabajos import Trabajo
+from exportar import generar_importador, generar_zip, empaquetar, excede_limites_xls, FORMATOS_EXCEL, LIMITE_FILAS_XLS, LIMITE_COLUMNAS_XLS
+from cache_plantillas import CACHE_PLANTILLAS, hash_contenido
+from snapshots import SNAPSHOTS
+from sesiones import SESIONES, DatoExpirado
+from metricas import RegistroMetricas, resumen_turnos
+
+# Inicio del rerun (el tiempo total se muestra al pie de la barra lateral)
+INICIO_RERUN = time.perf_counter()
+
+ESTILOS = """
     <style>
     .stApp {background-color: #FAFAFA;}
     .block-container {padding-top: 1rem !important;}
@@ -25,383 +40,277 @@ st.markdown("""
     }
     div[data-testid="stImage"] img {border-radius: 12px;}
     </style>
-""", unsafe_allow_html=True)
+"""
+
+# Header: se sirve reescalado al ancho útil de la página (layout centered, pantallas 2x)
+RUTA_HEADER = "header.png"
+ANCHO_HEADER = 1200
+
+# Claves de sesión y su valor inicial (los mutables se copian por sesión)
+ESTADO_INICIAL = {
+    'etapa': 'carga',
+    'df_all_turnos': None,
+    'mapa_nombres': {},
+    'pendientes': [],
+    'plantilla_hash': None,
+    'hojas_mes': [],
+    'hash_360': None,
+    'turnos_no_encontrados': [],
+}
+
+# Claves con datos pesados: en la sesión solo queda su DatoSesion y el dato
+# vive en el gestor de sesiones, que lo vuelca a disco si la pestaña queda inactiva
+CLAVES_PESADAS = ('df_all_turnos', 'reporte_cambios')
+
+
+@st.cache_resource
+def imagen_header(ruta, modificado):
+    """
+    Header reducido a ANCHO_HEADER, una vez por proceso (y por versión del
+    archivo). Sin transparencia se sirve como JPEG: ~50 KB en vez de ~1 MB.
+    """
+    with Image.open(ruta) as imagen:
+        imagen.thumbnail((ANCHO_HEADER, ANCHO_HEADER))
+        buffer = io.BytesIO()
+        if imagen.mode in ('RGBA', 'LA', 'P'):
+            imagen.save(buffer, format='PNG', optimize=True)
+        else:
+            imagen.convert('RGB').save(buffer, format='JPEG', quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+# --- CONFIGURACIÓN DE PÁGINA ---
+st.set_page_config(page_title="BUKizador v3", page_icon="✈️", layout="centered")
+
+st.markdown(ESTILOS, unsafe_allow_html=True)
 
 # --- HEADER ---
-if os.path.exists("header.png"):
-    st.image("header.png", use_container_width=True)
+if os.path.exists(RUTA_HEADER):
+    st.image(imagen_header(RUTA_HEADER, os.path.getmtime(RUTA_HEADER)), use_container_width=True)
 
 st.title("✈️ BUKizador v3")
 st.caption("Input 1: Turnos 360 (supervisores) · Input 2: Importador BUK (.xls)")
 
 # ═══════════════════════════════════════════════════════════════════════════════
-# FUNCIONES AUXILIARES
+# ESTADO DE SESIÓN
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def limpiar_texto(texto):
-    """Normaliza texto: quita acentos, mayúsculas, espacios extra."""
-    if pd.isna(texto) or texto is None:
-        return ""
-    texto = str(texto).strip()
-    texto = unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('utf-8')
-    return texto.upper().strip()
+for clave, valor in ESTADO_INICIAL.items():
+    if clave not in st.session_state:
+        st.session_state[clave] = copy.copy(valor)
 
 
-def normalizar_hora(texto):
+def plantilla_sesion(archivos, catalogo=None):
     """
-    Convierte cualquier formato de hora a 'HH:MM' estándar.
-    Maneja: '8:00', '08:00', '8:30', datetime.time, etc.
+    Plantilla de trabajo de esta sesión y las de cada importador, desde la
+    caché compartida. Si alguna fue desalojada, se vuelven a parsear desde
+    `archivos` (y `catalogo`, si hay plantillas CSV) que siguen en los uploaders.
+    Retorna (plantilla de trabajo, lista de plantillas).
     """
-    if pd.isna(texto) or str(texto).strip() in ['-', '', 'nan']:
-        return None
-    texto = str(texto).strip()
-    # Si es un time object
-    if isinstance(texto, datetime.time):
-        return f"{texto.hour:02d}:{texto.minute:02d}"
-    # Extraer HH:MM con regex
-    match = re.search(r'(\d{1,2}):(\d{2})', texto)
-    if match:
-        h, m = int(match.group(1)), match.group(2)
-        return f"{h:02d}:{m}"
-    # Solo número (ej: "8" → "08:00")
-    match = re.match(r'^(\d{1,2})$', texto)
-    if match:
-        return f"{int(match.group(1)):02d}:00"
-    return None
-
-
-def extraer_rango_horario(texto):
+    plantilla = CACHE_PLANTILLAS.obtener(st.session_state.plantilla_hash)
+    hashes = st.session_state.get('plantillas_hashes') or [st.session_state.plantilla_hash]
+    plantillas = [plantilla if h == st.session_state.plantilla_hash else CACHE_PLANTILLAS.obtener(h) for h in hashes]
+    if plantilla is not None and None not in plantillas:
+        return plantilla, plantillas
+    if not archivos:
+        raise RuntimeError("El importador BUK ya no está disponible. Vuelve a subirlo y presiona 'Comenzar de nuevo'.")
+    plantilla, plantillas = obtener_plantillas(importadores_carga(archivos), catalogo_carga(catalogo))
+    if plantilla.hash != st.session_state.plantilla_hash:
+        raise RuntimeError("El importador BUK cambió desde que se procesó. Presiona 'Comenzar de nuevo'.")
+    return plantilla, plantillas
+
+
+def dato_sesion(clave):
+    """Valor de una clave pesada de la sesión (recargado desde disco si hace falta), o None."""
+    dato = st.session_state.get(clave)
+    return None if dato is None else dato.valor
+
+
+def calculo_sesion(clave, firma, calcular):
     """
-    Extrae (entrada, salida) de un texto como '08:00 - 19:00' o '09:00-20:00'.
-    Retorna tupla de strings normalizados o ('LIBRE', 'LIBRE') o None si error.
+    Resultado de `calcular()` guardado en la sesión bajo `clave` y reutilizado
+    en cada rerun mientras `firma` no cambie (p. ej. marcar exclusiones o
+    paginar no vuelve a codificar ni a llenar). Vive en el gestor de sesiones
+    como los demás datos pesados; si expiró, se recalcula.
     """
-    if pd.isna(texto):
+    guardado = st.session_state.get(clave)
+    if guardado is not None and guardado[0] == firma:
+        try:
+            return guardado[1].valor
+        except DatoExpirado:
+            pass
+    valor = calcular()
+    st.session_state[clave] = (firma, SESIONES.guardar(valor))
+    return valor
+
+
+def calculo_guardado(clave, firma):
+    """Resultado que `calculo_sesion` guardó con esta `firma`, o None si no hay (o expiró)."""
+    guardado = st.session_state.get(clave)
+    if guardado is None or guardado[0] != firma:
         return None
-    texto = str(texto).strip().upper()
-    
-    if texto in ['', 'NAN']:
+    try:
+        return guardado[1].valor
+    except DatoExpirado:
         return None
-    
-    # Detectar "Libre" / "Descanso"
-    if 'LIBRE' in texto or 'DESCANSO' in texto:
-        return ('LIBRE', 'LIBRE')
-    
-    # Normalizar separadores
-    texto_sep = re.sub(r'\s*[-–—]\s*', '-', texto)  # guiones
-    texto_sep = re.sub(r'\s+A\s+|\s+AL\s+', '-', texto_sep)  # "a" / "al"
-    
-    # Extraer todos los patrones HH:MM
-    patron = r'(\d{1,2}):(\d{2})'
-    matches = re.findall(patron, texto_sep)
-    
-    if len(matches) >= 2:
-        h1, m1 = int(matches[0][0]), matches[0][1]
-        h2, m2 = int(matches[-1][0]), matches[-1][1]
-        entrada = f"{h1:02d}:{m1}"
-        salida = f"{h2:02d}:{m2}"
-        return (entrada, salida)
-    
-    # Un solo HH:MM no es un rango válido
-    return None
-
-
-def detectar_fila_fechas(df):
-    """Encuentra la fila que contiene fechas (datetime) en el DataFrame."""
-    for i in range(min(10, len(df))):
-        count_dates = 0
-        for j in range(1, min(40, df.shape[1])):
-            val = df.iloc[i, j]
-            if isinstance(val, (datetime.datetime, pd.Timestamp)):
-                count_dates += 1
-        if count_dates >= 5:  # al menos 5 fechas
-            return i
-    return None
 
 
-def parsear_hoja_turnos(df, nombre_hoja):
+def emitir_metricas(metricas, firma):
     """
-    Parsea una hoja de turnos del formato 360.
-    Retorna DataFrame con columnas: [Nombre, Fecha, Turno_Raw, Rol]
+    Emite el registro de la corrida al primer clic de descarga; volver a
+    descargar (o bajar cada importador por separado) no la cuenta de nuevo.
     """
-    fila_fechas = detectar_fila_fechas(df)
-    if fila_fechas is None:
-        return pd.DataFrame()
-    
-    # Extraer fechas de esa fila
-    fechas = {}
-    for j in range(1, df.shape[1]):
-        val = df.iloc[fila_fechas, j]
-        if isinstance(val, (datetime.datetime, pd.Timestamp)):
-            fechas[j] = pd.Timestamp(val).strftime('%Y-%m-%d')
-    
-    if not fechas:
-        return pd.DataFrame()
-    
-    # Determinar dónde empiezan los datos
-    fila_data = fila_fechas + 1
-    # Saltar filas de encabezado como "Cargo", "Nombre", "Supervisor"
-    while fila_data < len(df):
-        val = df.iloc[fila_data, 0]
-        if pd.isna(val):
-            fila_data += 1
-            continue
-        val_str = str(val).strip().upper()
-        if val_str in ['CARGO', 'NOMBRE', 'SUPERVISOR', '']:
-            fila_data += 1
-            continue
-        break
-    
-    # Determinar rol y mes a partir del nombre de la hoja
-    nombre_upper = nombre_hoja.upper()
-    if 'ANFITRION' in nombre_upper:
-        rol = 'ANFITRION'
-    elif 'AGENTE' in nombre_upper:
-        rol = 'AGENTE'
-    elif 'COORDINADOR' in nombre_upper:
-        rol = 'COORDINADOR'
-    elif 'SUPERVISOR' in nombre_upper:
-        rol = 'SUPERVISOR'
-    else:
-        rol = 'OTRO'
-    
-    # Detectar mes del nombre de la hoja para tiebreaking de solapamientos
-    MESES_ES = {
-        'ENERO': 1, 'FEBRERO': 2, 'MARZO': 3, 'ABRIL': 4, 'MAYO': 5, 'JUNIO': 6,
-        'JULIO': 7, 'AGOSTO': 8, 'SEPTIEMBRE': 9, 'OCTUBRE': 10, 'NOVIEMBRE': 11, 'DICIEMBRE': 12
-    }
-    mes_hoja = None
-    for nombre_mes, num_mes in MESES_ES.items():
-        if nombre_mes in nombre_upper:
-            mes_hoja = num_mes
-            break
-    
-    registros = []
-    PALABRAS_HEADER = {'NOMBRE', 'CARGO', 'SUPERVISOR', 'COLABORADOR', 'NOMBRE DEL COLABORADOR', 'TRABAJADOR', 'EMPLEADO', 'RUT'}
-    for i in range(fila_data, len(df)):
-        nombre = df.iloc[i, 0]
-        if pd.isna(nombre):
-            continue
-        # Saltar filas con valores numéricos (filas de totales/resumen)
-        if isinstance(nombre, (int, float)):
-            continue
-        nombre_str = str(nombre).strip()
-        if nombre_str in ['.', '', 'nan', 'NaN']:
-            continue
-        # Debe contener al menos una letra
-        if not any(c.isalpha() for c in nombre_str):
-            continue
-        # Saltar palabras que son encabezados de columna (no son nombres reales)
-        if nombre_str.upper() in PALABRAS_HEADER:
-            continue
-        
-        for col_idx, fecha_str in fechas.items():
-            turno_raw = df.iloc[i, col_idx] if col_idx < df.shape[1] else None
-            registros.append({
-                'Nombre_Input': nombre_str,
-                'Fecha': fecha_str,
-                'Turno_Raw': turno_raw,
-                'Rol': rol,
-                'Hoja': nombre_hoja,
-                'Mes_Hoja': mes_hoja
-            })
-    
-    return pd.DataFrame(registros)
+    if st.session_state.get('metricas_emitidas') != firma:
+        metricas.emitir()
+        st.session_state.metricas_emitidas = firma
 
 
-def construir_mapa_siglas(df_turnos_semanales):
-    """
-    Construye un diccionario: (entrada, salida, rol) → sigla
-    a partir de la hoja turnosSemanales del importador BUK.
-    """
-    df = df_turnos_semanales.copy()
-    df.columns = ['Nombre', 'Sigla', 'Dia', 'Entrada', 'Salida', 'ColIn', 'ColOut']
-    df = df.iloc[1:]  # Quitar header
-    
-    # Agrupar por sigla para obtener entrada/salida únicos
-    mapa = {}
-    for sigla in df['Sigla'].unique():
-        sub = df[df['Sigla'] == sigla]
-        entradas = [str(e).strip() for e in sub['Entrada'].unique() if str(e).strip() != '-']
-        salidas = [str(s).strip() for s in sub['Salida'].unique() if str(s).strip() != '-']
-        nombre = str(sub['Nombre'].iloc[0]).strip().upper()
-        
-        if not entradas or not salidas:
-            # Es un turno sin horario (D, F, L, P, V, C)
-            continue
-        
-        entrada_norm = normalizar_hora(entradas[0])
-        salida_norm = normalizar_hora(salidas[0])
-        
-        if entrada_norm and salida_norm:
-            # Determinar a qué rol pertenece esta sigla
-            roles = []
-            if 'ANF' in sigla.upper() or 'ANFITRION' in nombre:
-                roles.append('ANFITRION')
-            if 'AGE' in sigla.upper() or 'AGENTE' in nombre:
-                roles.append('AGENTE')
-            if 'COO' in sigla.upper() or 'COORDINADOR' in nombre:
-                roles.append('COORDINADOR')
-            if 'SUP' in sigla.upper() or 'SUPERVISOR' in nombre:
-                roles.append('SUPERVISOR')
-            if 'INDUC' in sigla.upper() or 'INDUCCION' in nombre or 'INDUCCIÓN' in nombre:
-                roles.append('INDUCCION')
-            if 'BASE' in sigla.upper():
-                roles = ['ANFITRION', 'AGENTE', 'COORDINADOR', 'SUPERVISOR', 'OTRO']
-            
-            if not roles:
-                roles = ['OTRO']
-            
-            for rol in roles:
-                key = (entrada_norm, salida_norm, rol)
-                mapa[key] = sigla
-    
-    return mapa
+MIME_SALIDA = {
+    'csv': "text/csv",
+    'xls': "application/vnd.ms-excel",
+    'xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    'zip': "application/zip",
+}
 
 
-def turno_a_sigla(turno_raw, rol, mapa_siglas):
-    """Convierte un turno en texto humano a su sigla BUK."""
-    if pd.isna(turno_raw):
-        return None
-    
-    texto = str(turno_raw).strip().upper()
-    if texto in ['', 'NAN']:
-        return None
-    
-    # ── Palabras clave → sigla directa (antes de intentar parsear horarios) ──
-    # Se busca si la palabra aparece contenida en el texto del supervisor.
-    # Orden importa: las más específicas primero.
-    KEYWORDS_SIGLA = [
-        ('VACACION',   'V'),   # Vacación, Vacaciones
-        ('PERMISO',    'P'),   # Permiso
-        ('COMPENSADO', 'C'),   # Compensado
-        ('FESTIVO',    'F'),   # Festivo
-        ('FERIADO',    'F'),   # Feriado
-        ('LICENCIA',   'L'),   # Licencia → se trata aparte en BUK, dejamos L
-        ('LIBRE',      'L'),   # Libre
-        ('DESCANSO',   'L'),   # Descanso → tratamos como Libre
-    ]
-    
-    # Normalizar: quitar acentos para comparar
-    texto_norm = unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('utf-8')
-    
-    for keyword, sigla in KEYWORDS_SIGLA:
-        if keyword in texto_norm:
-            return sigla
-    
-    # ── Si no es palabra clave, intentar parsear como rango horario ──
-    rango = extraer_rango_horario(turno_raw)
-    
-    if rango is None:
-        return None  # No parseable
-    
-    if rango == ('LIBRE', 'LIBRE'):
-        return 'L'  # Fallback por si extraer_rango lo detecta
-    
-    entrada, salida = rango
-    
-    # Buscar con rol exacto
-    key = (entrada, salida, rol)
-    if key in mapa_siglas:
-        return mapa_siglas[key]
-    
-    # Manejar medianoche: "00:00" como salida → probar con "23:59"
-    if salida == '00:00':
-        key_midnight = (entrada, '23:59', rol)
-        if key_midnight in mapa_siglas:
-            return mapa_siglas[key_midnight]
-    
-    # Fallback: buscar en cualquier rol
-    for (e, s, r), sigla in mapa_siglas.items():
-        if e == entrada and s == salida:
-            return sigla
-    
-    # Fallback medianoche en cualquier rol
-    if salida == '00:00':
-        for (e, s, r), sigla in mapa_siglas.items():
-            if e == entrada and s == '23:59':
-                return sigla
-    
-    return None  # No encontrado
+def importadores_carga(archivos):
+    """[(bytes, nombre)] de los importadores BUK subidos, en el orden del uploader."""
+    return [(archivo.getvalue(), archivo.name) for archivo in archivos]
 
 
-def matching_nombres(nombres_input, nombres_buk):
-    """
-    Hace matching inteligente entre nombres cortos (input) y nombres completos (BUK).
-    Retorna: (mapa_seguro, pendientes)
-      - mapa_seguro: {nombre_input: nombre_buk}
-      - pendientes: [nombre_input, ...] que necesitan corrección manual
-    """
-    nombres_buk_clean = {limpiar_texto(n): n for n in nombres_buk}
-    lista_clean = list(nombres_buk_clean.keys())
-    
-    mapa_seguro = {}
-    pendientes = []
-    
-    for nombre in nombres_input:
-        n_clean = limpiar_texto(nombre)
-        partes = n_clean.split()
-        
-        if not partes:
-            continue
-        
-        # Estrategia 1: Todas las palabras del input aparecen en algún nombre BUK
-        matches = [real for real in lista_clean if all(p in real for p in partes)]
-        
-        if len(matches) == 1:
-            mapa_seguro[nombre] = nombres_buk_clean[matches[0]]
-        elif len(matches) > 1:
-            # Intentar desempatar: el que tenga menos "basura" extra
-            best = min(matches, key=lambda x: len(x) - len(n_clean))
-            mapa_seguro[nombre] = nombres_buk_clean[best]
-        else:
-            # Estrategia 2: Coincidencia difusa
-            posibles = difflib.get_close_matches(n_clean, lista_clean, n=1, cutoff=0.6)
-            if posibles:
-                mapa_seguro[nombre] = nombres_buk_clean[posibles[0]]
-            else:
-                pendientes.append(nombre)
-    
-    return mapa_seguro, pendientes
+def catalogo_carga(archivo):
+    """(bytes, nombre) del catálogo de turnos subido aparte, o None."""
+    if archivo is None:
+        return None
+    return archivo.getvalue(), archivo.name
 
 
-# ═══════════════════════════════════════════════════════════════════════════════
-# ESTADO DE SESIÓN
-# ═══════════════════════════════════════════════════════════════════════════════
+@st.cache_data(max_entries=4, show_spinner=False)
+def hashes_360(datos, hojas):
+    """Hashes de contenido por hoja del 360 (cacheados entre reruns)."""
+    return hashes_hojas_360(datos, hojas)
+
 
-if 'etapa' not in st.session_state:
-    st.session_state.etapa = 'carga'
-if 'df_all_turnos' not in st.session_state:
-    st.session_state.df_all_turnos = None
-if 'mapa_siglas' not in st.session_state:
-    st.session_state.mapa_siglas = None
-if 'mapa_nombres' not in st.session_state:
-    st.session_state.mapa_nombres = {}
-if 'pendientes' not in st.session_state:
-    st.session_state.pendientes = []
-if 'nombres_buk' not in st.session_state:
-    st.session_state.nombres_buk = []
-if 'df_buk_header' not in st.session_state:
-    st.session_state.df_buk_header = None
-if 'df_buk_data' not in st.session_state:
-    st.session_state.df_buk_data = None
-if 'buk_bytes' not in st.session_state:
-    st.session_state.buk_bytes = None
-if 'hojas_mes' not in st.session_state:
-    st.session_state.hojas_mes = []
-if 'turnos_no_encontrados' not in st.session_state:
-    st.session_state.turnos_no_encontrados = []
+def mostrar_reporte_cambios():
+    """Resumen de lo que cambió respecto de la versión anterior del 360."""
+    try:
+        reporte = dato_sesion('reporte_cambios')
+    except DatoExpirado:
+        return
+    if not reporte:
+        return
+    with st.expander("📝 Cambios respecto de la versión anterior del 360", expanded=True):
+        st.write(
+            f"Hojas re-parseadas: **{len(reporte['hojas_cambiadas'])}** · "
+            f"sin cambios: **{len(reporte['hojas_sin_cambios'])}**"
+        )
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Celdas modificadas", reporte['modificadas'])
+        c2.metric("Celdas agregadas", reporte['agregadas'])
+        c3.metric("Celdas eliminadas", reporte['eliminadas'])
+        st.write(
+            f"Nombres reutilizados: **{reporte['nombres_heredados']}** · nuevos: **{len(reporte['nombres_nuevos'])}** · "
+            f"resoluciones conservadas: **{reporte['resoluciones_conservadas']}** · "
+            f"descartadas por cambio de celda: **{reporte['resoluciones_descartadas']}**"
+        )
+        if len(reporte['detalle']):
+            st.dataframe(reporte['detalle'].head(500), use_container_width=True, hide_index=True)
+
+
+def mostrar_validacion(res):
+    """Resultado del ensayo (solo validar): conteos y listas para revisar antes del flujo completo."""
+    st.success(f"🧪 Validación lista en {res['segundos']:.2f} s · {res['registros']} registros en {len(res['hojas'])} hojas")
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Nombres con match", f"{res['nombres_con_match']}/{res['nombres']}")
+    c2.metric("Nombres sin match", len(res['nombres_sin_match']))
+    c3.metric("Celdas codificadas", res['celdas_codificadas'])
+    c4.metric("Celdas REVISAR", res['celdas_revisar'])
+    if res['nombres_sin_match']:
+        with st.expander(f"👤 Nombres sin match ({len(res['nombres_sin_match'])})"):
+            st.write(", ".join(res['nombres_sin_match']))
+    if res['turnos_aproximados']:
+        with st.expander(f"🎯 {res['celdas_aproximadas']} celdas codificadas por tolerancia (±{res['tolerancia']} min)"):
+            st.dataframe(pd.DataFrame(res['turnos_aproximados']), use_container_width=True, hide_index=True)
+    if res['turnos_desconocidos']:
+        with st.expander(f"❓ Turnos desconocidos ({len(res['turnos_desconocidos'])} textos distintos)"):
+            st.dataframe(
+                pd.DataFrame(list(res['turnos_desconocidos'].items()), columns=['Turno', 'Celdas']),
+                use_container_width=True, hide_index=True,
+            )
+
+
+with st.sidebar:
+    tolerancia = int(st.number_input(
+        "⏱️ Tolerancia de horario (min)", min_value=0, max_value=60, value=TOLERANCIA_SUGERIDA, step=1,
+        key="tolerancia_siglas",
+        help="Un horario sin sigla exacta toma la del catálogo más cercana si entrada y salida difieren "
+             "a lo más estos minutos (ej: 08:05-19:00 → 08:00-19:00). 0 = solo coincidencias exactas.",
+    ))
+    stats_sesiones = SESIONES.estadisticas()
+    st.caption(
+        f"💾 Datos de sesión: {stats_sesiones['en_memoria']} en memoria · {stats_sesiones['en_disco']} en disco · "
+        f"{stats_sesiones['bytes'] / 1024**2:.1f}/{stats_sesiones['max_bytes'] / 1024**2:.0f} MB · "
+        f"{stats_sesiones['volcados']} volcados / {stats_sesiones['recargas']} recargas"
+    )
+    stats_cache = CACHE_PLANTILLAS.estadisticas()
+    st.caption(
+        f"🗄️ Caché de plantillas: {stats_cache['entradas']} · "
+        f"{stats_cache['bytes'] / 1024**2:.1f}/{stats_cache['max_bytes'] / 1024**2:.0f} MB · "
+        f"{stats_cache['hits']} hits / {stats_cache['misses']} misses · {stats_cache['desalojos']} desalojos"
+    )
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # FASE 1: CARGA DE ARCHIVOS
 # ═══════════════════════════════════════════════════════════════════════════════
 
-st.info("💡 Sube los 2 archivos: el Excel de turnos (formato 360) y el importador BUK (.xls)")
+st.info("💡 Sube los 2 archivos: el Excel de turnos (formato 360) y el importador BUK (.xls o .csv). "
+        "Puedes subir varios importadores (ej: los semanales del mes) y se llenan todos en una pasada.")
 
 col1, col2 = st.columns(2)
 archivo_360 = col1.file_uploader("📋 Turnos 360 (supervisores)", type=["xlsx"], key="input360")
-archivo_buk = col2.file_uploader("📦 Importador BUK", type=["xls", "xlsx"], key="inputbuk")
-
-if archivo_360 and archivo_buk and st.session_state.etapa == 'carga':
+archivos_buk = col2.file_uploader(
+    "📦 Importador BUK (uno o varios)", type=["xls", "xlsx", "csv"], key="inputbuk", accept_multiple_files=True,
+)
+if len(archivos_buk) > 1:
+    col2.caption(f"📦 {len(archivos_buk)} importadores: comparten turnos, nombres y correcciones; cada uno sale con sus fechas y colaboradores.")
+
+# Una plantilla CSV trae solo turnosColaboradores: el catálogo de turnos va aparte
+archivo_catalogo = None
+requiere_catalogo = any(es_csv(archivo.name) for archivo in archivos_buk)
+if requiere_catalogo:
+    archivo_catalogo = col2.file_uploader(
+        "📑 Catálogo de turnos (turnosSemanales)", type=["csv", "xls", "xlsx"], key="inputcatalogo",
+        help="CSV con la hoja turnosSemanales, o el importador BUK en Excel del que se toman las hojas de catálogo.",
+    )
+    if archivo_catalogo is None:
+        st.info("💡 La plantilla es CSV: sube también el catálogo de turnos para poder codificar las siglas.")
+
+if archivo_360 and archivos_buk and (archivo_catalogo or not requiere_catalogo) and st.session_state.etapa == 'carga':
+    
+    # ── Trabajo de procesamiento en curso ──
+    trabajo = st.session_state.get('trabajo_carga')
+    if trabajo is not None:
+        if trabajo.activo:
+            st.progress(trabajo.fraccion, text=f"⏳ {trabajo.etapa} — {trabajo.detalle}" if trabajo.etapa else "⏳ Iniciando...")
+            if trabajo.eventos:
+                st.caption(" · ".join(f"{e}: {d}" if d else e for e, d in trabajo.eventos[-4:]))
+            if st.button("⛔ Cancelar procesamiento"):
+                trabajo.cancelar()
+            time.sleep(0.4)
+            st.rerun()
+        
+        del st.session_state.trabajo_carga
+        if trabajo.estado == 'terminado':
+            for clave, valor in trabajo.resultado.items():
+                st.session_state[clave] = SESIONES.guardar(valor) if clave in CLAVES_PESADAS and valor is not None else valor
+            st.session_state.pop('ejecucion_previa', None)
+            st.session_state.etapa = 'correccion'
+            st.rerun()
+        elif trabajo.estado == 'cancelado':
+            st.warning("Procesamiento cancelado.")
+        else:
+            st.error(f"Error al leer archivos: {trabajo.error}")
+            st.code(trabajo.traza)
     
     try:
         xls360 = pd.ExcelFile(archivo_360)
@@ -415,17 +324,21 @@ if archivo_360 and archivo_buk and st.session_state.etapa == 'carga':
         st.write("**Hojas detectadas en el archivo 360:**")
         info_hojas = []
         hojas_validas = []
+        hashes_hojas = hashes_360(archivo_360.getvalue(), tuple(hojas))
         for h in hojas:
+            # Si la hoja ya tiene snapshot en disco, su rango sale de los metadatos
+            meta = SNAPSHOTS.meta(clave_snapshot(hashes_hojas[h], h))
+            if meta and meta['filas']:
+                rango = f"{pd.Timestamp(meta['fecha_min']).strftime('%d-%m-%Y')} → {pd.Timestamp(meta['fecha_max']).strftime('%d-%m-%Y')}"
+                info_hojas.append(f"  ✅ `{h}` — {rango} ({meta['n_fechas']} días) · ⚡ snapshot")
+                hojas_validas.append(h)
+                continue
             df_tmp = pd.read_excel(xls360, sheet_name=h, header=None)
             ff = detectar_fila_fechas(df_tmp)
             if ff is None:
                 info_hojas.append(f"  ⚠️ `{h}` — sin formato de fechas reconocible (será omitida)")
                 continue
-            fechas_tmp = []
-            for j in range(1, df_tmp.shape[1]):
-                v = df_tmp.iloc[ff, j]
-                if isinstance(v, (datetime.datetime, pd.Timestamp)):
-                    fechas_tmp.append(pd.Timestamp(v))
+            fechas_tmp = list(fechas_de_fila(df_tmp, ff).values())
             if fechas_tmp:
                 rango = f"{min(fechas_tmp).strftime('%d-%m-%Y')} → {max(fechas_tmp).strftime('%d-%m-%Y')}"
                 info_hojas.append(f"  ✅ `{h}` — {rango} ({len(fechas_tmp)} días)")
@@ -439,10 +352,14 @@ if archivo_360 and archivo_buk and st.session_state.etapa == 'carga':
             st.stop()
         
         st.write("")
+        previa = st.session_state.get('ejecucion_previa')
+        if previa is not None:
+            st.info("🔁 Revisión del 360: solo se re-parsean las hojas que cambiaron y se conservan nombres, correcciones y exclusiones de la ejecución anterior.")
+        hojas_default = [h for h in st.session_state.hojas_mes if h in hojas_validas] if previa is not None else []
         hojas_seleccionadas = st.multiselect(
             "📋 Hojas a procesar (puedes seleccionar varias para cubrir rangos entre meses):",
             options=hojas_validas,
-            default=hojas_validas
+            default=hojas_default or hojas_validas
         )
         
         st.caption("💡 Si una fecha aparece en varias hojas, se prefiere la hoja cuyo mes coincida con la fecha (ej: 1-abr se toma de 'Abril', no de 'Marzo').")
@@ -451,103 +368,75 @@ if archivo_360 and archivo_buk and st.session_state.etapa == 'carga':
             st.warning("Selecciona al menos una hoja.")
             st.stop()
         
-        if st.button("🔍 Analizar y Procesar", type="primary"):
-            with st.spinner("Leyendo y procesando datos..."):
-                
-                # ── LEER IMPORTADOR BUK ──
-                st.session_state.buk_bytes = archivo_buk.read()
-                archivo_buk.seek(0)
-                
-                buk_name = archivo_buk.name.lower()
-                if buk_name.endswith('.xls') and not buk_name.endswith('.xlsx'):
-                    xls_buk = pd.ExcelFile(archivo_buk, engine='xlrd')
-                    st.session_state.buk_is_xls = True
-                else:
-                    xls_buk = pd.ExcelFile(archivo_buk, engine='openpyxl')
-                    st.session_state.buk_is_xls = False
-                
-                # Hoja turnosColaboradores
-                df_tc_raw = pd.read_excel(xls_buk, sheet_name='turnosColaboradores', header=None)
-                header_row = df_tc_raw.iloc[0].tolist()
-                df_tc = df_tc_raw.iloc[1:].copy()
-                df_tc.columns = header_row
-                df_tc = df_tc.reset_index(drop=True)
-                
-                st.session_state.df_buk_header = header_row
-                st.session_state.df_buk_data = df_tc
-                
-                nombres_buk = df_tc['Nombre del Colaborador'].tolist()
-                ruts_buk = df_tc['RUT'].tolist()
-                st.session_state.nombres_buk = nombres_buk
-                nombre_a_rut = dict(zip(nombres_buk, ruts_buk))
-                st.session_state.nombre_a_rut = nombre_a_rut
-                
-                # Hoja turnosSemanales (codificación)
-                df_ts_raw = pd.read_excel(xls_buk, sheet_name='turnosSemanales', header=None)
-                mapa_siglas = construir_mapa_siglas(df_ts_raw)
-                st.session_state.mapa_siglas = mapa_siglas
-                
-                # ── LEER TURNOS 360 (TODAS LAS HOJAS SELECCIONADAS) ──
-                all_turnos = []
-                for hoja in hojas_seleccionadas:
-                    df_hoja = pd.read_excel(xls360, sheet_name=hoja, header=None)
-                    df_parsed = parsear_hoja_turnos(df_hoja, hoja)
-                    if not df_parsed.empty:
-                        all_turnos.append(df_parsed)
-                
-                if not all_turnos:
-                    st.error("No se pudieron parsear turnos de las hojas seleccionadas.")
-                    st.stop()
-                
-                df_all = pd.concat(all_turnos, ignore_index=True)
-                
-                # ── RESOLUCIÓN DE SOLAPAMIENTOS ──
-                # Para (Nombre, Fecha, Rol) duplicados, preferir la hoja cuyo mes coincida
-                # con el mes de la fecha. Si ninguno coincide, tomar el primero.
-                df_all['_fecha_dt'] = pd.to_datetime(df_all['Fecha'])
-                df_all['_mes_fecha'] = df_all['_fecha_dt'].dt.month
-                df_all['_match_mes'] = (df_all['Mes_Hoja'] == df_all['_mes_fecha']).astype(int)
-                
-                # Ordenar: primero los que matchean mes (1), luego por hoja (estable)
-                df_all = df_all.sort_values(
-                    by=['Nombre_Input', 'Fecha', 'Rol', '_match_mes'],
-                    ascending=[True, True, True, False]
-                )
-                df_all = df_all.drop_duplicates(
-                    subset=['Nombre_Input', 'Fecha', 'Rol'],
-                    keep='first'
-                )
-                df_all = df_all.drop(columns=['_fecha_dt', '_mes_fecha', '_match_mes'])
-                df_all = df_all.reset_index(drop=True)
-                
-                st.session_state.df_all_turnos = df_all
-                st.session_state.hojas_mes = hojas_seleccionadas
-                
-                # ── MATCHING DE NOMBRES ──
-                nombres_input = df_all['Nombre_Input'].unique().tolist()
-                mapa, pendientes = matching_nombres(nombres_input, nombres_buk)
-                
-                st.session_state.mapa_nombres = mapa
-                st.session_state.pendientes = pendientes
-                
-                st.session_state.etapa = 'correccion'
-                st.rerun()
+        # Ensayo: solo conteos de nombres sin match y turnos desconocidos, sin pasar por corrección ni descarga
+        solo_validar = st.toggle("🧪 Solo validar (ensayo rápido, sin generar archivo)", key="solo_validar")
+        if solo_validar:
+            firma_validacion = (archivo_360.name, tuple(a.name for a in archivos_buk), tuple(hojas_seleccionadas), tolerancia)
+            if st.button("🧪 Validar", type="primary"):
+                (buk_bytes, buk_nombre), *adicionales = importadores_carga(archivos_buk)
+                st.session_state.validacion = (firma_validacion, validar(
+                    archivo_360.getvalue(),
+                    buk_bytes,
+                    buk_nombre,
+                    hojas_seleccionadas,
+                    catalogo=catalogo_carga(archivo_catalogo),
+                    tolerancia=tolerancia,
+                    adicionales=adicionales,
+                ))
+            validacion = st.session_state.get('validacion')
+            if validacion is not None and validacion[0] == firma_validacion:
+                mostrar_validacion(validacion[1])
+        
+        elif st.button("🔍 Analizar y Procesar", type="primary"):
+            # El pipeline corre en un hilo de fondo; la UI sigue respondiendo
+            # y muestra el avance por etapa/hoja en cada rerun.
+            (buk_bytes, buk_nombre), *adicionales = importadores_carga(archivos_buk)
+            st.session_state.trabajo_carga = Trabajo(
+                procesar_carga,
+                archivo_360.getvalue(),
+                buk_bytes,
+                buk_nombre,
+                hojas_seleccionadas,
+                previa=None if previa is None else {**previa, 'df_all_turnos': previa['df_all_turnos'].valor},
+                catalogo=catalogo_carga(archivo_catalogo),
+                adicionales=adicionales,
+            ).iniciar()
+            st.rerun()
     
     except Exception as e:
         st.error(f"Error al leer archivos: {e}")
-        import traceback
         st.code(traceback.format_exc())
 
 
+# ── Nueva versión del 360 sobre una sesión ya procesada → re-procesamiento incremental ──
+if (st.session_state.etapa in ('correccion', 'descarga') and archivo_360 is not None
+        and st.session_state.hash_360 and hash_contenido(archivo_360.getvalue()) != st.session_state.hash_360):
+    st.info("📝 Subiste una versión distinta del archivo 360.")
+    if st.button("🔁 Procesar revisión (solo cambios)"):
+        # df_all_turnos viaja como DatoSesion: se lee recién al lanzar el re-procesamiento
+        st.session_state.ejecucion_previa = {
+            'df_all_turnos': st.session_state.df_all_turnos,
+            'mapa_nombres': st.session_state.mapa_nombres,
+            # En 'correccion' los pendientes aún no se resolvieron; en 'descarga' los que
+            # quedaron fuera del mapa se omitieron a propósito
+            'pendientes': list(st.session_state.pendientes) if st.session_state.etapa == 'correccion' else [],
+            'hashes_hojas': st.session_state.get('hashes_hojas', {}),
+            'resoluciones_problemas': st.session_state.get('resoluciones_problemas', {}),
+        }
+        st.session_state.etapa = 'carga'
+        st.rerun()
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # FASE 2: CORRECCIÓN DE NOMBRES
 # ═══════════════════════════════════════════════════════════════════════════════
 
 if st.session_state.etapa == 'correccion':
     st.divider()
+    mostrar_reporte_cambios()
     
     pendientes = st.session_state.pendientes
-    nombres_buk = st.session_state.nombres_buk
+    nombres_buk = plantilla_sesion(archivos_buk, archivo_catalogo)[0].nombres
     mapa = st.session_state.mapa_nombres
     
     # Mostrar matches automáticos
@@ -565,15 +454,15 @@ if st.session_state.etapa == 'correccion':
         
         # Opciones para selectbox
         opciones = sorted(nombres_buk)
+        nombres_buk_clean = limpiar_serie(pd.Series(opciones, dtype=object)).tolist()
+        pendientes_clean = limpiar_serie(pd.Series(pendientes, dtype=object)).tolist()
         
         with st.form("form_correcciones"):
             st.write("### 🛠️ Corrección Manual")
             
             correcciones = {}
-            for i, nombre_mal in enumerate(pendientes):
+            for i, (nombre_mal, n_clean) in enumerate(zip(pendientes, pendientes_clean)):
                 # Sugerir el más parecido
-                n_clean = limpiar_texto(nombre_mal)
-                nombres_buk_clean = [limpiar_texto(n) for n in opciones]
                 sugerencia_idx = 0
                 
                 posibles = difflib.get_close_matches(n_clean, nombres_buk_clean, n=1, cutoff=0.3)
@@ -613,116 +502,66 @@ if st.session_state.etapa == 'correccion':
 if st.session_state.etapa == 'descarga':
     st.divider()
     st.write("### 🚀 Generando Archivo Final...")
+    mostrar_reporte_cambios()
     
     try:
-        df_all = st.session_state.df_all_turnos
+        df_all = dato_sesion('df_all_turnos')
         mapa_nombres = st.session_state.mapa_nombres
-        mapa_siglas = st.session_state.mapa_siglas
-        df_buk = st.session_state.df_buk_data
-        header_buk = st.session_state.df_buk_header
-        nombre_a_rut = st.session_state.nombre_a_rut
-        
-        # ── Filtrar fechas que existen en el importador BUK ──
-        # Las fechas del BUK están como DD-MM-YYYY en el header
-        fechas_buk = {}
-        for col in header_buk:
-            if col in ['Nombre del Colaborador', 'RUT', 'Área', 'Supervisor']:
-                continue
-            if col is None or pd.isna(col):
-                continue
-            # Intentar parsear como fecha
-            try:
-                dt = pd.to_datetime(str(col), format='%d-%m-%Y', errors='raise')
-                fechas_buk[dt.strftime('%Y-%m-%d')] = col
-            except:
-                try:
-                    dt = pd.to_datetime(str(col), dayfirst=True, errors='raise')
-                    fechas_buk[dt.strftime('%Y-%m-%d')] = col
-                except:
-                    pass
+        # Con varios importadores, `plantilla` es su combinación: una sola grilla RUT × fecha
+        plantilla, plantillas = plantilla_sesion(archivos_buk, archivo_catalogo)
+        mapa_siglas = plantilla.mapa_siglas
+        df_buk = plantilla.df_data
+        # Columnas de fecha, posiciones y último día: resueltos una vez al cargar la plantilla
+        esquema = plantilla.esquema
+        # Métricas de la corrida: la carga (hilo de fondo) dejó las suyas en la sesión
+        metricas = RegistroMetricas('app')
+        metricas.absorber(st.session_state.get('metricas_carga') or {})
         
         # ── Convertir turnos a siglas ──
-        df_all['Nombre_BUK'] = df_all['Nombre_Input'].map(mapa_nombres)
-        # Filtrar solo los que tienen match
-        df_con_match = df_all[df_all['Nombre_BUK'].notna()].copy()
-        
-        # Obtener RUT
-        df_con_match['RUT'] = df_con_match['Nombre_BUK'].map(nombre_a_rut)
-        
-        # Mapear turnos a siglas
-        turnos_no_encontrados = set()
-        
-        def resolver_sigla(row):
-            sigla = turno_a_sigla(row['Turno_Raw'], row['Rol'], mapa_siglas)
-            if sigla is None and pd.notna(row['Turno_Raw']) and str(row['Turno_Raw']).strip() not in ['', 'nan']:
-                turnos_no_encontrados.add(str(row['Turno_Raw']).strip())
-                return f"REVISAR:{str(row['Turno_Raw']).strip()}"
-            return sigla
-        
-        df_con_match['Sigla'] = df_con_match.apply(resolver_sigla, axis=1)
-        st.session_state.turnos_no_encontrados = list(turnos_no_encontrados)
-        
-        # ── Construir el DataFrame de salida con la estructura BUK ──
-        # Para cada RUT en el BUK, llenar las columnas de fecha con la sigla correspondiente
-        df_output = df_buk.copy()
-        
-        # Determinar cuál es la última fecha del importador (para el truco de D final)
-        fechas_iso_ordenadas = sorted(fechas_buk.keys())
-        ultima_fecha_iso = fechas_iso_ordenadas[-1] if fechas_iso_ordenadas else None
-        ultima_col_buk = fechas_buk.get(ultima_fecha_iso) if ultima_fecha_iso else None
-        
-        for idx, row_buk in df_output.iterrows():
-            rut = row_buk['RUT']
-            # Buscar turnos de este colaborador
-            turnos_colab = df_con_match[df_con_match['RUT'] == rut]
-            
-            for fecha_iso, col_buk in fechas_buk.items():
-                # Último día del importador → siempre D (truco de configuración BUK)
-                if col_buk == ultima_col_buk:
-                    df_output.at[idx, col_buk] = 'D'
-                    continue
-                
-                if turnos_colab.empty:
-                    # Sin datos del 360 para este colaborador → L (Libre)
-                    df_output.at[idx, col_buk] = 'L'
-                    continue
-                
-                turno_dia = turnos_colab[turnos_colab['Fecha'] == fecha_iso]
-                if not turno_dia.empty:
-                    sigla = turno_dia.iloc[0]['Sigla']
-                    if sigla is not None:
-                        df_output.at[idx, col_buk] = sigla
-                    else:
-                        # Celda vacía en el input 360 → L
-                        df_output.at[idx, col_buk] = 'L'
-                else:
-                    # Fecha existe en BUK pero no en el 360 → L
-                    df_output.at[idx, col_buk] = 'L'
-        
-        # ── Detección de turnos problemáticos ──
-        # Recorrer df_output buscando celdas REVISAR:... para construir lista de problemas
-        problemas = []
-        for idx, row_buk in df_output.iterrows():
-            rut = row_buk['RUT']
-            nombre = row_buk['Nombre del Colaborador']
-            for fi, cb in fechas_buk.items():
-                val = df_output.at[idx, cb]
-                if isinstance(val, str) and val.startswith('REVISAR:'):
-                    turno_raw = val.replace('REVISAR:', '', 1)
-                    # Buscar el rol desde df_con_match
-                    rol_rows = df_con_match[(df_con_match['RUT'] == rut) & (df_con_match['Fecha'] == fi)]
-                    rol = rol_rows.iloc[0]['Rol'] if not rol_rows.empty else 'N/A'
-                    problemas.append({
-                        'key': f"{rut}__{fi}",
-                        'rut': rut,
-                        'nombre': nombre,
-                        'fecha_iso': fi,
-                        'fecha_display': cb,
-                        'rol': rol,
-                        'turno_raw': turno_raw,
-                        'idx': idx,
-                        'col': cb,
-                    })
+        # Memo (texto, rol) → sigla de la sesión: sobrevive a revisiones del 360,
+        # así que solo se resuelven los textos que no se habían visto.
+        # Depende de la plantilla y de la tolerancia: si cambia cualquiera, se rehace.
+        if st.session_state.get('siglas_memo_plantilla') != (plantilla.hash, tolerancia):
+            st.session_state.siglas_memo = {}
+            st.session_state.siglas_aproximados = {}
+            st.session_state.siglas_memo_plantilla = (plantilla.hash, tolerancia)
+        def codificar_y_llenar():
+            registro = RegistroMetricas('app')
+            with registro.etapa('codificacion'):
+                df_con_match, turnos_no_encontrados = codificar_con_match(
+                    df_all, mapa_nombres, plantilla, st.session_state.siglas_memo,
+                    tolerancia=tolerancia, aproximados=st.session_state.siglas_aproximados,
+                )
+            # ── Construir el DataFrame de salida con la estructura BUK ──
+            # Para cada RUT en el BUK, llenar las columnas de fecha con la sigla correspondiente
+            with registro.etapa('llenado'):
+                df_output = llenar_plantilla(df_buk, esquema, df_con_match, plantilla.celdas_fijas)
+            # ── Detección de turnos problemáticos ──
+            # Celdas REVISAR:... para construir lista de problemas
+            with registro.etapa('problemas'):
+                problemas = detectar_problemas(df_output, esquema, df_con_match)
+            return {
+                'df_con_match': df_con_match,
+                'turnos_no_encontrados': list(turnos_no_encontrados),
+                'df_aprox': resumen_aproximados(df_con_match['Turno_Raw'], df_con_match['Rol'], st.session_state.siglas_aproximados),
+                'df_output': df_output,
+                'problemas': problemas,
+                'resumen_turnos': resumen_turnos(df_con_match),
+                'duraciones': registro.datos['duraciones'],
+            }
+        
+        # Codificación, llenado y problemas solo se rehacen si cambia la corrida:
+        # turnos del 360, nombres, plantilla o tolerancia
+        firma_corrida = (st.session_state.df_all_turnos.clave, plantilla.hash, tolerancia, tuple(sorted(mapa_nombres.items())))
+        grilla = calculo_sesion('grilla_descarga', firma_corrida, codificar_y_llenar)
+        df_con_match, df_aprox, problemas = grilla['df_con_match'], grilla['df_aprox'], grilla['problemas']
+        st.session_state.turnos_no_encontrados = grilla['turnos_no_encontrados']
+        metricas.absorber({'duraciones': grilla['duraciones']})
+        
+        # Horarios asignados por cercanía: visibles para que se puedan auditar
+        if len(df_aprox):
+            with st.expander(f"🎯 {int(df_aprox['Celdas'].sum())} celdas codificadas por tolerancia (±{tolerancia} min) — {len(df_aprox)} horarios"):
+                st.dataframe(df_aprox, use_container_width=True, hide_index=True)
         
         # Inicializar resoluciones y estado en session_state
         if 'resoluciones_problemas' not in st.session_state:
@@ -854,54 +693,25 @@ if st.session_state.etapa == 'descarga':
                 
                 st.divider()
         
-        # ── Aplicar resoluciones a df_output (siempre, si estado='aplicadas') ──
-        ruts_omitidos_por_problema = set()
-        for p in problemas:
-            res = st.session_state.resoluciones_problemas.get(p['key'], {'tipo': 'bdmaestra'})
-            if res['tipo'] == 'manual':
-                df_output.at[p['idx'], p['col']] = res['sigla']
-            elif res['tipo'] == 'omitir':
-                ruts_omitidos_por_problema.add(p['rut'])
-            # 'bdmaestra' → REVISAR: se queda en la celda
-        
-        # ── Análisis de estado por colaborador ──
-        # Clasifica cada fila como: OK / sin datos / con errores (REVISAR)
-        estado_filas = []
-        for idx, row_buk in df_output.iterrows():
-            rut = row_buk['RUT']
-            nombre = row_buk['Nombre del Colaborador']
-            area = row_buk.get('Área', '')
-            supervisor = row_buk.get('Supervisor', '')
-            turnos_colab = df_con_match[df_con_match['RUT'] == rut]
-            
-            # Contar errores REVISAR en la fila del output
-            n_revisar = 0
-            for fi, cb in fechas_buk.items():
-                val = df_output.at[idx, cb]
-                if isinstance(val, str) and val.startswith('REVISAR'):
-                    n_revisar += 1
-            
-            if turnos_colab.empty:
-                estado = "⚠️ Sin datos 360"
-                motivo = "no tiene registros en el archivo 360"
-            elif n_revisar > 0:
-                estado = f"🔴 {n_revisar} turnos con error"
-                motivo = f"{n_revisar} celdas con formato no reconocido"
-            else:
-                estado = "✅ OK"
-                motivo = f"{len(turnos_colab)} turnos cargados correctamente"
-            
-            estado_filas.append({
-                'idx_original': idx,
-                'RUT': rut,
-                'Nombre': nombre,
-                'Área': area,
-                'Supervisor': supervisor,
-                'Estado': estado,
-                'Detalle': motivo,
-            })
-        
-        df_estado = pd.DataFrame(estado_filas)
+        def resolver():
+            # ── Aplicar resoluciones a df_output (siempre, si estado='aplicadas') ──
+            # Sobre una copia: la grilla guardada queda sin resolver por si se editan las correcciones
+            df_output = grilla['df_output'].copy()
+            ruts_omitidos = aplicar_resoluciones(df_output, problemas, st.session_state.resoluciones_problemas)
+            # ── Análisis de estado por colaborador ──
+            # Clasifica cada fila como: OK / sin datos / con errores (REVISAR)
+            return {
+                'df_output': df_output,
+                'ruts_omitidos': ruts_omitidos,
+                'df_estado': estado_colaboradores(df_output, esquema, df_con_match),
+            }
+        
+        firma_resuelta = (firma_corrida, tuple(sorted(
+            (k, tuple(sorted(v.items()))) for k, v in st.session_state.resoluciones_problemas.items()
+        )))
+        resuelta = calculo_sesion('grilla_resuelta', firma_resuelta, resolver)
+        df_output, df_estado = resuelta['df_output'], resuelta['df_estado']
+        ruts_omitidos_por_problema = resuelta['ruts_omitidos']
         
         # ── Panel de revisión y exclusión ──
         st.subheader("📋 Revisión de Colaboradores")
@@ -917,25 +727,71 @@ if st.session_state.etapa == 'descarga':
         col_st3.metric("🔴 Con errores", int(n_err))
         
         # Inicializar exclusiones en session_state
+        # Las exclusiones viven como un set de RUTs: la tabla solo muestra una página
+        # y cada edición toca únicamente los RUTs de esa página.
         if 'ruts_excluidos' not in st.session_state:
             st.session_state.ruts_excluidos = set()
+        if 'version_exclusion' not in st.session_state:
+            st.session_state.version_exclusion = 0
         
         # Botones de acción rápida
         col_b1, col_b2, col_b3 = st.columns(3)
         if col_b1.button("Excluir 'Sin datos 360'"):
             sin_datos = df_estado[df_estado['Estado'].str.startswith('⚠️')]['RUT'].tolist()
             st.session_state.ruts_excluidos.update(sin_datos)
+            st.session_state.version_exclusion += 1
             st.rerun()
         if col_b2.button("Excluir 'Con errores'"):
             con_err = df_estado[df_estado['Estado'].str.startswith('🔴')]['RUT'].tolist()
             st.session_state.ruts_excluidos.update(con_err)
+            st.session_state.version_exclusion += 1
             st.rerun()
         if col_b3.button("Incluir todos"):
             st.session_state.ruts_excluidos = set()
+            st.session_state.version_exclusion += 1
             st.rerun()
         
-        # Tabla editable con data_editor
-        df_tabla = df_estado[['RUT', 'Nombre', 'Área', 'Supervisor', 'Estado', 'Detalle']].copy()
+        # ── Filtros (se aplican en el servidor, al navegador solo viaja la página visible) ──
+        ESTADOS_FILTRO = {'✅ OK': '✅', '⚠️ Sin datos 360': '⚠️', '🔴 Con errores': '🔴'}
+        col_f1, col_f2, col_f3 = st.columns(3)
+        filtro_estado = col_f1.multiselect("Estado", options=list(ESTADOS_FILTRO.keys()), key='filtro_estado')
+        filtro_area = col_f2.multiselect(
+            "Área", options=sorted(df_estado['Área'].fillna('').astype(str).unique()), key='filtro_area'
+        )
+        filtro_supervisor = col_f3.multiselect(
+            "Supervisor", options=sorted(df_estado['Supervisor'].fillna('').astype(str).unique()), key='filtro_supervisor'
+        )
+        
+        mascara = pd.Series(True, index=df_estado.index)
+        if filtro_estado:
+            prefijos = tuple(ESTADOS_FILTRO[e] for e in filtro_estado)
+            mascara &= df_estado['Estado'].str.startswith(prefijos)
+        if filtro_area:
+            mascara &= df_estado['Área'].fillna('').astype(str).isin(filtro_area)
+        if filtro_supervisor:
+            mascara &= df_estado['Supervisor'].fillna('').astype(str).isin(filtro_supervisor)
+        df_filtrado = df_estado[mascara]
+        
+        # ── Paginación ──
+        col_p1, col_p2 = st.columns(2)
+        tamano_pagina = col_p1.selectbox("Filas por página", options=[25, 50, 100, 250], index=1, key='tamano_pagina')
+        n_paginas = max(1, -(-len(df_filtrado) // tamano_pagina))
+        # La firma de filtros reinicia la página cuando cambia el subconjunto visible
+        firma_filtros = abs(hash((tuple(filtro_estado), tuple(filtro_area), tuple(filtro_supervisor), tamano_pagina)))
+        pagina = col_p2.number_input(
+            f"Página (de {n_paginas})", min_value=1, max_value=n_paginas, value=1, step=1,
+            key=f"pagina_exclusion_{firma_filtros}"
+        )
+        inicio = (int(pagina) - 1) * tamano_pagina
+        df_pagina = df_filtrado.iloc[inicio:inicio + tamano_pagina]
+        
+        if len(df_filtrado) != len(df_estado):
+            st.caption(f"Mostrando {min(inicio + 1, len(df_filtrado))}–{inicio + len(df_pagina)} de {len(df_filtrado)} colaboradores filtrados ({len(df_estado)} en total).")
+        else:
+            st.caption(f"Mostrando {min(inicio + 1, len(df_filtrado))}–{inicio + len(df_pagina)} de {len(df_estado)} colaboradores.")
+        
+        # Tabla editable con data_editor (solo la página actual)
+        df_tabla = df_pagina[['RUT', 'Nombre', 'Área', 'Supervisor', 'Estado', 'Detalle']].copy()
         df_tabla.insert(0, 'Excluir', df_tabla['RUT'].isin(st.session_state.ruts_excluidos))
         
         df_editada = st.data_editor(
@@ -951,11 +807,13 @@ if st.session_state.etapa == 'descarga':
                 'Estado': st.column_config.TextColumn('Estado', disabled=True, width="small"),
                 'Detalle': st.column_config.TextColumn('Detalle', disabled=True),
             },
-            key='editor_exclusion'
+            key=f"editor_exclusion_{firma_filtros}_{int(pagina)}_{st.session_state.version_exclusion}"
         )
         
-        # Actualizar exclusiones desde el editor
-        ruts_excluidos_manual = set(df_editada[df_editada['Excluir']]['RUT'].tolist())
+        # Actualizar exclusiones desde el editor: solo se tocan los RUTs de la página visible
+        ruts_pagina = set(df_tabla['RUT'].tolist())
+        ruts_marcados_pagina = set(df_editada[df_editada['Excluir']]['RUT'].tolist())
+        ruts_excluidos_manual = (st.session_state.ruts_excluidos - ruts_pagina) | ruts_marcados_pagina
         st.session_state.ruts_excluidos = ruts_excluidos_manual
         
         # El set final = exclusiones del editor ∪ omisiones del panel de problemas
@@ -967,8 +825,8 @@ if st.session_state.etapa == 'descarga':
         if ruts_excluidos_final:
             st.info(f"🗑️ Se excluirán **{len(ruts_excluidos_final)}** colaboradores del archivo final. Quedarán **{len(df_output) - len(ruts_excluidos_final)}** filas.")
         
-        # Filtrar el df_output real
-        df_output_final = df_output[~df_output['RUT'].isin(ruts_excluidos_final)].copy().reset_index(drop=True)
+        # Filas que van al archivo final (se escribe directo desde df_output, sin copia filtrada)
+        incluir = ~df_output['RUT'].isin(ruts_excluidos_final)
         
         st.divider()
         
@@ -977,117 +835,162 @@ if st.session_state.etapa == 'descarga':
         
         # Mostrar solo las primeras columnas y algunas fechas
         cols_preview = ['Nombre del Colaborador', 'RUT']
-        fecha_cols = [c for c in header_buk if c not in ['Nombre del Colaborador', 'RUT', 'Área', 'Supervisor'] and c is not None and not pd.isna(c)]
-        cols_preview.extend(fecha_cols[:10])
-        cols_existentes = [c for c in cols_preview if c in df_output_final.columns]
-        st.dataframe(df_output_final[cols_existentes].head(15), use_container_width=True)
+        cols_preview.extend(esquema.columnas_no_fijas[:10])
+        cols_existentes = [c for c in cols_preview if c in df_output.columns]
+        st.dataframe(df_output.loc[incluir[incluir].index[:15], cols_existentes].reset_index(drop=True), use_container_width=True)
         
         # ── Alertas ──
-        if ultima_col_buk:
-            st.info(f"📌 Último día del importador (**{ultima_col_buk}**) → **D** (Descanso) para todos. Los días sin turno asignado → **L** (Libre).")
+        ultimos_dias = [p.esquema.ultima_columna for p in plantillas if p.esquema.ultima_columna]
+        if len(ultimos_dias) == 1:
+            st.info(f"📌 Último día del importador (**{ultimos_dias[0]}**) → **D** (Descanso) para todos. Los días sin turno asignado → **L** (Libre).")
+        elif ultimos_dias:
+            st.info(f"📌 Último día de cada importador ({', '.join(f'**{d}**' for d in ultimos_dias)}) → **D** (Descanso) para todos. Los días sin turno asignado → **L** (Libre).")
         
         nombres_sin_match = set(df_all['Nombre_Input'].unique()) - set(mapa_nombres.keys())
         if nombres_sin_match:
             st.warning(f"⚠️ {len(nombres_sin_match)} nombres omitidos (sin match BUK): {', '.join(nombres_sin_match)}")
         
         # ── Estadísticas ──
-        total_celdas = len(df_con_match)
-        celdas_ok = df_con_match['Sigla'].notna().sum()
-        celdas_revisar = df_con_match['Sigla'].astype(str).str.startswith('REVISAR').sum()
-        
+        resumen = grilla['resumen_turnos']
         col_s1, col_s2, col_s3 = st.columns(3)
-        col_s1.metric("Total turnos procesados", total_celdas)
-        col_s2.metric("Codificados OK", int(celdas_ok - celdas_revisar))
-        col_s3.metric("Por revisar", int(celdas_revisar))
+        col_s1.metric("Total turnos procesados", resumen['celdas'])
+        col_s2.metric("Codificados OK", resumen['codificadas'])
+        col_s3.metric("Por revisar", resumen['revisar'])
         
         # ── Generar archivo de salida ──
-        # Escribir como .xls
-        output = io.BytesIO()
-        try:
-            # Intentar con xlwt (formato .xls nativo)
-            import xlwt
-            wb = xlwt.Workbook()
-            
-            # ── Hoja 1: turnosColaboradores (con datos modificados) ──
-            ws1 = wb.add_sheet('turnosColaboradores')
-            for j, col_name in enumerate(header_buk):
-                ws1.write(0, j, col_name if col_name is not None else '')
-            
-            for i, (_, row) in enumerate(df_output_final.iterrows()):
-                for j, col_name in enumerate(header_buk):
-                    val = row.get(col_name, '')
-                    if pd.isna(val):
-                        val = ''
-                    ws1.write(i + 1, j, str(val) if val != '' else '')
-            
-            # ── Hoja 2: turnosSemanales (copiar tal cual del original) ──
-            # Re-leer el BUK original
-            archivo_buk_bytes = st.session_state.buk_bytes
-            buk_io = io.BytesIO(archivo_buk_bytes)
-            buk_engine = 'xlrd' if st.session_state.get('buk_is_xls', False) else 'openpyxl'
-            xls_buk_re = pd.ExcelFile(buk_io, engine=buk_engine)
-            
-            hojas_copiar = ['turnosSemanales', 'turnosFlexibles', 'turnosTransitorios']
-            for nombre_hoja in hojas_copiar:
-                try:
-                    df_hoja = pd.read_excel(xls_buk_re, sheet_name=nombre_hoja, header=None)
-                    ws = wb.add_sheet(nombre_hoja)
-                    for i in range(len(df_hoja)):
-                        for j in range(len(df_hoja.columns)):
-                            val = df_hoja.iloc[i, j]
-                            if pd.isna(val):
-                                ws.write(i, j, '')
-                            else:
-                                ws.write(i, j, str(val))
-                except Exception as e_h:
-                    st.warning(f"No se pudo copiar la hoja '{nombre_hoja}': {e_h}")
-            
-            wb.save(output)
-            formato_salida = "xls"
-            
-        except ImportError:
-            # Fallback: usar openpyxl para xlsx
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df_output_final.to_excel(writer, index=False, sheet_name='turnosColaboradores')
-                
-                # Copiar otras hojas
-                archivo_buk_bytes = st.session_state.buk_bytes
-                buk_io = io.BytesIO(archivo_buk_bytes)
-                buk_engine = 'xlrd' if st.session_state.get('buk_is_xls', False) else 'openpyxl'
-                xls_buk_re = pd.ExcelFile(buk_io, engine=buk_engine)
-                
-                for nombre_hoja in ['turnosSemanales', 'turnosFlexibles', 'turnosTransitorios']:
-                    try:
-                        df_hoja = pd.read_excel(xls_buk_re, sheet_name=nombre_hoja, header=None)
-                        df_hoja.to_excel(writer, index=False, header=False, sheet_name=nombre_hoja)
-                    except:
-                        pass
-            
-            formato_salida = "xlsx"
+        # Plantilla CSV → .csv. Plantilla Excel → .xls, o .xlsx si se elige o si .xls no alcanza
+        formato_pedido = 'auto'
+        if any(p.csv is None for p in plantillas):
+            formato_pedido = st.radio(
+                "Formato de salida", FORMATOS_EXCEL, horizontal=True, key="formato_salida",
+                format_func={'auto': 'Automático', 'xls': '.xls', 'xlsx': '.xlsx'}.get,
+                help=f".xls admite hasta {LIMITE_FILAS_XLS:,} filas y {LIMITE_COLUMNAS_XLS} columnas por hoja; "
+                     "Automático cambia a .xlsx cuando se superan.",
+            )
+            for p in plantillas:
+                # Las filas de cada importador son las de su nómina (recortar_grilla no agrega ni quita)
+                n_filas_p = int((~p.df_data['RUT'].isin(ruts_excluidos_final)).sum())
+                motivo_xlsx = excede_limites_xls(p, n_filas_p) if p.csv is None else None
+                if motivo_xlsx and formato_pedido == 'auto':
+                    st.caption(f"ℹ️ Se exporta como .xlsx{f' ({p.nombre})' if len(plantillas) > 1 else ''}: {motivo_xlsx}.")
+        
+        # División opcional en varios importadores (BUK rechaza cargas muy grandes), empaquetados en un zip
+        division = st.selectbox(
+            "Dividir en varios archivos", [None, 'area', 'supervisor', 'filas'], key="division_salida",
+            format_func={None: 'No (un solo archivo)', 'area': 'Por Área', 'supervisor': 'Por Supervisor',
+                         'filas': 'Por cantidad de filas'}.get,
+        )
+        max_filas = None
+        if division == 'filas':
+            max_filas = int(st.number_input("Filas por archivo", min_value=1, value=1000, step=100, key="max_filas_salida"))
+        
+        def exportar():
+            # Con un importador se escribe df_output tal cual; con varios, cada uno
+            # se recorta de la grilla compartida (sus RUT, sus fechas y su último día).
+            if len(plantillas) == 1:
+                grillas = [(plantilla, df_output, incluir)]
+            else:
+                grillas = []
+                for p in plantillas:
+                    df_p = recortar_grilla(df_output, esquema, p)
+                    grillas.append((p, df_p, ~df_p['RUT'].isin(ruts_excluidos_final)))
+            registro = RegistroMetricas('app')
+            salidas = []    # (nombre del importador, bytes, extensión)
+            n_archivos = 0
+            with registro.etapa('exportacion'):
+                for p, df_p, incluir_p in grillas:
+                    if division is None:
+                        datos_p, ext_p = generar_importador(p, df_p, incluir_p, formato_pedido)
+                        n_archivos += 1
+                    else:
+                        datos_p, n_p = generar_zip(p, df_p, incluir_p, division, formato_pedido, max_filas)
+                        ext_p = 'zip'
+                        n_archivos += n_p
+                    salidas.append((p.nombre, datos_p, ext_p))
+            return {'salidas': salidas, 'archivos': n_archivos, 'duraciones': registro.datos['duraciones']}
+        
+        # Los archivos se escriben a pedido y se reutilizan mientras no cambien la
+        # grilla, las exclusiones ni las opciones de salida
+        firma_salida = (firma_resuelta, frozenset(ruts_excluidos_final), formato_pedido, division, max_filas)
+        exportacion = calculo_guardado('archivos_descarga', firma_salida)
+        if exportacion is not None and division is not None:
+            n_zips = len(exportacion['salidas'])
+            st.caption(f"📦 {exportacion['archivos']} importadores en {'el zip' if n_zips == 1 else f'{n_zips} zips'}.")
+        for p in plantillas:
+            if p.csv is None:
+                for nombre_hoja, e_h in p.errores_hojas.items():
+                    st.warning(f"No se pudo copiar la hoja '{nombre_hoja}' de {p.nombre}: {e_h}")
         
         # ── Botones de descarga ──
         st.divider()
         col_d1, col_d2 = st.columns(2)
         
-        col_d1.download_button(
-            label=f"📥 Descargar Importador BUK (.{formato_salida})",
-            data=output.getvalue(),
-            file_name=f"Importador_BUK_Cargado.{formato_salida}",
-            mime="application/vnd.ms-excel",
-            type="primary"
-        )
+        if exportacion is None:
+            if col_d1.button("📦 Generar archivos", type="primary"):
+                try:
+                    calculo_sesion('archivos_descarga', firma_salida, exportar)
+                except ValueError as e_f:
+                    st.error(f"⛔ {e_f}")
+                    st.stop()
+                st.rerun()
+        else:
+            salidas = exportacion['salidas']
+            if len(salidas) == 1:
+                _, datos_salida, formato_salida = salidas[0]
+                nombre_salida = f"Importador_BUK_Cargado.{formato_salida}"
+            else:
+                datos_salida = empaquetar([(f"{os.path.splitext(n)[0]}_Cargado", d, ext) for n, d, ext in salidas])
+                formato_salida = 'zip'
+                nombre_salida = "Importadores_BUK_Cargados.zip"
+            
+            # El registro de métricas se emite al descargar (una vez por corrida): ahí termina la corrida
+            metricas.absorber({'duraciones': exportacion['duraciones']})
+            estrategias = dict(st.session_state.get('estrategias_nombres') or {})
+            estrategias.update({n: 'manual' for n in mapa_nombres if n not in estrategias})
+            metricas.matching(estrategias, nombres_sin_match)
+            metricas.registrar(
+                tolerancia=tolerancia, formato=formato_salida, division=division, problemas=len(problemas),
+                plantillas=len(plantillas), archivos=exportacion['archivos'],
+                colaboradores=int(incluir.sum()), colaboradores_omitidos=len(ruts_excluidos_final),
+                turnos={**resumen, 'aproximadas': int(df_aprox['Celdas'].sum())},
+            )
+            
+            col_d1.download_button(
+                label=(f"📥 Descargar Importador BUK (.{formato_salida})" if len(salidas) == 1
+                       else f"📥 Descargar los {len(salidas)} importadores (.zip)"),
+                data=datos_salida,
+                file_name=nombre_salida,
+                mime=MIME_SALIDA[formato_salida],
+                on_click=emitir_metricas, args=(metricas, firma_corrida),
+                type="primary"
+            )
         
         if col_d2.button("🔄 Comenzar de nuevo"):
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
+        
+        # ── Descarga individual de cada importador ──
+        if exportacion is not None and len(exportacion['salidas']) > 1:
+            with st.expander("📄 Descargar cada importador por separado"):
+                for k, (nombre_p, datos_p, ext_p) in enumerate(exportacion['salidas']):
+                    st.download_button(
+                        label=f"📥 {nombre_p} (.{ext_p})",
+                        data=datos_p,
+                        file_name=f"{os.path.splitext(nombre_p)[0]}_Cargado.{ext_p}",
+                        mime=MIME_SALIDA[ext_p],
+                        on_click=emitir_metricas, args=(metricas, firma_corrida),
+                        key=f"descarga_importador_{k}",
+                    )
     
     except Exception as e:
         st.error(f"Error en generación: {e}")
-        import traceback
         st.code(traceback.format_exc())
         
         if st.button("🔄 Reiniciar"):
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
+
+# ── Tiempo de este rerun (no se llega aquí en las fases que terminan con st.stop) ──
+st.sidebar.caption(f"⏱️ Rerun: {(time.perf_counter() - INICIO_RERUN) * 1000:.0f} ms")
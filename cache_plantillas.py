@@ -0,0 +1,120 @@
+"""
+Caché compartida entre sesiones para importadores BUK ya parseados.
+
+Todas las sesiones del proceso suben casi siempre el mismo importador
+mensual; en vez de que cada una guarde su copia en `session_state`, la
+plantilla parseada se guarda una sola vez aquí, indexada por el hash de
+su contenido, con desalojo LRU acotado por memoria.
+"""
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def hash_contenido(datos):
+    """SHA-256 hexadecimal de un bloque de bytes."""
+    return hashlib.sha256(datos).hexdigest()
+
+
+def estimar_tamano(valor):
+    """Estimación en bytes de lo que ocupa un valor cacheado (DataFrames, listas, dicts)."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True, index=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True, index=True))
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(estimar_tamano(k) + estimar_tamano(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple, set)):
+        return sys.getsizeof(valor) + sum(estimar_tamano(v) for v in valor)
+    if hasattr(valor, '__dict__'):
+        return sum(estimar_tamano(v) for v in vars(valor).values())
+    return sys.getsizeof(valor)
+
+
+class CachePlantillas:
+    """
+    Caché LRU thread-safe acotada por bytes estimados.
+
+    Siempre conserva al menos la última entrada insertada, aunque por sí
+    sola supere el límite, para no dejar sin plantilla a la sesión que la pidió.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()  # clave → (valor, tamaño)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._cargando = {}  # clave → Lock, evita parsear dos veces la misma plantilla
+        self.hits = 0
+        self.misses = 0
+        self.desalojos = 0
+
+    def obtener(self, clave):
+        """Retorna el valor cacheado (y lo marca como reciente) o None."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor):
+        """Inserta o reemplaza una entrada y desaloja las menos usadas si se excede el límite."""
+        tamano = estimar_tamano(valor)
+        with self._lock:
+            if clave in self._entradas:
+                self._bytes -= self._entradas.pop(clave)[1]
+            self._entradas[clave] = (valor, tamano)
+            self._bytes += tamano
+            while self._bytes > self.max_bytes and len(self._entradas) > 1:
+                _, (_, tam_viejo) = self._entradas.popitem(last=False)
+                self._bytes -= tam_viejo
+                self.desalojos += 1
+
+    def obtener_o_cargar(self, clave, cargar):
+        """
+        Retorna la entrada `clave`; si no existe la construye con `cargar()`.
+        Sesiones concurrentes que piden la misma clave esperan a una sola carga.
+        Si `cargar()` falla, el error sube a quien cargaba y las que esperaban
+        lo reintentan; la clave no queda marcada como en carga.
+        """
+        valor = self.obtener(clave)
+        if valor is not None:
+            return valor
+        with self._lock:
+            lock_clave = self._cargando.setdefault(clave, threading.Lock())
+        try:
+            with lock_clave:
+                with self._lock:
+                    entrada = self._entradas.get(clave)
+                    if entrada is not None:
+                        self._entradas.move_to_end(clave)
+                        return entrada[0]
+                valor = cargar()
+                self.guardar(clave, valor)
+        finally:
+            with self._lock:
+                if self._cargando.get(clave) is lock_clave:
+                    del self._cargando[clave]
+        return valor
+
+    def estadisticas(self):
+        """Contadores de uso para mostrar en la interfaz."""
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'desalojos': self.desalojos,
+            }
+
+
+CACHE_PLANTILLAS = CachePlantillas(int(os.environ.get('BUKIZADOR_CACHE_PLANTILLAS_MB', '512')) * 1024 * 1024)
@@ -0,0 +1,81 @@
+"""
+Uso del BUKizador sin interfaz.
+
+    python cli.py validar turnos_360.xlsx importador.xls [importador_2.xls ...] [--hojas Marzo Abril] [--json]
+
+`validar` es el ensayo rápido: parseo, matching de nombres y codificación de
+turnos distintos, sin llenar la grilla ni escribir el importador.
+"""
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+from pipeline import validar
+from indice_siglas import TOLERANCIA_SUGERIDA
+
+
+def _leer(ruta):
+    """(bytes, nombre) de un archivo local."""
+    with open(ruta, 'rb') as f:
+        return f.read(), os.path.basename(ruta)
+
+
+def comando_validar(args):
+    bytes_360, _ = _leer(args.turnos_360)
+    (buk_bytes, buk_nombre), *adicionales = [_leer(ruta) for ruta in args.importador]
+    catalogo = _leer(args.catalogo) if args.catalogo else None
+    hojas = args.hojas or pd.ExcelFile(args.turnos_360).sheet_names
+
+    res = validar(bytes_360, buk_bytes, buk_nombre, hojas, catalogo=catalogo, tolerancia=args.tolerancia,
+                   adicionales=adicionales)
+
+    if args.json:
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+    else:
+        print(f"Hojas: {', '.join(res['hojas'])} ({res['registros']} registros, {res['segundos']:.2f} s)")
+        print(f"Nombres con match: {res['nombres_con_match']}/{res['nombres']}")
+        print(f"Celdas codificadas: {res['celdas_codificadas']} · REVISAR: {res['celdas_revisar']}")
+        if res['nombres_sin_match']:
+            print(f"\nNombres sin match ({len(res['nombres_sin_match'])}):")
+            for nombre in res['nombres_sin_match']:
+                print(f"  - {nombre}")
+        if res['turnos_aproximados']:
+            print(f"\nCodificados por tolerancia (±{res['tolerancia']} min, {res['celdas_aproximadas']} celdas):")
+            for a in res['turnos_aproximados']:
+                print(f"  - {a['Turno']!r} ({a['Rol']}) → {a['Sigla']}, desvío {a['Desvío (min)']} min: {a['Celdas']} celdas")
+        if res['turnos_desconocidos']:
+            print(f"\nTurnos desconocidos ({len(res['turnos_desconocidos'])}):")
+            for texto, n in res['turnos_desconocidos'].items():
+                print(f"  - {texto!r}: {n} celdas")
+
+    # Código de salida 1 si hay algo que corregir antes del flujo completo
+    return 1 if res['nombres_sin_match'] or res['celdas_revisar'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bukizador', description="BUKizador sin interfaz.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_val = sub.add_parser('validar', help="Ensayo rápido: nombres sin match y turnos desconocidos.")
+    p_val.add_argument('turnos_360', help="Excel de turnos formato 360 (.xlsx)")
+    p_val.add_argument('importador', nargs='+', help="Importador(es) BUK (.xls, .xlsx o .csv); varios se validan juntos")
+    p_val.add_argument('--catalogo', help="Catálogo de turnos (turnosSemanales) si el importador es CSV")
+    p_val.add_argument('--hojas', nargs='+', help="Hojas del 360 a procesar (por defecto, todas)")
+    p_val.add_argument('--tolerancia', type=int, default=TOLERANCIA_SUGERIDA,
+                       help=f"Minutos de tolerancia para horarios sin sigla exacta (por defecto {TOLERANCIA_SUGERIDA}; 0 = solo exactos)")
+    p_val.add_argument('--json', action='store_true', help="Salida en JSON")
+    p_val.set_defaults(funcion=comando_validar)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.funcion(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Escritura del importador BUK cargado.
+
+Los escritores reciben `df_output` completo más la máscara de filas a
+incluir y recorren las filas una sola vez, convirtiendo cada celda al
+vuelo: no se arma una copia filtrada ni una versión en texto del grid.
+"""
+import csv
+import io
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from openpyxl import Workbook
+
+try:
+    import xlwt
+except ImportError:  # xlwt es opcional: sin él se exporta .xlsx
+    xlwt = None
+
+# Límites del formato .xls (BIFF8) por hoja
+LIMITE_FILAS_XLS = 65536
+LIMITE_COLUMNAS_XLS = 256
+
+FORMATOS_EXCEL = ('auto', 'xls', 'xlsx')
+
+# Caracteres no aptos para nombres de archivo dentro del zip
+RE_NO_ARCHIVO = re.compile(r'[^\w\-]+')
+
+# División del importador en varios archivos (para cargas que BUK no acepta de una vez)
+MODOS_PARTICION = {'area': 'Área', 'supervisor': 'Supervisor', 'filas': None}
+HILOS_EXPORTACION = 4
+
+
+def _texto_celda(val):
+    """Valor de celda como texto de salida (vacío para nulos)."""
+    if val is None or (not isinstance(val, str) and pd.isna(val)):
+        return ''
+    return str(val)
+
+
+def filas_salida(df_output, incluir):
+    """Genera cada fila incluida como lista de textos, en el orden de columnas del header."""
+    incluir = np.asarray(incluir, dtype=bool)
+    for fila, va in zip(df_output.itertuples(index=False, name=None), incluir):
+        if va:
+            yield [_texto_celda(v) for v in fila]
+
+
+def escribir_xls(plantilla, df_output, incluir):
+    """turnosColaboradores + hojas copiadas de la plantilla como .xls (xlwt)."""
+    output = io.BytesIO()
+    wb = xlwt.Workbook()
+    
+    # ── Hoja 1: turnosColaboradores (con datos modificados) ──
+    ws1 = wb.add_sheet('turnosColaboradores')
+    for j, col_name in enumerate(plantilla.header):
+        ws1.write(0, j, col_name if col_name is not None else '')
+    for i, fila in enumerate(filas_salida(df_output, incluir)):
+        for j, val in enumerate(fila):
+            ws1.write(i + 1, j, val)
+    
+    # ── Hojas copiadas tal cual del original (turnosSemanales, ...) ──
+    for nombre_hoja, df_hoja in plantilla.hojas_copiar.items():
+        ws = wb.add_sheet(nombre_hoja)
+        for i, fila in enumerate(df_hoja.itertuples(index=False, name=None)):
+            for j, val in enumerate(fila):
+                ws.write(i, j, _texto_celda(val))
+    
+    wb.save(output)
+    return output.getvalue()
+
+
+def escribir_xlsx(plantilla, df_output, incluir):
+    """
+    turnosColaboradores + hojas copiadas como .xlsx con un workbook write-only:
+    las filas se vuelcan a disco a medida que se agregan, sin armar el libro en memoria.
+    """
+    output = io.BytesIO()
+    wb = Workbook(write_only=True)
+    
+    # ── Hoja 1: turnosColaboradores (con datos modificados) ──
+    ws1 = wb.create_sheet('turnosColaboradores')
+    ws1.append([col_name if col_name is not None else '' for col_name in plantilla.header])
+    for fila in filas_salida(df_output, incluir):
+        ws1.append(fila)
+    
+    # ── Hojas copiadas tal cual del original (turnosSemanales, ...) ──
+    for nombre_hoja, df_hoja in plantilla.hojas_copiar.items():
+        ws = wb.create_sheet(nombre_hoja)
+        for fila in df_hoja.itertuples(index=False, name=None):
+            ws.append([_texto_celda(val) for val in fila])
+    
+    wb.save(output)
+    return output.getvalue()
+
+
+def excede_limites_xls(plantilla, n_filas):
+    """Motivo por el que el resultado no cabe en .xls (None si cabe)."""
+    hojas = {'turnosColaboradores': (n_filas + 1, len(plantilla.header))}
+    hojas.update({nombre: df.shape for nombre, df in plantilla.hojas_copiar.items()})
+    for nombre, (filas, columnas) in hojas.items():
+        if filas > LIMITE_FILAS_XLS:
+            return f"'{nombre}' tiene {filas:,} filas (.xls admite {LIMITE_FILAS_XLS:,})"
+        if columnas > LIMITE_COLUMNAS_XLS:
+            return f"'{nombre}' tiene {columnas} columnas (.xls admite {LIMITE_COLUMNAS_XLS})"
+    return None
+
+
+def formato_excel(plantilla, n_filas, formato='auto'):
+    """
+    Resuelve el formato Excel de salida. 'auto' usa .xls salvo que falte xlwt
+    o el resultado supere sus límites. Pedir .xls explícito cuando no es
+    posible es un ValueError.
+    """
+    if formato not in FORMATOS_EXCEL:
+        raise ValueError(f"Formato de salida desconocido: {formato}")
+    if formato == 'xlsx':
+        return 'xlsx'
+    motivo = excede_limites_xls(plantilla, n_filas)
+    if formato == 'xls':
+        if xlwt is None:
+            raise ValueError("No se puede exportar .xls: falta el paquete xlwt.")
+        if motivo:
+            raise ValueError(f"No se puede exportar .xls: {motivo}. Usa .xlsx.")
+        return 'xls'
+    return 'xls' if xlwt is not None and motivo is None else 'xlsx'
+
+
+def escribir_csv(plantilla, df_output, incluir):
+    """
+    turnosColaboradores como CSV con el mismo separador, codificación y filas
+    de metadatos previas al header que traía la plantilla.
+    """
+    formato = plantilla.csv
+    output = io.BytesIO()
+    texto = io.TextIOWrapper(output, encoding=formato['encoding'], newline='')
+    writer = csv.writer(texto, delimiter=formato['delimitador'], lineterminator=formato['fin_linea'])
+    writer.writerows(formato['preambulo'])
+    writer.writerow([_texto_celda(c) for c in plantilla.header])
+    for fila in filas_salida(df_output, incluir):
+        writer.writerow(fila)
+    texto.flush()
+    datos = output.getvalue()
+    texto.detach()
+    return datos
+
+
+def generar_importador(plantilla, df_output, incluir, formato='auto'):
+    """
+    Archivo final en el formato que corresponde a la plantilla: CSV para
+    plantillas CSV; para Excel, `formato` ('auto', 'xls' o 'xlsx').
+    Retorna (bytes, extensión).
+    """
+    if plantilla.csv is not None:
+        return escribir_csv(plantilla, df_output, incluir), 'csv'
+    ext = formato_excel(plantilla, int(np.count_nonzero(incluir)), formato)
+    if ext == 'xls':
+        return escribir_xls(plantilla, df_output, incluir), 'xls'
+    return escribir_xlsx(plantilla, df_output, incluir), 'xlsx'
+
+
+def _nombre_archivo(texto):
+    """Texto apto para nombre de archivo dentro del zip."""
+    return RE_NO_ARCHIVO.sub('_', str(texto)).strip('_') or 'sin_nombre'
+
+
+def _nombre_unico(base, usados):
+    """`base`, o `base_2`, `base_3`... si ya está en `usados` (sin distinguir mayúsculas)."""
+    nombre, n = base, 1
+    while nombre.lower() in usados:
+        n += 1
+        nombre = f"{base}_{n}"
+    usados.add(nombre.lower())
+    return nombre
+
+
+def particiones(df_output, incluir, modo, max_filas=None):
+    """
+    Divide las filas incluidas por Área, por Supervisor o en bloques de
+    `max_filas`. Retorna lista de (etiqueta, máscara) en orden de aparición.
+    """
+    if modo not in MODOS_PARTICION:
+        raise ValueError(f"Modo de división desconocido: {modo}")
+    incluir = np.asarray(incluir, dtype=bool)
+    
+    if modo == 'filas':
+        if not max_filas or max_filas < 1:
+            raise ValueError("Indica cuántas filas por archivo.")
+        posiciones = np.flatnonzero(incluir)
+        partes = []
+        for n, inicio in enumerate(range(0, len(posiciones), max_filas), start=1):
+            mascara = np.zeros(len(incluir), dtype=bool)
+            mascara[posiciones[inicio:inicio + max_filas]] = True
+            partes.append((f"parte_{n:03d}", mascara))
+        return partes
+    
+    columna = MODOS_PARTICION[modo]
+    if columna not in df_output.columns:
+        raise ValueError(f"La plantilla no tiene la columna '{columna}' para dividir el archivo.")
+    grupos = df_output[columna].astype(object).where(df_output[columna].notna(), f"Sin {columna}")
+    valores = grupos.astype(str).str.strip().to_numpy()
+    return [
+        (grupo, incluir & (valores == grupo))
+        for grupo in pd.unique(valores[incluir])
+    ]
+
+
+def generar_zip(plantilla, df_output, incluir, modo, formato='auto', max_filas=None):
+    """
+    Un importador por partición, generados en paralelo sobre el mismo
+    `df_output` (cada uno con su máscara), empaquetados en un zip.
+    Retorna (bytes del zip, cantidad de archivos).
+    """
+    partes = particiones(df_output, incluir, modo, max_filas)
+    if not partes:
+        raise ValueError("No hay filas para exportar.")
+    
+    with ThreadPoolExecutor(max_workers=min(HILOS_EXPORTACION, len(partes))) as pool:
+        futuros = [
+            (etiqueta, pool.submit(generar_importador, plantilla, df_output, mascara, formato))
+            for etiqueta, mascara in partes
+        ]
+        
+        output = io.BytesIO()
+        usados = set()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for etiqueta, futuro in futuros:
+                datos, ext = futuro.result()
+                # 'Ventas' y 'Ventas.' quedan con el mismo nombre
+                nombre = _nombre_unico(f"Importador_BUK_{_nombre_archivo(etiqueta)}", usados)
+                zf.writestr(f"{nombre}.{ext}", datos)
+    return output.getvalue(), len(partes)
+
+
+def empaquetar(archivos):
+    """
+    Zip con varios archivos ya generados: lista de (nombre sin extensión,
+    bytes, extensión), p. ej. un importador por plantilla.
+    """
+    output = io.BytesIO()
+    usados = set()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for base, datos, ext in archivos:
+            zf.writestr(f"{_nombre_unico(_nombre_archivo(base), usados)}.{ext}", datos)
+    return output.getvalue()
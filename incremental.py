@@ -0,0 +1,185 @@
+"""
+Re-procesamiento incremental cuando llega una versión corregida del 360.
+
+- `hashes_por_hoja` calcula un hash de contenido por hoja leyendo el xlsx
+  como zip (sin decodificarlo con pandas), para que solo se re-parseen las
+  hojas que cambiaron.
+- `diferencias_turnos` compara fila a fila los turnos de la ejecución
+  anterior con los nuevos.
+- `heredar_ejecucion` decide qué nombres, resoluciones y siglas de la
+  ejecución anterior siguen siendo válidas.
+"""
+import hashlib
+import io
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+NS_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+RE_CELDA_STRING = re.compile(rb'(<c\s[^>]*\bt="s"[^>]*>\s*<v>)(\d+)(</v>)')
+RE_ESTILO = re.compile(rb'(<c\s[^>]*?\bs=")(\d+)(")')
+
+CLAVE_CELDA = ['Nombre_Input', 'Fecha', 'Rol']
+
+
+def _textos_compartidos(zf):
+    """Lista de sharedStrings del libro (texto plano de cada <si>)."""
+    try:
+        raiz = ET.fromstring(zf.read('xl/sharedStrings.xml'))
+    except KeyError:
+        return []
+    return [''.join(t.text or '' for t in si.iter(f'{NS_MAIN}t')) for si in raiz.iter(f'{NS_MAIN}si')]
+
+
+def _formatos_estilo(zf):
+    """Formato numérico efectivo de cada índice de cellXfs (define si una celda es fecha)."""
+    try:
+        raiz = ET.fromstring(zf.read('xl/styles.xml'))
+    except KeyError:
+        return []
+    codigos = {nf.get('numFmtId'): nf.get('formatCode') for nf in raiz.iter(f'{NS_MAIN}numFmt')}
+    xfs = raiz.find(f'{NS_MAIN}cellXfs')
+    if xfs is None:
+        return []
+    return [f"{xf.get('numFmtId')}:{codigos.get(xf.get('numFmtId'), '')}" for xf in xfs.findall(f'{NS_MAIN}xf')]
+
+
+def _xml_sin_indices(xml, textos, formatos):
+    """
+    Reemplaza los índices a sharedStrings y a estilos por el texto y formato
+    que referencian, para que renumerarlos al guardar no cambie el hash.
+    """
+    def texto(m):
+        i = int(m.group(2))
+        return m.group(1) + (textos[i] if i < len(textos) else '').encode('utf-8') + m.group(3)
+    
+    def formato(m):
+        i = int(m.group(2))
+        return m.group(1) + (formatos[i] if i < len(formatos) else '').encode('utf-8') + m.group(3)
+    
+    return RE_ESTILO.sub(formato, RE_CELDA_STRING.sub(texto, xml))
+
+
+def hashes_por_hoja(bytes_xlsx):
+    """
+    {nombre_hoja: hash} calculado desde el XML de cada hoja, con los textos
+    compartidos y formatos que referencia sustituidos en su lugar. Editar una
+    hoja no cambia el hash de las demás. Retorna {} si el archivo no es un
+    xlsx legible.
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(bytes_xlsx)) as zf:
+            libro = ET.fromstring(zf.read('xl/workbook.xml'))
+            rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+            destinos = {r.get('Id'): r.get('Target') for r in rels.iter(f'{NS_PKG_REL}Relationship')}
+            textos = _textos_compartidos(zf)
+            formatos = _formatos_estilo(zf)
+            pr = libro.find(f'{NS_MAIN}workbookPr')
+            fecha1904 = (pr.get('date1904', '0') if pr is not None else '0').encode()
+            
+            hashes = {}
+            for hoja in libro.iter(f'{NS_MAIN}sheet'):
+                destino = destinos.get(hoja.get(f'{NS_REL}id'))
+                if destino is None:
+                    continue
+                ruta = destino.lstrip('/') if destino.startswith('/') else posixpath.normpath(posixpath.join('xl', destino))
+                h = hashlib.sha256(_xml_sin_indices(zf.read(ruta), textos, formatos))
+                h.update(b'\0' + fecha1904)
+                hashes[hoja.get('name')] = h.hexdigest()
+            return hashes
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, ValueError):
+        return {}
+
+
+def _texto_turno(serie):
+    """Turno_Raw comparable entre ejecuciones (los snapshots lo guardan como texto)."""
+    return serie.map(lambda v: None if pd.isna(v) else str(v).strip())
+
+
+def diferencias_turnos(df_prev, df_nuevo):
+    """
+    Diff por celda (Nombre_Input, Fecha, Rol) entre dos ejecuciones.
+    Retorna dict con conteos y un DataFrame `detalle` con columnas
+    [Nombre_Input, Fecha, Rol, Antes, Despues, Cambio].
+    """
+    prev = df_prev[CLAVE_CELDA].copy()
+    prev['Antes'] = _texto_turno(df_prev['Turno_Raw'])
+    nuevo = df_nuevo[CLAVE_CELDA].copy()
+    nuevo['Despues'] = _texto_turno(df_nuevo['Turno_Raw'])
+    
+    cruce = prev.merge(nuevo, on=CLAVE_CELDA, how='outer', indicator=True)
+    agregadas = cruce['_merge'] == 'right_only'
+    eliminadas = cruce['_merge'] == 'left_only'
+    ambas = cruce['_merge'] == 'both'
+    modificadas = ambas & (cruce['Antes'].fillna('\0') != cruce['Despues'].fillna('\0'))
+    
+    cruce['Cambio'] = None
+    cruce.loc[agregadas, 'Cambio'] = 'agregada'
+    cruce.loc[eliminadas, 'Cambio'] = 'eliminada'
+    cruce.loc[modificadas, 'Cambio'] = 'modificada'
+    detalle = cruce[cruce['Cambio'].notna()].drop(columns=['_merge']).reset_index(drop=True)
+    
+    return {
+        'agregadas': int(agregadas.sum()),
+        'eliminadas': int(eliminadas.sum()),
+        'modificadas': int(modificadas.sum()),
+        'sin_cambios': int(ambas.sum() - modificadas.sum()),
+        'detalle': detalle,
+    }
+
+
+def heredar_ejecucion(previa, df_all, nombres_input, plantilla, hashes_hojas):
+    """
+    Separa lo que se puede reutilizar de la ejecución anterior.
+    `hashes_hojas` son los hashes por hoja de la ejecución actual.
+    `previa['pendientes']` son los nombres que la ejecución anterior aún no
+    había corregido a mano (revisión pedida antes de confirmar correcciones):
+    vuelven a matching en vez de darse por omitidos.
+
+    Retorna (mapa_heredado, nombres_nuevos, resoluciones, reporte):
+      - mapa_heredado: {nombre_input: nombre_buk} de nombres ya vistos (incluye
+        correcciones manuales) cuyo destino sigue existiendo en la plantilla
+      - nombres_nuevos: nombres que deben pasar por matching
+      - resoluciones: resoluciones de problemas cuyas celdas no cambiaron
+      - reporte: dict para mostrar al analista
+    """
+    mapa_prev = previa.get('mapa_nombres', {})
+    nombres_prev = set(previa['df_all_turnos']['Nombre_Input'].unique())
+    nombres_plantilla = set(plantilla.nombres)
+    
+    mapa_heredado = {n: mapa_prev[n] for n in nombres_input if n in mapa_prev and mapa_prev[n] in nombres_plantilla}
+    # Un nombre ya visto sin entrada en el mapa fue omitido a propósito (no se vuelve a
+    # preguntar), salvo que siguiera pendiente de corrección cuando se pidió la revisión
+    sin_resolver = set(previa.get('pendientes', ()))
+    nombres_nuevos = [
+        n for n in nombres_input
+        if n not in nombres_prev or n in sin_resolver or (n in mapa_prev and n not in mapa_heredado)
+    ]
+    
+    diff = diferencias_turnos(previa['df_all_turnos'], df_all)
+    
+    # Celdas tocadas → claves rut__fecha cuyas resoluciones ya no aplican
+    mapa_total = {**mapa_prev, **mapa_heredado}
+    tocadas = diff['detalle'][['Nombre_Input', 'Fecha']].copy()
+    tocadas['RUT'] = tocadas['Nombre_Input'].map(mapa_total).map(plantilla.nombre_a_rut)
+    claves_tocadas = {f"{r}__{f}" for r, f in zip(tocadas['RUT'], tocadas['Fecha']) if pd.notna(r)}
+    resoluciones_prev = previa.get('resoluciones_problemas', {})
+    resoluciones = {k: v for k, v in resoluciones_prev.items() if k not in claves_tocadas}
+    
+    hashes_prev = previa.get('hashes_hojas', {})
+    reporte = {
+        'hojas_sin_cambios': [h for h, v in hashes_hojas.items() if hashes_prev.get(h) == v],
+        'hojas_cambiadas': [h for h, v in hashes_hojas.items() if hashes_prev.get(h) != v],
+        'nombres_heredados': len(mapa_heredado),
+        'nombres_nuevos': nombres_nuevos,
+        'resoluciones_conservadas': len(resoluciones),
+        'resoluciones_descartadas': len(resoluciones_prev) - len(resoluciones),
+        **diff,
+    }
+    return mapa_heredado, nombres_nuevos, resoluciones, reporte
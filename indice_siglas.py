@@ -0,0 +1,106 @@
+"""
+Índice de intervalos del catálogo de siglas para búsquedas con tolerancia.
+
+Cada horario del catálogo se guarda como (entrada, salida) en minutos desde
+medianoche; si la salida no es posterior a la entrada el turno cruza la
+medianoche y la salida suma 24 h. Las tablas van ordenadas por entrada, así
+que una consulta ubica con búsqueda binaria la ventana [entrada ± tolerancia]
+y solo compara los horarios que caen en ella.
+
+La distancia entre dos horarios es el mayor desvío en minutos entre sus
+entradas y sus salidas: "08:05 - 19:00" está a 5 min de 08:00-19:00.
+"""
+import numpy as np
+
+MINUTOS_DIA = 24 * 60
+
+# Tolerancia que ofrecen la app y la línea de comandos (codificar_turnos usa 0: solo exactos)
+TOLERANCIA_SUGERIDA = 10
+
+
+def _minutos(hhmm):
+    """'HH:MM' → minutos desde medianoche."""
+    h, m = hhmm.split(':')
+    return int(h) * 60 + int(m)
+
+
+def _intervalo(entrada, salida):
+    """(entrada, salida) en minutos; la salida de turnos nocturnos pasa al día siguiente."""
+    e, s = _minutos(entrada), _minutos(salida)
+    if s <= e:
+        s += MINUTOS_DIA
+    return e, s
+
+
+class IndiceSiglas:
+    """
+    Catálogo de siglas indexado por horario, por rol y para cualquier rol.
+    Se construye una vez por plantilla a partir de `mapa_siglas`
+    ((entrada, salida, rol) → sigla).
+    """
+
+    def __init__(self, mapa_siglas):
+        # Por rol y en conjunto (None); ante horarios repetidos gana el primero del catálogo
+        intervalos = {}
+        for (entrada, salida, rol), sigla in mapa_siglas.items():
+            try:
+                clave = _intervalo(entrada, salida)
+            except (ValueError, AttributeError):
+                continue
+            for grupo in (rol, None):
+                intervalos.setdefault(grupo, {}).setdefault(clave, sigla)
+        self._tablas = {grupo: self._tabla(ints) for grupo, ints in intervalos.items()}
+
+    @staticmethod
+    def _tabla(intervalos):
+        """Arrays ordenados por entrada. Cada horario también va desplazado ±24 h
+        para que 23:55 y 00:05 queden cerca."""
+        filas = [
+            (e + d, s + d, sigla)
+            for (e, s), sigla in intervalos.items()
+            for d in (-MINUTOS_DIA, 0, MINUTOS_DIA)
+        ]
+        filas.sort(key=lambda f: f[0])
+        entradas = np.array([f[0] for f in filas], dtype=np.int32)
+        salidas = np.array([f[1] for f in filas], dtype=np.int32)
+        return entradas, salidas, [f[2] for f in filas]
+
+    def __len__(self):
+        tabla = self._tablas.get(None)
+        return 0 if tabla is None else len(tabla[2]) // 3
+
+    def buscar(self, entrada, salida, rol, tolerancia):
+        """
+        Sigla del horario más cercano a (entrada, salida) dentro de `tolerancia`
+        minutos, prefiriendo las del rol. Retorna (sigla, desvío en minutos) o None.
+        """
+        if tolerancia <= 0:
+            return None
+        try:
+            e, s = _intervalo(entrada, salida)
+        except (ValueError, AttributeError):
+            return None
+        for grupo in (rol, None):
+            encontrado = self._cercano(self._tablas.get(grupo), e, s, tolerancia)
+            if encontrado is not None:
+                return encontrado
+        return None
+
+    @staticmethod
+    def _cercano(tabla, e, s, tolerancia):
+        if tabla is None:
+            return None
+        entradas, salidas, siglas = tabla
+        i0 = np.searchsorted(entradas, e - tolerancia, side='left')
+        i1 = np.searchsorted(entradas, e + tolerancia, side='right')
+        if i0 == i1:
+            return None
+        de = np.abs(entradas[i0:i1] - e)
+        ds = np.abs(salidas[i0:i1] - s)
+        distancia = np.maximum(de, ds)
+        candidatos = np.flatnonzero(distancia <= tolerancia)
+        if not len(candidatos):
+            return None
+        # Menor desvío máximo; a igualdad, menor desvío total
+        mejor = candidatos[np.lexsort((de[candidatos] + ds[candidatos], distancia[candidatos]))[0]]
+        return siglas[i0 + mejor], int(distancia[mejor])
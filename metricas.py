@@ -0,0 +1,170 @@
+"""
+Métricas de cada ejecución en formato legible por máquina.
+
+Cada corrida arma un `RegistroMetricas`: duración por etapa, filas por hoja,
+matching por estrategia, turnos distintos vs totales, celdas REVISAR y pico
+de memoria del proceso. Al terminar se agrega como una línea JSON a un
+archivo JSONL y, si está configurado, se reescribe un textfile de
+Prometheus (para el textfile collector de node_exporter) con la última
+corrida de cada modo. Escribir métricas nunca debe romper una corrida:
+los errores de disco se ignoran.
+"""
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: sin pico de memoria
+    resource = None
+
+from normalizacion import texto_serie
+
+ARCHIVO_JSONL = os.environ.get(
+    'BUKIZADOR_METRICAS_JSONL', os.path.join(tempfile.gettempdir(), 'bukizador_metricas.jsonl')
+)
+ARCHIVO_PROM = os.environ.get('BUKIZADOR_METRICAS_PROM')
+
+_lock_archivos = threading.Lock()
+
+
+def rss_pico_bytes():
+    """Pico de memoria residente del proceso (None si la plataforma no lo expone)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == 'darwin' else pico * 1024   # Linux lo reporta en KB
+
+
+def resumen_turnos(df_con_match):
+    """Calidad de los turnos codificados: celdas, textos distintos, codificadas y REVISAR."""
+    texto = texto_serie(df_con_match['Turno_Raw'])
+    sigla = df_con_match['Sigla']
+    revisar = sigla.astype(str).str.startswith('REVISAR:')
+    return {
+        'celdas': len(df_con_match),
+        'textos_distintos': int(texto.nunique()),
+        'pares_distintos': int((texto + '\x00' + df_con_match['Rol'].astype(str)).nunique()),
+        'codificadas': int((sigla.notna() & ~revisar).sum()),
+        'revisar': int(revisar.sum()),
+    }
+
+
+class RegistroMetricas:
+    """Métricas de una corrida (`modo`: 'app', 'bukizar', 'validar', ...)."""
+
+    def __init__(self, modo):
+        self.modo = modo
+        self.datos = {
+            'modo': modo,
+            'inicio': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'duraciones': {},
+            'hojas': {},
+            'matching': {},
+        }
+
+    @contextmanager
+    def etapa(self, nombre):
+        """Mide la duración de una etapa (se acumula si la etapa se repite)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duraciones = self.datos['duraciones']
+            duraciones[nombre] = round(duraciones.get(nombre, 0.0) + time.perf_counter() - inicio, 4)
+
+    def hoja(self, nombre, filas, snapshot):
+        """Filas parseadas de una hoja 360 y si salieron de un snapshot."""
+        self.datos['hojas'][nombre] = {'filas': int(filas), 'snapshot': bool(snapshot)}
+
+    def matching(self, estrategias, sin_match):
+        """Nombres resueltos por estrategia ({nombre: estrategia}) más los que quedaron sin match."""
+        conteo = {}
+        for estrategia in estrategias.values():
+            conteo[estrategia] = conteo.get(estrategia, 0) + 1
+        conteo['sin_match'] = len(sin_match)
+        self.datos['matching'] = conteo
+
+    def registrar(self, **valores):
+        self.datos.update(valores)
+
+    def absorber(self, datos):
+        """Incorpora las métricas de una fase anterior (p. ej. la carga, guardada en la sesión)."""
+        for clave, valor in datos.items():
+            if clave == 'modo':
+                continue
+            if isinstance(valor, dict) and isinstance(self.datos.get(clave), dict):
+                self.datos[clave] = {**valor, **self.datos[clave]}
+            else:
+                self.datos[clave] = valor    # 'inicio' de la carga = inicio real de la corrida
+
+    def cerrar(self):
+        """Completa totales y memoria; retorna el registro listo para emitir."""
+        self.datos['duracion_total'] = round(sum(self.datos['duraciones'].values()), 4)
+        self.datos['filas_360'] = sum(h['filas'] for h in self.datos['hojas'].values())
+        self.datos['rss_pico_bytes'] = rss_pico_bytes()
+        return self.datos
+
+    def emitir(self, archivo_jsonl=ARCHIVO_JSONL, archivo_prom=ARCHIVO_PROM):
+        """Agrega el registro al JSONL y, si corresponde, reescribe el textfile de Prometheus."""
+        registro = self.cerrar()
+        with _lock_archivos:
+            if archivo_jsonl:
+                try:
+                    with open(archivo_jsonl, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+                except OSError:
+                    pass
+            if archivo_prom:
+                _escribir_prometheus(archivo_prom, registro)
+        return registro
+
+
+def _escape(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _series_prometheus(registro):
+    """Series (gauges) de un registro, etiquetadas con su modo."""
+    modo = f'modo="{_escape(registro["modo"])}"'
+    series = [
+        *(f'bukizador_duracion_segundos{{{modo},etapa="{_escape(e)}"}} {d}' for e, d in registro['duraciones'].items()),
+        *(f'bukizador_filas_hoja{{{modo},hoja="{_escape(h)}"}} {v["filas"]}' for h, v in registro['hojas'].items()),
+        *(f'bukizador_nombres{{{modo},estrategia="{_escape(e)}"}} {n}' for e, n in registro['matching'].items()),
+        *(f'bukizador_turnos{{{modo},tipo="{_escape(t)}"}} {n}' for t, n in (registro.get('turnos') or {}).items()),
+    ]
+    if registro.get('rss_pico_bytes') is not None:
+        series.append(f'bukizador_rss_pico_bytes{{{modo}}} {registro["rss_pico_bytes"]}')
+    series.append(f'bukizador_ultima_ejecucion_timestamp{{{modo}}} {int(time.time())}')
+    return series
+
+
+def _escribir_prometheus(archivo, registro):
+    """
+    Reescribe el textfile conservando las series de los otros modos: cada
+    modo (app, bukizar, ...) deja las de su última corrida. Escritura atómica.
+    """
+    marca = f'modo="{_escape(registro["modo"])}"'
+    try:
+        with open(archivo, encoding='utf-8') as f:
+            previas = [l.rstrip('\n') for l in f if not l.startswith('#') and marca not in l and l.strip()]
+    except OSError:
+        previas = []
+    series = {}
+    for linea in previas + _series_prometheus(registro):
+        series.setdefault(linea.split('{', 1)[0], []).append(linea)
+    contenido = ''.join(
+        f'# TYPE {nombre} gauge\n' + ''.join(l + '\n' for l in lineas) for nombre, lineas in series.items()
+    )
+    try:
+        temporal = f"{archivo}.{os.getpid()}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(contenido)
+        os.replace(temporal, archivo)
+    except OSError:
+        pass
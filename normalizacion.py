@@ -0,0 +1,135 @@
+"""
+Normalización de nombres y textos de turno.
+
+Las funciones `*_serie` trabajan sobre columnas completas con `.str` y
+patrones precompilados; las escalares (`limpiar_texto`, `normalizar_hora`,
+`extraer_rango_horario`) mantienen la firma de siempre pero guardan su
+resultado en un memo acotado, así cada valor distinto se normaliza una vez.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+import pandas as pd
+
+TAMANO_MEMO = 65536
+
+RE_HHMM = re.compile(r'(\d{1,2}):(\d{2})')
+RE_SOLO_HORA = re.compile(r'^(\d{1,2})$')
+
+
+# ── Escalares (con memo) ──
+
+@lru_cache(maxsize=TAMANO_MEMO)
+def quitar_acentos(texto):
+    """'Vacación' → 'Vacacion'."""
+    return unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('utf-8')
+
+
+@lru_cache(maxsize=TAMANO_MEMO)
+def _limpiar_str(texto):
+    return quitar_acentos(texto.strip()).upper().strip()
+
+
+def limpiar_texto(texto):
+    """Normaliza texto: quita acentos, mayúsculas, espacios extra."""
+    if pd.isna(texto) or texto is None:
+        return ""
+    return _limpiar_str(str(texto))
+
+
+@lru_cache(maxsize=TAMANO_MEMO)
+def _normalizar_hora_str(texto):
+    # Extraer HH:MM con regex
+    match = RE_HHMM.search(texto)
+    if match:
+        h, m = int(match.group(1)), match.group(2)
+        return f"{h:02d}:{m}"
+    # Solo número (ej: "8" → "08:00")
+    match = RE_SOLO_HORA.match(texto)
+    if match:
+        return f"{int(match.group(1)):02d}:00"
+    return None
+
+
+def normalizar_hora(texto):
+    """
+    Convierte cualquier formato de hora a 'HH:MM' estándar.
+    Maneja: '8:00', '08:00', '8:30', datetime.time, etc.
+    """
+    if pd.isna(texto) or str(texto).strip() in ['-', '', 'nan']:
+        return None
+    return _normalizar_hora_str(str(texto).strip())
+
+
+@lru_cache(maxsize=TAMANO_MEMO)
+def _extraer_rango_str(texto):
+    texto = texto.strip().upper()
+    
+    if texto in ['', 'NAN']:
+        return None
+    
+    # Detectar "Libre" / "Descanso"
+    if 'LIBRE' in texto or 'DESCANSO' in texto:
+        return ('LIBRE', 'LIBRE')
+    
+    # Extraer todos los patrones HH:MM (los separadores "-", "a", "al" no alteran los HH:MM)
+    matches = RE_HHMM.findall(texto)
+    
+    if len(matches) >= 2:
+        h1, m1 = int(matches[0][0]), matches[0][1]
+        h2, m2 = int(matches[-1][0]), matches[-1][1]
+        return (f"{h1:02d}:{m1}", f"{h2:02d}:{m2}")
+    
+    # Un solo HH:MM no es un rango válido
+    return None
+
+
+def extraer_rango_horario(texto):
+    """
+    Extrae (entrada, salida) de un texto como '08:00 - 19:00' o '09:00-20:00'.
+    Retorna tupla de strings normalizados o ('LIBRE', 'LIBRE') o None si error.
+    """
+    if pd.isna(texto):
+        return None
+    return _extraer_rango_str(str(texto))
+
+
+# ── Vectorizadas (columnas completas) ──
+
+def texto_serie(serie):
+    """Columna como texto: nulos → '' y el resto `str(valor)`, una vez por valor distinto."""
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    textos = pd.Series([str(v) for v in unicos] + [''], dtype=object)
+    return pd.Series(textos.to_numpy()[codigos], index=serie.index, dtype=object)
+
+
+def quitar_acentos_serie(serie):
+    """Versión `.str` de quitar_acentos."""
+    return serie.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('utf-8')
+
+
+def limpiar_serie(serie):
+    """Versión vectorizada de limpiar_texto (nulos → '')."""
+    return quitar_acentos_serie(texto_serie(serie).str.strip()).str.upper().str.strip()
+
+
+def extraer_rangos(serie):
+    """
+    Versión vectorizada de extraer_rango_horario sobre una columna de texto.
+    Retorna DataFrame [entrada, salida] con NaN donde no hay rango, y
+    'LIBRE'/'LIBRE' para libres y descansos.
+    """
+    texto = texto_serie(serie).str.strip().str.upper()
+    horas = texto.str.findall(RE_HHMM)
+    hay_rango = horas.str.len() >= 2
+    
+    primera = horas[hay_rango].str[0]
+    ultima = horas[hay_rango].str[-1]
+    rangos = pd.DataFrame(index=serie.index, columns=['entrada', 'salida'], dtype=object)
+    rangos.loc[hay_rango, 'entrada'] = primera.str[0].str.zfill(2) + ':' + primera.str[1]
+    rangos.loc[hay_rango, 'salida'] = ultima.str[0].str.zfill(2) + ':' + ultima.str[1]
+    
+    libre = texto.str.contains('LIBRE', regex=False) | texto.str.contains('DESCANSO', regex=False)
+    rangos.loc[libre, ['entrada', 'salida']] = 'LIBRE'
+    return rangos
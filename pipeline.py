@@ -0,0 +1,1275 @@
+"""
+Lógica de procesamiento del BUKizador, independiente de Streamlit.
+
+Contiene el parseo del formato 360, la lectura del importador BUK, la
+codificación de turnos a siglas y el matching de nombres. Nada de este
+módulo toca `st.session_state`, por lo que puede ejecutarse en un hilo
+de fondo.
+"""
+import io
+import csv
+import time
+import difflib
+import datetime
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from cache_plantillas import CACHE_PLANTILLAS, hash_contenido
+from snapshots import SNAPSHOTS
+from incremental import hashes_por_hoja, heredar_ejecucion
+from indice_siglas import IndiceSiglas, TOLERANCIA_SUGERIDA
+from exportar import generar_importador
+from metricas import RegistroMetricas, resumen_turnos
+from normalizacion import (
+    limpiar_serie, normalizar_hora, extraer_rango_horario, extraer_rangos,
+    quitar_acentos, quitar_acentos_serie, texto_serie,
+)
+
+# Hojas del importador que se copian tal cual al archivo final
+HOJAS_COPIAR = ['turnosSemanales', 'turnosFlexibles', 'turnosTransitorios']
+
+# Columnas de turnosColaboradores que no son fechas
+COLUMNAS_FIJAS = ['Nombre del Colaborador', 'RUT', 'Área', 'Supervisor']
+
+# Filas del inicio de una hoja 360 donde se busca la fila de fechas (ver detectar_fila_fechas)
+FILAS_CABEZA_360 = 10
+
+# ── Constantes del parseo de hojas 360 ──
+# Rol según el nombre de la hoja (el primero que aparezca; si ninguno, 'OTRO')
+ROLES_HOJA = ['ANFITRION', 'AGENTE', 'COORDINADOR', 'SUPERVISOR']
+
+# Mes en el nombre de la hoja, para desempatar solapamientos
+MESES_ES = {
+    'ENERO': 1, 'FEBRERO': 2, 'MARZO': 3, 'ABRIL': 4, 'MAYO': 5, 'JUNIO': 6,
+    'JULIO': 7, 'AGOSTO': 8, 'SEPTIEMBRE': 9, 'OCTUBRE': 10, 'NOVIEMBRE': 11, 'DICIEMBRE': 12
+}
+
+# Filas de encabezado bajo la fila de fechas que se saltan antes de los datos
+ENCABEZADOS_DATOS = {'CARGO', 'NOMBRE', 'SUPERVISOR', ''}
+
+# Palabras que son encabezados de columna (no son nombres reales)
+PALABRAS_HEADER = {'NOMBRE', 'CARGO', 'SUPERVISOR', 'COLABORADOR', 'NOMBRE DEL COLABORADOR', 'TRABAJADOR', 'EMPLEADO', 'RUT'}
+
+
+class ProcesoCancelado(Exception):
+    """El usuario canceló el procesamiento antes de que terminara."""
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# FUNCIONES AUXILIARES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_es_fecha = np.vectorize(lambda v: isinstance(v, (datetime.datetime, pd.Timestamp)), otypes=[bool])
+
+
+def detectar_fila_fechas(df):
+    """Encuentra la fila que contiene fechas (datetime) en el DataFrame."""
+    # Bloque de 10 filas × 39 columnas evaluado de una vez
+    bloque = df.iloc[:FILAS_CABEZA_360, 1:40].to_numpy(dtype=object)
+    if bloque.size == 0:
+        return None
+    filas = np.flatnonzero(_es_fecha(bloque).sum(axis=1) >= 5)  # al menos 5 fechas
+    return int(filas[0]) if len(filas) else None
+
+
+def fechas_de_fila(df, fila):
+    """{índice de columna: Timestamp} de las celdas con fecha de una fila (desde la columna 1)."""
+    valores = df.iloc[fila, 1:].to_numpy(dtype=object)
+    if valores.size == 0:
+        return {}
+    return {int(j) + 1: pd.Timestamp(valores[j]) for j in np.flatnonzero(_es_fecha(valores))}
+
+
+# Subir al cambiar la salida de parsear_hoja_turnos: invalida los snapshots en disco
+VERSION_PARSER = 1
+
+
+def parsear_hoja_turnos(df, nombre_hoja):
+    """
+    Parsea una hoja de turnos del formato 360.
+    Retorna DataFrame con columnas: [Nombre, Fecha, Turno_Raw, Rol]
+    """
+    fila_fechas = detectar_fila_fechas(df)
+    if fila_fechas is None:
+        return pd.DataFrame()
+    
+    # Extraer fechas de esa fila
+    fechas = {j: ts.strftime('%Y-%m-%d') for j, ts in fechas_de_fila(df, fila_fechas).items()}
+    
+    if not fechas:
+        return pd.DataFrame()
+    
+    # Determinar dónde empiezan los datos
+    fila_data = fila_fechas + 1
+    # Saltar filas de encabezado como "Cargo", "Nombre", "Supervisor"
+    while fila_data < len(df):
+        val = df.iloc[fila_data, 0]
+        if pd.isna(val):
+            fila_data += 1
+            continue
+        val_str = str(val).strip().upper()
+        if val_str in ENCABEZADOS_DATOS:
+            fila_data += 1
+            continue
+        break
+    
+    # Determinar rol y mes a partir del nombre de la hoja
+    nombre_upper = nombre_hoja.upper()
+    rol = next((r for r in ROLES_HOJA if r in nombre_upper), 'OTRO')
+    
+    # Detectar mes del nombre de la hoja para tiebreaking de solapamientos
+    mes_hoja = None
+    for nombre_mes, num_mes in MESES_ES.items():
+        if nombre_mes in nombre_upper:
+            mes_hoja = num_mes
+            break
+    
+    registros = []
+    for i in range(fila_data, len(df)):
+        nombre = df.iloc[i, 0]
+        if pd.isna(nombre):
+            continue
+        # Saltar filas con valores numéricos (filas de totales/resumen)
+        if isinstance(nombre, (int, float)):
+            continue
+        nombre_str = str(nombre).strip()
+        if nombre_str in ['.', '', 'nan', 'NaN']:
+            continue
+        # Debe contener al menos una letra
+        if not any(c.isalpha() for c in nombre_str):
+            continue
+        # Saltar palabras que son encabezados de columna (no son nombres reales)
+        if nombre_str.upper() in PALABRAS_HEADER:
+            continue
+        
+        for col_idx, fecha_str in fechas.items():
+            turno_raw = df.iloc[i, col_idx] if col_idx < df.shape[1] else None
+            registros.append({
+                'Nombre_Input': nombre_str,
+                'Fecha': fecha_str,
+                'Turno_Raw': turno_raw,
+                'Rol': rol,
+                'Hoja': nombre_hoja,
+                'Mes_Hoja': mes_hoja
+            })
+    
+    return pd.DataFrame(registros)
+
+
+def construir_mapa_siglas(df_turnos_semanales):
+    """
+    Construye un diccionario: (entrada, salida, rol) → sigla
+    a partir de la hoja turnosSemanales del importador BUK.
+    """
+    df = df_turnos_semanales.copy()
+    df.columns = ['Nombre', 'Sigla', 'Dia', 'Entrada', 'Salida', 'ColIn', 'ColOut']
+    df = df.iloc[1:]  # Quitar header
+    
+    # Agrupar por sigla para obtener entrada/salida únicos
+    mapa = {}
+    for sigla in df['Sigla'].unique():
+        sub = df[df['Sigla'] == sigla]
+        entradas = [str(e).strip() for e in sub['Entrada'].unique() if str(e).strip() != '-']
+        salidas = [str(s).strip() for s in sub['Salida'].unique() if str(s).strip() != '-']
+        nombre = str(sub['Nombre'].iloc[0]).strip().upper()
+        
+        if not entradas or not salidas:
+            # Es un turno sin horario (D, F, L, P, V, C)
+            continue
+        
+        entrada_norm = normalizar_hora(entradas[0])
+        salida_norm = normalizar_hora(salidas[0])
+        
+        if entrada_norm and salida_norm:
+            # Determinar a qué rol pertenece esta sigla
+            roles = []
+            if 'ANF' in sigla.upper() or 'ANFITRION' in nombre:
+                roles.append('ANFITRION')
+            if 'AGE' in sigla.upper() or 'AGENTE' in nombre:
+                roles.append('AGENTE')
+            if 'COO' in sigla.upper() or 'COORDINADOR' in nombre:
+                roles.append('COORDINADOR')
+            if 'SUP' in sigla.upper() or 'SUPERVISOR' in nombre:
+                roles.append('SUPERVISOR')
+            if 'INDUC' in sigla.upper() or 'INDUCCION' in nombre or 'INDUCCIÓN' in nombre:
+                roles.append('INDUCCION')
+            if 'BASE' in sigla.upper():
+                roles = ['ANFITRION', 'AGENTE', 'COORDINADOR', 'SUPERVISOR', 'OTRO']
+            
+            if not roles:
+                roles = ['OTRO']
+            
+            for rol in roles:
+                key = (entrada_norm, salida_norm, rol)
+                mapa[key] = sigla
+    
+    return mapa
+
+
+# ── Palabras clave → sigla directa (antes de intentar parsear horarios) ──
+# Se busca si la palabra aparece contenida en el texto del supervisor.
+# Orden importa: las más específicas primero.
+KEYWORDS_SIGLA = [
+    ('VACACION',   'V'),   # Vacación, Vacaciones
+    ('PERMISO',    'P'),   # Permiso
+    ('COMPENSADO', 'C'),   # Compensado
+    ('FESTIVO',    'F'),   # Festivo
+    ('FERIADO',    'F'),   # Feriado
+    ('LICENCIA',   'L'),   # Licencia → se trata aparte en BUK, dejamos L
+    ('LIBRE',      'L'),   # Libre
+    ('DESCANSO',   'L'),   # Descanso → tratamos como Libre
+]
+
+
+def indice_sin_rol(mapa_siglas):
+    """(entrada, salida) → primera sigla del mapa, para el fallback de cualquier rol."""
+    indice = {}
+    for (e, s, r), sigla in mapa_siglas.items():
+        indice.setdefault((e, s), sigla)
+    return indice
+
+
+def buscar_sigla(entrada, salida, rol, mapa_siglas, sin_rol=None):
+    """Busca la sigla de un rango ya normalizado: rol exacto, medianoche y luego cualquier rol."""
+    # Buscar con rol exacto
+    key = (entrada, salida, rol)
+    if key in mapa_siglas:
+        return mapa_siglas[key]
+    
+    # Manejar medianoche: "00:00" como salida → probar con "23:59"
+    if salida == '00:00':
+        key_midnight = (entrada, '23:59', rol)
+        if key_midnight in mapa_siglas:
+            return mapa_siglas[key_midnight]
+    
+    # Fallback: buscar en cualquier rol (y medianoche en cualquier rol)
+    if sin_rol is None:
+        sin_rol = indice_sin_rol(mapa_siglas)
+    if (entrada, salida) in sin_rol:
+        return sin_rol[(entrada, salida)]
+    if salida == '00:00':
+        return sin_rol.get((entrada, '23:59'))
+    
+    return None  # No encontrado
+
+
+def turno_a_sigla(turno_raw, rol, mapa_siglas):
+    """Convierte un turno en texto humano a su sigla BUK."""
+    if pd.isna(turno_raw):
+        return None
+    
+    texto = str(turno_raw).strip().upper()
+    if texto in ['', 'NAN']:
+        return None
+    
+    # Normalizar: quitar acentos para comparar
+    texto_norm = quitar_acentos(texto)
+    
+    for keyword, sigla in KEYWORDS_SIGLA:
+        if keyword in texto_norm:
+            return sigla
+    
+    # ── Si no es palabra clave, intentar parsear como rango horario ──
+    rango = extraer_rango_horario(turno_raw)
+    
+    if rango is None:
+        return None  # No parseable
+    
+    if rango == ('LIBRE', 'LIBRE'):
+        return 'L'  # Fallback por si extraer_rango lo detecta
+    
+    return buscar_sigla(rango[0], rango[1], rol, mapa_siglas)
+
+
+def _siglas_distintas(textos, roles, mapa_siglas, indice=None, tolerancia=0, aproximados=None):
+    """
+    turno_a_sigla sobre pares (texto, rol) ya deduplicados, con operaciones `.str`.
+    Los horarios sin coincidencia exacta se buscan en `indice` dentro de
+    `tolerancia` minutos; esos aciertos quedan en `aproximados`.
+    """
+    texto = textos.str.strip().str.upper()
+    siglas = pd.Series(None, index=textos.index, dtype=object)
+    pendiente = ~texto.isin(['', 'NAN'])
+    
+    texto_norm = quitar_acentos_serie(texto)
+    for keyword, sigla in KEYWORDS_SIGLA:
+        hit = pendiente & texto_norm.str.contains(keyword, regex=False)
+        siglas[hit] = sigla
+        pendiente &= ~hit
+    
+    rangos = extraer_rangos(textos[pendiente]).dropna()
+    sin_rol = indice_sin_rol(mapa_siglas)
+    for idx, entrada, salida in zip(rangos.index, rangos['entrada'], rangos['salida']):
+        if entrada == 'LIBRE':
+            siglas[idx] = 'L'
+        else:
+            sigla = buscar_sigla(entrada, salida, roles[idx], mapa_siglas, sin_rol)
+            if sigla is None and indice is not None:
+                encontrado = indice.buscar(entrada, salida, roles[idx], tolerancia)
+                if encontrado is not None:
+                    sigla = encontrado[0]
+                    if aproximados is not None:
+                        aproximados[(textos[idx], roles[idx])] = encontrado
+            siglas[idx] = sigla
+    return siglas
+
+
+def codificar_turnos(turnos, roles, mapa_siglas, memo=None, indice=None, tolerancia=0, aproximados=None):
+    """
+    Versión vectorizada de turno_a_sigla para columnas completas: cada par
+    (texto, rol) distinto se resuelve una sola vez. `memo` es un dict
+    (texto, rol) → sigla que se reutiliza y completa entre llamadas (vale
+    para una sola tolerancia).
+    Con `indice` (IndiceSiglas) y `tolerancia` > 0, los horarios sin
+    coincidencia exacta toman la sigla más cercana; `aproximados` recibe
+    (texto, rol) → (sigla, desvío en minutos) para auditarlos.
+    Retorna Series alineada con `turnos` (None = vacío o no encontrado).
+    """
+    memo = {} if memo is None else memo
+    pares = pd.DataFrame({'texto': texto_serie(turnos).to_numpy(), 'rol': roles.to_numpy(object)})
+    unicos = pares.drop_duplicates(ignore_index=True)
+    faltan = [k not in memo for k in zip(unicos['texto'], unicos['rol'])]
+    if any(faltan):
+        nuevos = unicos[faltan]
+        siglas = _siglas_distintas(nuevos['texto'], nuevos['rol'], mapa_siglas, indice, tolerancia, aproximados)
+        memo.update(zip(zip(nuevos['texto'], nuevos['rol']), siglas))
+    unicos['sigla'] = [memo[k] for k in zip(unicos['texto'], unicos['rol'])]
+    resultado = pares.merge(unicos, on=['texto', 'rol'], how='left')['sigla']
+    resultado.index = turnos.index
+    return resultado
+
+
+def resumen_aproximados(turnos, roles, aproximados):
+    """
+    Turnos codificados por tolerancia presentes en `turnos`, para auditarlos.
+    DataFrame con Turno, Rol, Sigla, Desvío (min) y Celdas.
+    """
+    columnas = ['Turno', 'Rol', 'Sigla', 'Desvío (min)', 'Celdas']
+    if not aproximados:
+        return pd.DataFrame(columns=columnas)
+    claves = pd.Series(list(zip(texto_serie(turnos).to_numpy(), roles.to_numpy(object))), dtype=object)
+    conteo = claves[claves.isin(list(aproximados))].value_counts()
+    filas = [(texto, rol, *aproximados[(texto, rol)], int(n)) for (texto, rol), n in conteo.items()]
+    return pd.DataFrame(filas, columns=columnas).sort_values(['Desvío (min)', 'Celdas'], ascending=[False, False], ignore_index=True)
+
+
+def turnos_sin_sigla(turnos, siglas):
+    """
+    Celdas con texto de turno que no se pudieron codificar (irán como REVISAR).
+    Retorna (máscara, texto del turno sin espacios extremos).
+    """
+    texto_turno = texto_serie(turnos).str.strip()
+    revisar = siglas.isna() & turnos.notna() & ~texto_turno.isin(['', 'nan'])
+    return revisar, texto_turno
+
+
+def matching_nombres(nombres_input, nombres_buk, estrategias=None):
+    """
+    Hace matching inteligente entre nombres cortos (input) y nombres completos (BUK).
+    Retorna: (mapa_seguro, pendientes)
+      - mapa_seguro: {nombre_input: nombre_buk}
+      - pendientes: [nombre_input, ...] que necesitan corrección manual
+    Si se pasa `estrategias` (dict), recibe nombre_input → 'contencion' o 'difflib'.
+    """
+    estrategias = {} if estrategias is None else estrategias
+    nombres_buk_clean = dict(zip(limpiar_serie(pd.Series(nombres_buk, dtype=object)), nombres_buk))
+    lista_clean = list(nombres_buk_clean.keys())
+    
+    mapa_seguro = {}
+    pendientes = []
+    
+    nombres_input_clean = limpiar_serie(pd.Series(nombres_input, dtype=object)).tolist()
+    for nombre, n_clean in zip(nombres_input, nombres_input_clean):
+        partes = n_clean.split()
+        
+        if not partes:
+            continue
+        
+        # Estrategia 1: Todas las palabras del input aparecen en algún nombre BUK
+        matches = [real for real in lista_clean if all(p in real for p in partes)]
+        
+        if len(matches) == 1:
+            mapa_seguro[nombre] = nombres_buk_clean[matches[0]]
+            estrategias[nombre] = 'contencion'
+        elif len(matches) > 1:
+            # Intentar desempatar: el que tenga menos "basura" extra
+            best = min(matches, key=lambda x: len(x) - len(n_clean))
+            mapa_seguro[nombre] = nombres_buk_clean[best]
+            estrategias[nombre] = 'contencion'
+        else:
+            # Estrategia 2: Coincidencia difusa
+            posibles = difflib.get_close_matches(n_clean, lista_clean, n=1, cutoff=0.6)
+            if posibles:
+                mapa_seguro[nombre] = nombres_buk_clean[posibles[0]]
+                estrategias[nombre] = 'difflib'
+            else:
+                pendientes.append(nombre)
+    
+    return mapa_seguro, pendientes
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CARGA Y PROCESAMIENTO
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _avisar(progreso, etapa, detalle, fraccion):
+    """Notifica un evento de progreso si hay callback."""
+    if progreso is not None:
+        progreso(etapa, detalle, fraccion)
+
+
+def _verificar_cancelacion(cancelado):
+    """Lanza ProcesoCancelado si se pidió cancelar."""
+    if cancelado is not None and cancelado.is_set():
+        raise ProcesoCancelado()
+
+
+@dataclass
+class EsquemaPlantilla:
+    """
+    Columnas de turnosColaboradores resueltas una sola vez al cargar la plantilla.
+    Las listas `columnas_fecha`, `fechas_iso` y `posiciones` van en paralelo,
+    en el orden del header; `posiciones` son índices enteros de columna.
+    """
+    columnas_fecha: list
+    fechas_iso: list
+    posiciones: list
+    iso_a_columna: dict
+    columnas_no_fijas: list      # todo lo que no es columna fija ni vacío (para la vista previa)
+    ultima_columna: object = None
+    ultima_posicion: int = None
+    
+    @property
+    def indice_ultima(self):
+        """Índice de la última fecha dentro de las listas paralelas (o None)."""
+        return self.posiciones.index(self.ultima_posicion) if self.ultima_posicion is not None else None
+
+
+def construir_esquema(header):
+    """
+    Lee el header del importador: las fechas vienen como DD-MM-YYYY (o en
+    otro formato día-primero). Si dos columnas caen en la misma fecha, se
+    usa la última.
+    """
+    candidatas = [
+        (j, col) for j, col in enumerate(header)
+        if col not in COLUMNAS_FIJAS and col is not None and not pd.isna(col)
+    ]
+    textos = pd.Series([str(col) for _, col in candidatas], dtype=object)
+    fechas = pd.to_datetime(textos, format='%d-%m-%Y', errors='coerce')
+    for k in np.flatnonzero(fechas.isna().to_numpy()):
+        try:
+            fechas.iloc[k] = pd.to_datetime(textos.iloc[k], dayfirst=True, errors='raise')
+        except (ValueError, TypeError, OverflowError):
+            pass
+    
+    por_iso = {}
+    for (j, col), fecha in zip(candidatas, fechas):
+        if pd.notna(fecha):
+            por_iso[fecha.strftime('%Y-%m-%d')] = (j, col)
+    
+    esquema = EsquemaPlantilla(
+        columnas_fecha=[col for j, col in por_iso.values()],
+        fechas_iso=list(por_iso.keys()),
+        posiciones=[j for j, col in por_iso.values()],
+        iso_a_columna={iso: col for iso, (j, col) in por_iso.items()},
+        columnas_no_fijas=[col for _, col in candidatas],
+    )
+    if por_iso:
+        ultima_iso = max(por_iso)
+        esquema.ultima_posicion, esquema.ultima_columna = por_iso[ultima_iso]
+    return esquema
+
+
+@dataclass
+class PlantillaBUK:
+    """Importador BUK parseado. Se comparte entre sesiones: tratar como solo lectura."""
+    hash: str
+    nombre: str
+    is_xls: bool
+    header: list
+    df_data: pd.DataFrame
+    nombres: list
+    nombre_a_rut: dict
+    mapa_siglas: dict
+    indice_siglas: IndiceSiglas    # mapa_siglas por intervalos, para búsquedas con tolerancia
+    esquema: EsquemaPlantilla
+    hojas_copiar: dict = field(default_factory=dict)    # hoja → DataFrame sin header
+    errores_hojas: dict = field(default_factory=dict)   # hoja → motivo por el que no se pudo leer
+    csv: dict = None    # plantillas CSV: {'delimitador', 'encoding', 'fin_linea', 'preambulo'} para reescribirla igual
+    celdas_fijas: np.ndarray = None    # combinadas: valor forzado por celda (fila × fecha del esquema), None = el del 360
+
+
+def es_csv(nombre):
+    """True si el archivo se trata como CSV por su extensión."""
+    return nombre.lower().endswith('.csv')
+
+
+def _abrir_excel(datos, nombre):
+    """pd.ExcelFile con el motor que corresponde a la extensión."""
+    nombre = nombre.lower()
+    if nombre.endswith('.xls') and not nombre.endswith('.xlsx'):
+        return pd.ExcelFile(io.BytesIO(datos), engine='xlrd'), True
+    return pd.ExcelFile(io.BytesIO(datos), engine='openpyxl'), False
+
+
+def _leer_hojas_copiar(xls_buk):
+    """Hojas que van tal cual al archivo final (turnosSemanales además define las siglas)."""
+    hojas_copiar = {}
+    errores_hojas = {}
+    for nombre_hoja in HOJAS_COPIAR:
+        try:
+            hojas_copiar[nombre_hoja] = pd.read_excel(xls_buk, sheet_name=nombre_hoja, header=None)
+        except Exception as e_h:
+            errores_hojas[nombre_hoja] = str(e_h)
+    return hojas_copiar, errores_hojas
+
+
+def _leer_catalogo(datos, nombre):
+    """turnosSemanales desde un CSV suelto o desde las hojas de un importador Excel."""
+    if es_csv(nombre):
+        texto = io.TextIOWrapper(io.BytesIO(datos), encoding=_detectar_encoding(datos), newline='')
+        delimitador = _detectar_delimitador(datos)
+        df_ts = pd.read_csv(texto, sep=delimitador, header=None, dtype=str, keep_default_na=False, na_values=[''])
+        return {'turnosSemanales': df_ts}, {}
+    xls, _ = _abrir_excel(datos, nombre)
+    return _leer_hojas_copiar(xls)
+
+
+def _detectar_encoding(datos):
+    """utf-8 (con o sin BOM) si decodifica; si no, latin-1 (exportaciones antiguas de Excel)."""
+    try:
+        datos[:65536].decode('utf-8')
+    except UnicodeDecodeError as e:
+        # Un corte a mitad de un carácter multibyte al final del bloque no cuenta
+        if e.start < min(len(datos), 65536) - 3:
+            return 'latin-1'
+    return 'utf-8-sig' if datos.startswith(b'\xef\xbb\xbf') else 'utf-8'
+
+
+def _detectar_delimitador(datos):
+    """Separador del CSV (',', ';' o tab) a partir de las primeras líneas."""
+    muestra = datos[:8192].decode('latin-1')
+    try:
+        return csv.Sniffer().sniff(muestra, delimiters=',;\t').delimiter
+    except csv.Error:
+        return ';' if muestra.count(';') > muestra.count(',') else ','
+
+
+def leer_plantilla_csv(buk_bytes):
+    """
+    Lee turnosColaboradores desde CSV. Las filas anteriores al header
+    (metadatos) se guardan tal cual para reescribirlas en la salida. Cada
+    fila se ajusta al ancho del header: un separador sobrante al final (típico
+    de CSV exportados desde Excel) se ignora y las filas cortas se completan.
+    Retorna (header, df_data, formato_csv).
+    """
+    encoding = _detectar_encoding(buk_bytes)
+    delimitador = _detectar_delimitador(buk_bytes)
+    texto = io.TextIOWrapper(io.BytesIO(buk_bytes), encoding=encoding, newline='')
+    
+    # Avanzar línea a línea hasta el header; lo anterior es preámbulo
+    preambulo = []
+    header = None
+    for linea in iter(texto.readline, ''):
+        fila = next(csv.reader([linea], delimiter=delimitador), [])
+        celdas = [c.strip() for c in fila]
+        if 'RUT' in celdas and 'Nombre del Colaborador' in celdas:
+            header = [c if c != '' else None for c in celdas]
+            break
+        preambulo.append(fila)
+    if header is None:
+        raise ValueError("La plantilla CSV no tiene una fila de encabezado con 'Nombre del Colaborador' y 'RUT'.")
+    
+    # El resto del archivo, todo como texto (los RUT no se convierten a número); celda vacía → NaN
+    ancho = len(header)
+    filas = [(fila + [''] * ancho)[:ancho] for fila in csv.reader(texto, delimiter=delimitador) if fila]
+    df_tc = pd.DataFrame(filas, columns=range(ancho), dtype=object)
+    df_tc = df_tc.where(df_tc != '')
+    df_tc.columns = header
+    
+    fin_linea = '\r\n' if b'\r\n' in buk_bytes[:8192] else '\n'
+    formato = {'delimitador': delimitador, 'encoding': encoding, 'fin_linea': fin_linea, 'preambulo': preambulo}
+    return header, df_tc, formato
+
+
+def leer_importador_buk(buk_bytes, buk_nombre, catalogo=None):
+    """
+    Lee el importador BUK (.xls, .xlsx o .csv) desde sus bytes.
+    Parsea turnosColaboradores, construye el mapa de siglas desde
+    turnosSemanales y guarda las hojas que se copian al archivo final.
+    Un CSV solo trae turnosColaboradores: `catalogo` = (bytes, nombre) aporta
+    turnosSemanales (CSV suelto o el importador Excel completo).
+    """
+    formato_csv = None
+    if es_csv(buk_nombre):
+        if catalogo is None:
+            raise ValueError("Una plantilla CSV necesita el catálogo de turnos (turnosSemanales) por separado.")
+        header_row, df_tc, formato_csv = leer_plantilla_csv(buk_bytes)
+        buk_is_xls = False
+        hojas_copiar, errores_hojas = _leer_catalogo(*catalogo)
+    else:
+        xls_buk, buk_is_xls = _abrir_excel(buk_bytes, buk_nombre)
+        
+        # Hoja turnosColaboradores
+        df_tc_raw = pd.read_excel(xls_buk, sheet_name='turnosColaboradores', header=None)
+        header_row = df_tc_raw.iloc[0].tolist()
+        df_tc = df_tc_raw.iloc[1:].copy()
+        df_tc.columns = header_row
+        df_tc = df_tc.reset_index(drop=True)
+        
+        hojas_copiar, errores_hojas = _leer_hojas_copiar(xls_buk)
+    
+    nombres_buk = df_tc['Nombre del Colaborador'].tolist()
+    ruts_buk = df_tc['RUT'].tolist()
+    
+    if 'turnosSemanales' not in hojas_copiar:
+        raise ValueError(f"El importador BUK no tiene la hoja 'turnosSemanales': {errores_hojas.get('turnosSemanales')}")
+    mapa_siglas = construir_mapa_siglas(hojas_copiar['turnosSemanales'])
+    
+    return PlantillaBUK(
+        hash=clave_plantilla(buk_bytes, catalogo),
+        nombre=buk_nombre,
+        is_xls=buk_is_xls,
+        header=header_row,
+        df_data=df_tc,
+        nombres=nombres_buk,
+        nombre_a_rut=dict(zip(nombres_buk, ruts_buk)),
+        mapa_siglas=mapa_siglas,
+        indice_siglas=IndiceSiglas(mapa_siglas),
+        esquema=construir_esquema(header_row),
+        hojas_copiar=hojas_copiar,
+        errores_hojas=errores_hojas,
+        csv=formato_csv,
+    )
+
+
+def clave_plantilla(buk_bytes, catalogo=None):
+    """Clave de caché: contenido de la plantilla (más el catálogo, si viene aparte)."""
+    if catalogo is None:
+        return hash_contenido(buk_bytes)
+    return hash_contenido(buk_bytes + b'\0' + catalogo[0])
+
+
+def obtener_plantilla(buk_bytes, buk_nombre, catalogo=None):
+    """Plantilla BUK desde la caché compartida; la parsea solo si no estaba."""
+    return CACHE_PLANTILLAS.obtener_o_cargar(
+        clave_plantilla(buk_bytes, catalogo),
+        lambda: leer_importador_buk(buk_bytes, buk_nombre, catalogo),
+    )
+
+
+def obtener_plantillas(importadores, catalogo=None):
+    """
+    Plantillas de uno o varios importadores ((bytes, nombre) cada uno, p. ej.
+    los semanales de un mes) y la plantilla de trabajo: la única, o la
+    combinación de todas (también cacheada). `catalogo` solo se usa en las CSV.
+    Un mismo importador subido dos veces cuenta una vez.
+    Retorna (plantilla de trabajo, lista de plantillas en el orden recibido).
+    """
+    plantillas = {}
+    for datos, nombre in importadores:
+        plantilla = obtener_plantilla(datos, nombre, catalogo if es_csv(nombre) else None)
+        plantillas.setdefault(plantilla.hash, plantilla)
+    plantillas = list(plantillas.values())
+    if len(plantillas) == 1:
+        return plantillas[0], plantillas
+    clave = hash_contenido('+'.join(p.hash for p in plantillas).encode('ascii'))
+    return CACHE_PLANTILLAS.obtener_o_cargar(clave, lambda: combinar_plantillas(plantillas, clave)), plantillas
+
+
+def combinar_plantillas(plantillas, clave):
+    """
+    Plantilla de trabajo para llenar varios importadores con una sola grilla:
+    nómina unida por RUT (queda la fila de la primera plantilla en que
+    aparece), todas las fechas en orden y los catálogos de siglas unidos
+    (ante un mismo horario gana la primera). Sin último día propio: cada
+    importador pone su 'D' al recortarse con `recortar_grilla`. Las celdas que
+    ningún importador exporta con el turno del 360 quedan en `celdas_fijas`
+    ('D' si son el último día de todos los que las contienen, 'L' si ninguno
+    las contiene), para que no cuenten como problemas. No se exporta.
+    """
+    fijas = [c for c in COLUMNAS_FIJAS if any(c in p.df_data.columns for p in plantillas)]
+    fechas = sorted({iso for p in plantillas for iso in p.esquema.fechas_iso})
+    header = fijas + [pd.Timestamp(iso).strftime('%d-%m-%Y') for iso in fechas]
+    
+    nomina = pd.concat([p.df_data.reindex(columns=fijas) for p in plantillas], ignore_index=True)
+    nomina = nomina[~(nomina['RUT'].duplicated() & nomina['RUT'].notna())].reset_index(drop=True)
+    df_data = nomina.reindex(columns=header)
+    
+    nombre_a_rut = {}
+    mapa_siglas = {}
+    for p in plantillas:
+        for nombre, rut in p.nombre_a_rut.items():
+            nombre_a_rut.setdefault(nombre, rut)
+        for horario, sigla in p.mapa_siglas.items():
+            mapa_siglas.setdefault(horario, sigla)
+    
+    esquema = construir_esquema(header)
+    esquema.ultima_posicion = esquema.ultima_columna = None
+    
+    # Por celda: cuántos importadores la contienen y en cuántos es su último día
+    indice_fecha = {iso: k for k, iso in enumerate(esquema.fechas_iso)}
+    contiene = np.zeros((len(df_data), len(fechas)), dtype=np.int16)
+    ultimo = np.zeros_like(contiene)
+    for p in plantillas:
+        filas = np.flatnonzero(df_data['RUT'].isin(p.df_data['RUT']).to_numpy())
+        contiene[np.ix_(filas, [indice_fecha[iso] for iso in p.esquema.fechas_iso])] += 1
+        if p.esquema.ultima_posicion is not None:
+            ultimo[filas, indice_fecha[p.esquema.fechas_iso[p.esquema.indice_ultima]]] += 1
+    
+    return PlantillaBUK(
+        hash=clave,
+        nombre=' + '.join(p.nombre for p in plantillas),
+        is_xls=plantillas[0].is_xls,
+        header=header,
+        df_data=df_data,
+        nombres=df_data['Nombre del Colaborador'].tolist(),
+        nombre_a_rut=nombre_a_rut,
+        mapa_siglas=mapa_siglas,
+        indice_siglas=IndiceSiglas(mapa_siglas),
+        esquema=esquema,
+        celdas_fijas=np.where(contiene == ultimo, np.where(contiene > 0, 'D', 'L'), None).astype(object),
+    )
+
+
+def resolver_solapamientos(df_all):
+    """
+    Para (Nombre, Fecha, Rol) duplicados, preferir la hoja cuyo mes coincida
+    con el mes de la fecha. Si ninguno coincide, tomar el primero.
+    """
+    df_all['_fecha_dt'] = pd.to_datetime(df_all['Fecha'])
+    df_all['_mes_fecha'] = df_all['_fecha_dt'].dt.month
+    df_all['_match_mes'] = (df_all['Mes_Hoja'] == df_all['_mes_fecha']).astype(int)
+    
+    # Ordenar: primero los que matchean mes (1), luego por hoja (estable)
+    df_all = df_all.sort_values(
+        by=['Nombre_Input', 'Fecha', 'Rol', '_match_mes'],
+        ascending=[True, True, True, False]
+    )
+    df_all = df_all.drop_duplicates(
+        subset=['Nombre_Input', 'Fecha', 'Rol'],
+        keep='first'
+    )
+    df_all = df_all.drop(columns=['_fecha_dt', '_mes_fecha', '_match_mes'])
+    return df_all.reset_index(drop=True)
+
+
+def clave_snapshot(hash_hoja, nombre_hoja):
+    """Clave del snapshot en disco de una hoja: contenido + nombre + versión del parser."""
+    return f"{hash_hoja[:32]}_{hash_contenido(nombre_hoja.encode('utf-8'))[:12]}_v{VERSION_PARSER}"
+
+
+def hashes_hojas_360(bytes_360, hojas):
+    """
+    Hash de contenido de cada hoja. Si el archivo no se puede leer como xlsx,
+    todas usan el hash del archivo completo (cualquier cambio las invalida).
+    """
+    hashes = hashes_por_hoja(bytes_360)
+    hash_360 = None
+    resultado = {}
+    for hoja in hojas:
+        if hoja not in hashes and hash_360 is None:
+            hash_360 = hash_contenido(bytes_360)
+        resultado[hoja] = hashes.get(hoja, hash_360)
+    return resultado
+
+
+def fechas_encabezado_360(xls360, hoja):
+    """Fechas (ISO) de la fila de fechas de una hoja, leyendo solo sus primeras filas."""
+    df_cabeza = pd.read_excel(xls360, sheet_name=hoja, header=None, nrows=FILAS_CABEZA_360)
+    fila = detectar_fila_fechas(df_cabeza)
+    if fila is None:
+        return set()
+    return {ts.strftime('%Y-%m-%d') for ts in fechas_de_fila(df_cabeza, fila).values()}
+
+
+def iterar_hojas_360(bytes_360, hojas, hashes, progreso=None, cancelado=None, metricas=None, fechas_validas=None):
+    """
+    Genera (hoja, DataFrame) de a una hoja 360, en el orden de `hojas`. Las
+    que ya tienen snapshot en disco (mismo contenido de hoja) se cargan desde
+    ahí; el Excel solo se abre si alguna hoja cambió o es nueva.
+
+    Con `fechas_validas` (fechas ISO del importador) cada hoja se recorta a
+    esas fechas apenas se parsea, y una hoja sin snapshot cuyo encabezado no
+    toca la ventana ni se lee completa. Los snapshots guardan la hoja entera
+    para servir a cualquier plantilla. Las hojas sin turnos no se generan.
+    """
+    xls360 = None
+    for i, hoja in enumerate(hojas):
+        _avisar(progreso, 'Turnos 360', f"Hoja '{hoja}' ({i+1}/{len(hojas)})", 0.15 + 0.7 * i / len(hojas))
+        clave = clave_snapshot(hashes[hoja], hoja)
+        df_parsed = SNAPSHOTS.cargar(clave)
+        desde_snapshot = df_parsed is not None
+        if df_parsed is None:
+            if xls360 is None:
+                xls360 = pd.ExcelFile(io.BytesIO(bytes_360))
+            if fechas_validas is not None and fechas_validas.isdisjoint(fechas_encabezado_360(xls360, hoja)):
+                df_parsed = pd.DataFrame()
+            else:
+                df_parsed = parsear_hoja_turnos(pd.read_excel(xls360, sheet_name=hoja, header=None), hoja)
+                SNAPSHOTS.guardar(clave, df_parsed)
+        if fechas_validas is not None and not df_parsed.empty:
+            df_parsed = df_parsed[df_parsed['Fecha'].isin(fechas_validas)]
+        if metricas is not None:
+            metricas.hoja(hoja, len(df_parsed), desde_snapshot)
+        _verificar_cancelacion(cancelado)
+        if not df_parsed.empty:
+            yield hoja, df_parsed
+
+
+def consolidar_turnos(hojas_parseadas):
+    """
+    Une las hojas a medida que llegan resolviendo solapamientos por mes: un
+    duplicado (Nombre, Fecha, Rol) siempre cae en el mismo mes, así que cada
+    ventana se deduplica por separado contra lo ya acumulado y el libro
+    completo nunca se concatena de una vez. Mismo resultado (y orden) que
+    `resolver_solapamientos` sobre todas las hojas juntas; vacío si no hubo turnos.
+    """
+    ventanas = {}
+    for _, df_hoja in hojas_parseadas:
+        for mes, parte in df_hoja.groupby(df_hoja['Fecha'].str[:7], sort=False):
+            acumulado = ventanas.get(mes)
+            if acumulado is not None:
+                parte = pd.concat([acumulado, parte], ignore_index=True)
+            ventanas[mes] = resolver_solapamientos(parte)
+    if not ventanas:
+        return pd.DataFrame()
+    df_all = pd.concat(ventanas.values(), ignore_index=True)
+    return df_all.sort_values(['Nombre_Input', 'Fecha', 'Rol'], kind='stable').reset_index(drop=True)
+
+
+def leer_hojas_360(bytes_360, hojas, plantilla, progreso=None, cancelado=None, metricas=None):
+    """
+    Turnos de las hojas 360 indicadas, ya sin solapamientos y recortados a las
+    fechas de la plantilla (todas, si su header no trae fechas).
+    Retorna (df_all, hashes por hoja).
+    """
+    hashes = hashes_hojas_360(bytes_360, hojas)
+    fechas_validas = set(plantilla.esquema.fechas_iso) or None
+    df_all = consolidar_turnos(iterar_hojas_360(bytes_360, hojas, hashes, progreso, cancelado, metricas, fechas_validas))
+    if df_all.empty:
+        fuera = " dentro de las fechas del importador BUK" if fechas_validas else ""
+        raise ValueError(f"No se pudieron parsear turnos de las hojas seleccionadas{fuera}.")
+    return df_all, hashes
+
+
+def procesar_carga(bytes_360, buk_bytes, buk_nombre, hojas, progreso=None, cancelado=None, previa=None,
+                   catalogo=None, metricas=None, adicionales=()):
+    """
+    Pipeline completo de la fase de carga: importador BUK (vía caché
+    compartida), hojas 360, solapamientos y matching de nombres.
+
+    `progreso(etapa, detalle, fraccion)` recibe un evento por etapa y por hoja;
+    `cancelado` es un threading.Event que se revisa entre etapas.
+    Con `previa` (estado de la ejecución anterior) el procesamiento es
+    incremental: solo los nombres nuevos pasan por matching y se conservan
+    las resoluciones de celdas que no cambiaron.
+    `catalogo` = (bytes, nombre) del turnosSemanales cuando la plantilla es CSV.
+    `adicionales` = más importadores ((bytes, nombre)) a llenar con los mismos
+    turnos: se trabaja sobre su combinación (ver `obtener_plantillas`).
+    `metricas` (RegistroMetricas) recibe duraciones, filas por hoja y matching;
+    si no se pasa se crea uno, que viaja en 'metricas_carga'.
+    Retorna dict con las claves que la app guarda en session_state; de la
+    plantilla solo viaja su hash.
+    """
+    metricas = RegistroMetricas('carga') if metricas is None else metricas
+    
+    # ── LEER IMPORTADOR BUK ──
+    _avisar(progreso, 'Importador BUK', ', '.join([buk_nombre, *(n for _, n in adicionales)]), 0.0)
+    with metricas.etapa('importador_buk'):
+        plantilla, plantillas = obtener_plantillas([(buk_bytes, buk_nombre), *adicionales], catalogo)
+    _verificar_cancelacion(cancelado)
+    
+    # ── LEER TURNOS 360 (HOJA POR HOJA, SOLAPAMIENTOS POR MES) ──
+    with metricas.etapa('lectura_360'):
+        df_all, hashes_hojas = leer_hojas_360(bytes_360, hojas, plantilla, progreso, cancelado, metricas)
+    _verificar_cancelacion(cancelado)
+    
+    # ── MATCHING DE NOMBRES ──
+    nombres_input = df_all['Nombre_Input'].unique().tolist()
+    resultado = {}
+    estrategias = {}
+    with metricas.etapa('matching'):
+        if previa is not None:
+            mapa_heredado, nombres_nuevos, resoluciones, reporte = heredar_ejecucion(
+                previa, df_all, nombres_input, plantilla, hashes_hojas
+            )
+            _avisar(progreso, 'Matching de nombres', f"{len(nombres_nuevos)} nombres nuevos", 0.9)
+            mapa, pendientes = matching_nombres(nombres_nuevos, plantilla.nombres, estrategias)
+            mapa.update(mapa_heredado)
+            estrategias.update(dict.fromkeys(mapa_heredado, 'heredado'))
+            resultado['resoluciones_problemas'] = resoluciones
+        else:
+            _avisar(progreso, 'Matching de nombres', f"{len(nombres_input)} nombres", 0.9)
+            mapa, pendientes = matching_nombres(nombres_input, plantilla.nombres, estrategias)
+            reporte = None
+    metricas.matching(estrategias, pendientes)
+    
+    _avisar(progreso, 'Listo', '', 1.0)
+    resultado.update({
+        'plantilla_hash': plantilla.hash,
+        'plantillas_hashes': [p.hash for p in plantillas],
+        'hash_360': hash_contenido(bytes_360),
+        'hashes_hojas': hashes_hojas,
+        'df_all_turnos': df_all,
+        'hojas_mes': list(hojas),
+        'mapa_nombres': mapa,
+        'pendientes': pendientes,
+        'reporte_cambios': reporte,
+        'estrategias_nombres': estrategias,
+        'metricas_carga': metricas.datos,
+    })
+    return resultado
+
+
+def validar(bytes_360, buk_bytes, buk_nombre, hojas, catalogo=None, progreso=None, cancelado=None,
+            tolerancia=TOLERANCIA_SUGERIDA, adicionales=()):
+    """
+    Ensayo sin generar archivo: parseo, solapamientos, matching de nombres y
+    codificación de los turnos distintos. No llena la grilla ni escribe nada.
+    Retorna dict con conteos, nombres sin match, textos de turno desconocidos
+    (texto → cantidad de celdas) y los codificados por `tolerancia`. Las
+    celdas se cuentan como en el importador (ver `celdas_importador`), así
+    que `celdas_revisar` anticipa los problemas del flujo completo.
+    Con `adicionales` valida contra la combinación de los importadores.
+    Emite un registro de métricas con modo 'validar'.
+    """
+    inicio = time.perf_counter()
+    metricas = RegistroMetricas('validar')
+    with metricas.etapa('importador_buk'):
+        plantilla, _ = obtener_plantillas([(buk_bytes, buk_nombre), *adicionales], catalogo)
+    with metricas.etapa('lectura_360'):
+        df_all, _ = leer_hojas_360(bytes_360, hojas, plantilla, progreso, cancelado, metricas)
+    
+    nombres_input = df_all['Nombre_Input'].unique().tolist()
+    _avisar(progreso, 'Matching de nombres', f"{len(nombres_input)} nombres", 0.9)
+    estrategias = {}
+    with metricas.etapa('matching'):
+        mapa, pendientes = matching_nombres(nombres_input, plantilla.nombres, estrategias)
+    metricas.matching(estrategias, pendientes)
+    _verificar_cancelacion(cancelado)
+    
+    # Solo los turnos de nombres con match llegan al importador
+    aproximados = {}
+    with metricas.etapa('codificacion'):
+        df_con_match, _ = codificar_con_match(df_all, mapa, plantilla, tolerancia=tolerancia, aproximados=aproximados)
+    # Los conteos son por celda del importador, como los problemas del flujo completo
+    celdas = celdas_importador(df_con_match, plantilla)
+    revisar = celdas['Sigla'].str.startswith('REVISAR:', na=False)
+    desconocidos = celdas.loc[revisar, 'Sigla'].str.slice(len('REVISAR:')).value_counts()
+    df_aprox = resumen_aproximados(df_con_match['Turno_Raw'], df_con_match['Rol'], aproximados)
+    metricas.registrar(tolerancia=tolerancia, turnos={**resumen_turnos(df_con_match), 'aproximadas': int(df_aprox['Celdas'].sum())})
+    metricas.emitir()
+    
+    _avisar(progreso, 'Listo', '', 1.0)
+    return {
+        'hojas': list(hojas),
+        'registros': len(df_all),
+        'nombres': len(nombres_input),
+        'nombres_con_match': len(mapa),
+        'nombres_sin_match': sorted(pendientes),
+        'celdas': len(celdas),
+        'celdas_codificadas': int((celdas['Sigla'].notna() & ~revisar).sum()),
+        'celdas_revisar': int(revisar.sum()),
+        'turnos_desconocidos': dict(zip(desconocidos.index, desconocidos.astype(int).tolist())),
+        'tolerancia': tolerancia,
+        'celdas_aproximadas': int(df_aprox['Celdas'].sum()),
+        'turnos_aproximados': df_aprox.to_dict('records'),
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LLENADO DE LA PLANTILLA
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def codificar_con_match(df_all, mapa_nombres, plantilla, memo=None, tolerancia=0, aproximados=None):
+    """
+    Turnos de los nombres con match, con su RUT y sigla (o 'REVISAR:<texto>'
+    si no se pudo codificar). Retorna (df_con_match, textos no encontrados).
+    """
+    df_all['Nombre_BUK'] = df_all['Nombre_Input'].map(mapa_nombres)
+    # Filtrar solo los que tienen match
+    df_con_match = df_all[df_all['Nombre_BUK'].notna()].copy()
+    
+    # Obtener RUT
+    df_con_match['RUT'] = df_con_match['Nombre_BUK'].map(plantilla.nombre_a_rut)
+    
+    # Mapear turnos a siglas (una vez por par texto/rol distinto)
+    siglas = codificar_turnos(
+        df_con_match['Turno_Raw'], df_con_match['Rol'], plantilla.mapa_siglas, memo,
+        indice=plantilla.indice_siglas, tolerancia=tolerancia, aproximados=aproximados,
+    )
+    revisar, texto_turno = turnos_sin_sigla(df_con_match['Turno_Raw'], siglas)
+    df_con_match['Sigla'] = siglas.where(~revisar, 'REVISAR:' + texto_turno)
+    return df_con_match, set(texto_turno[revisar])
+
+
+def celdas_importador(df_con_match, plantilla):
+    """
+    Turnos de df_con_match que terminan en una celda del importador, con las
+    mismas reglas que `llenar_plantilla`: uno por (RUT, fecha) (gana el
+    primero), solo fechas de la plantilla y sin las celdas que se fijan (el
+    último día, o `celdas_fijas` en las combinadas).
+    """
+    esquema = plantilla.esquema
+    fechas = [iso for k, iso in enumerate(esquema.fechas_iso) if k != esquema.indice_ultima]
+    turnos = df_con_match[df_con_match['RUT'].notna() & df_con_match['Fecha'].isin(fechas)]
+    turnos = turnos.drop_duplicates(subset=['RUT', 'Fecha'], keep='first')
+    if plantilla.celdas_fijas is None or not len(turnos):
+        return turnos
+    ruts = plantilla.df_data['RUT']
+    fila_de_rut = pd.Series(np.arange(len(ruts)), index=ruts)[~ruts.duplicated().to_numpy()]
+    filas = fila_de_rut.reindex(turnos['RUT']).to_numpy()
+    columnas = turnos['Fecha'].map({iso: k for k, iso in enumerate(esquema.fechas_iso)}).to_numpy()
+    en_grilla = ~pd.isna(filas)
+    libres = np.zeros(len(turnos), dtype=bool)
+    libres[en_grilla] = pd.isna(plantilla.celdas_fijas[filas[en_grilla].astype(int), columnas[en_grilla].astype(int)])
+    return turnos[libres]
+
+
+def aplicar_resoluciones(df_output, problemas, resoluciones):
+    """
+    Aplica las decisiones del panel de turnos no codificados sobre df_output:
+    'manual' escribe la sigla en la celda, 'omitir' saca al colaborador y
+    'bdmaestra' (por defecto) deja el REVISAR. Retorna los RUT omitidos.
+    """
+    ruts_omitidos = set()
+    for p in problemas:
+        res = resoluciones.get(p['key'], {'tipo': 'bdmaestra'})
+        if res['tipo'] == 'manual':
+            df_output.iat[p['idx'], p['pos']] = res['sigla']
+        elif res['tipo'] == 'omitir':
+            ruts_omitidos.add(p['rut'])
+        # 'bdmaestra' → REVISAR: se queda en la celda
+    return ruts_omitidos
+
+
+def llenar_plantilla(df_buk, esquema, df_con_match, celdas_fijas=None):
+    """
+    Copia de turnosColaboradores con cada columna de fecha llenada con la
+    sigla del (RUT, fecha). Último día del importador → 'D' (truco de
+    configuración BUK); sin turno en el 360 o celda vacía → 'L'. En las
+    plantillas combinadas, `celdas_fijas` fija las celdas que no son del 360.
+    Si un RUT tiene varios turnos el mismo día, gana el primero de df_con_match.
+    """
+    df_output = df_buk.copy()
+    if not esquema.posiciones:
+        return df_output
+    
+    turnos = df_con_match[df_con_match['RUT'].notna() & df_con_match['Fecha'].isin(esquema.iso_a_columna)]
+    turnos = turnos.drop_duplicates(subset=['RUT', 'Fecha'], keep='first')
+    matriz = turnos.pivot(index='RUT', columns='Fecha', values='Sigla')
+    # copy=True: con la pivot vacía, pandas entrega un arreglo de solo lectura
+    valores = matriz.reindex(index=df_output['RUT'], columns=esquema.fechas_iso).to_numpy(dtype=object, copy=True)
+    valores[pd.isna(valores)] = 'L'
+    if esquema.ultima_posicion is not None:
+        valores[:, esquema.indice_ultima] = 'D'
+    if celdas_fijas is not None:
+        fijas = pd.notna(celdas_fijas)
+        valores[fijas] = celdas_fijas[fijas]
+    
+    for k, pos in enumerate(esquema.posiciones):
+        df_output.isetitem(pos, valores[:, k])
+    return df_output
+
+
+def recortar_grilla(df_output, esquema, plantilla):
+    """
+    Importador de `plantilla` a partir de la grilla llenada sobre la
+    plantilla combinada (`df_output`, fechas según `esquema`): sus filas por
+    RUT y sus columnas de fecha, con su último día en 'D'.
+    """
+    df_plantilla = plantilla.df_data.copy()
+    propio = plantilla.esquema
+    if not propio.posiciones:
+        return df_plantilla
+    
+    ruts = df_output['RUT']
+    fila_de_rut = pd.Series(np.arange(len(ruts)), index=ruts)[~ruts.duplicated().to_numpy()]
+    filas = fila_de_rut.reindex(df_plantilla['RUT']).to_numpy()
+    posicion_de_fecha = dict(zip(esquema.fechas_iso, esquema.posiciones))
+    columnas = [posicion_de_fecha[iso] for iso in propio.fechas_iso]
+    valores = df_output.iloc[filas, columnas].to_numpy(dtype=object)
+    if propio.ultima_posicion is not None:
+        valores[:, propio.indice_ultima] = 'D'
+    
+    for k, pos in enumerate(propio.posiciones):
+        df_plantilla.isetitem(pos, valores[:, k])
+    return df_plantilla
+
+
+def mascara_revisar(df_output, esquema):
+    """Matriz bool (filas × fechas del esquema) de celdas que quedaron como REVISAR:..."""
+    if not esquema.posiciones:
+        return np.zeros((len(df_output), 0), dtype=bool)
+    bloque = df_output.iloc[:, esquema.posiciones]
+    return np.column_stack([
+        bloque.iloc[:, k].map(lambda v: isinstance(v, str) and v.startswith('REVISAR:')).to_numpy(dtype=bool)
+        for k in range(bloque.shape[1])
+    ])
+
+
+def detectar_problemas(df_output, esquema, df_con_match):
+    """
+    Lista de celdas REVISAR:... (fila por fila, fechas en orden del header)
+    con lo necesario para el panel de resolución.
+    """
+    mascara = mascara_revisar(df_output, esquema)
+    filas, ks = np.nonzero(mascara)
+    if not len(filas):
+        return []
+    
+    rol_por_celda = (
+        df_con_match.drop_duplicates(subset=['RUT', 'Fecha'], keep='first')
+        .set_index(['RUT', 'Fecha'])['Rol'].to_dict()
+    )
+    ruts = df_output['RUT'].to_numpy(dtype=object)
+    nombres = df_output['Nombre del Colaborador'].to_numpy(dtype=object)
+    problemas = []
+    for idx, k in zip(filas, ks):
+        rut = ruts[idx]
+        fi = esquema.fechas_iso[k]
+        val = df_output.iat[idx, esquema.posiciones[k]]
+        problemas.append({
+            'key': f"{rut}__{fi}",
+            'rut': rut,
+            'nombre': nombres[idx],
+            'fecha_iso': fi,
+            'fecha_display': esquema.columnas_fecha[k],
+            'rol': rol_por_celda.get((rut, fi), 'N/A'),
+            'turno_raw': val.replace('REVISAR:', '', 1),
+            'idx': int(idx),
+            'col': esquema.columnas_fecha[k],
+            'pos': esquema.posiciones[k],
+        })
+    return problemas
+
+
+def estado_colaboradores(df_output, esquema, df_con_match):
+    """
+    Clasifica cada fila como: OK / sin datos / con errores (REVISAR).
+    Retorna DataFrame [idx_original, RUT, Nombre, Área, Supervisor, Estado, Detalle].
+    """
+    n_revisar = mascara_revisar(df_output, esquema).sum(axis=1)
+    n_turnos = df_output['RUT'].map(df_con_match.groupby('RUT').size()).fillna(0).astype(int).to_numpy()
+    
+    estados = np.where(
+        n_turnos == 0, "⚠️ Sin datos 360",
+        np.where(n_revisar > 0, [f"🔴 {n} turnos con error" for n in n_revisar], "✅ OK")
+    )
+    detalles = np.where(
+        n_turnos == 0, "no tiene registros en el archivo 360",
+        np.where(
+            n_revisar > 0,
+            [f"{n} celdas con formato no reconocido" for n in n_revisar],
+            [f"{n} turnos cargados correctamente" for n in n_turnos],
+        )
+    )
+    vacia = pd.Series('', index=df_output.index)
+    return pd.DataFrame({
+        'idx_original': df_output.index,
+        'RUT': df_output['RUT'],
+        'Nombre': df_output['Nombre del Colaborador'],
+        'Área': df_output['Área'] if 'Área' in df_output.columns else vacia,
+        'Supervisor': df_output['Supervisor'] if 'Supervisor' in df_output.columns else vacia,
+        'Estado': estados,
+        'Detalle': detalles,
+    })
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# FLUJO COMPLETO SIN INTERFAZ
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def bukizar(bytes_360, buk_bytes, buk_nombre, hojas=None, catalogo=None, tolerancia=TOLERANCIA_SUGERIDA, formato='auto',
+            correcciones_nombres=None, resoluciones=None, progreso=None, cancelado=None):
+    """
+    Carga, codificación, llenado y escritura del importador en una sola
+    llamada, con las mismas reglas que la app. Sin `hojas` se procesan
+    todas las del 360.
+    `correcciones_nombres` ({nombre 360: nombre BUK}) completa el matching y
+    `resoluciones` ({key de problema: {'tipo': ...}}) hace de panel de
+    turnos no codificados; los problemas sin resolución quedan como REVISAR.
+    Retorna dict con el importador (bytes y extensión), los problemas, un
+    resumen y el registro de métricas (modo 'bukizar'), que además se emite.
+    """
+    metricas = RegistroMetricas('bukizar')
+    
+    def _progreso_carga(etapa, detalle, fraccion):
+        if etapa != 'Listo':
+            _avisar(progreso, etapa, detalle, fraccion * 0.7)
+    
+    if hojas is None:
+        hojas = pd.ExcelFile(io.BytesIO(bytes_360)).sheet_names
+    carga = procesar_carga(
+        bytes_360, buk_bytes, buk_nombre, hojas, _progreso_carga, cancelado, catalogo=catalogo, metricas=metricas,
+    )
+    # Misma regla de catálogo (solo CSV) que la carga: misma clave de caché, un solo parseo
+    plantilla, _ = obtener_plantillas([(buk_bytes, buk_nombre)], catalogo)
+    
+    mapa_nombres = carga['mapa_nombres']
+    if correcciones_nombres:
+        desconocidos = set(correcciones_nombres.values()) - set(plantilla.nombres)
+        if desconocidos:
+            raise ValueError(f"Correcciones con nombres que no están en el importador BUK: {', '.join(sorted(desconocidos))}")
+        mapa_nombres.update(correcciones_nombres)
+        carga['estrategias_nombres'].update(dict.fromkeys(correcciones_nombres, 'manual'))
+    nombres_sin_match = [n for n in carga['pendientes'] if n not in mapa_nombres]
+    metricas.matching(carga['estrategias_nombres'], nombres_sin_match)
+    
+    _avisar(progreso, 'Codificación de turnos', '', 0.75)
+    aproximados = {}
+    with metricas.etapa('codificacion'):
+        df_con_match, _ = codificar_con_match(
+            carga['df_all_turnos'], mapa_nombres, plantilla, tolerancia=tolerancia, aproximados=aproximados,
+        )
+    _verificar_cancelacion(cancelado)
+    
+    _avisar(progreso, 'Llenado de plantilla', f"{len(plantilla.df_data)} colaboradores", 0.85)
+    resoluciones = resoluciones or {}
+    with metricas.etapa('llenado'):
+        df_output = llenar_plantilla(plantilla.df_data, plantilla.esquema, df_con_match)
+    with metricas.etapa('problemas'):
+        problemas = detectar_problemas(df_output, plantilla.esquema, df_con_match)
+        ruts_omitidos = aplicar_resoluciones(df_output, problemas, resoluciones)
+    incluir = ~df_output['RUT'].isin(ruts_omitidos)
+    _verificar_cancelacion(cancelado)
+    
+    _avisar(progreso, 'Escritura del importador', formato, 0.9)
+    with metricas.etapa('exportacion'):
+        datos, ext = generar_importador(plantilla, df_output, incluir, formato)
+    
+    metricas.registrar(
+        tolerancia=tolerancia, formato=ext, problemas=len(problemas),
+        colaboradores=int(incluir.sum()), colaboradores_omitidos=len(ruts_omitidos),
+        turnos={**resumen_turnos(df_con_match), 'aproximadas': int(resumen_aproximados(
+            df_con_match['Turno_Raw'], df_con_match['Rol'], aproximados)['Celdas'].sum())},
+    )
+    metricas.emitir()
+    
+    _avisar(progreso, 'Listo', '', 1.0)
+    return {
+        'importador': datos,
+        'formato': ext,
+        'problemas': [
+            {
+                'key': p['key'], 'rut': p['rut'], 'nombre': p['nombre'], 'fecha': p['fecha_iso'],
+                'rol': p['rol'], 'turno': p['turno_raw'],
+                'resolucion': resoluciones.get(p['key'], {'tipo': 'bdmaestra'})['tipo'],
+            }
+            for p in problemas
+        ],
+        'nombres_sin_match': nombres_sin_match,
+        'resumen': {
+            'hojas': list(hojas),
+            'colaboradores': int(incluir.sum()),
+            'colaboradores_omitidos': len(ruts_omitidos),
+            'turnos': len(df_con_match),
+            'problemas': len(problemas),
+        },
+        'metricas': metricas.datos,
+    }
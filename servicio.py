@@ -0,0 +1,359 @@
+"""
+Servicio HTTP local para BUKizar sin pasar por la página de Streamlit.
+
+    python servicio.py [--host 127.0.0.1] [--puerto 8765] [--hilos 2] [--cola 8]
+
+Endpoints (JSON; los archivos viajan en base64):
+
+    POST   /trabajos                   → 202 {"id", "estado", "url"}; 503 si la cola está llena
+    GET    /trabajos/<id>              → estado, etapa, avance y resumen
+    GET    /trabajos/<id>/importador   → archivo final (409 si aún no termina)
+    GET    /trabajos/<id>/problemas    → celdas no codificadas y nombres sin match
+    DELETE /trabajos/<id>              → pide la cancelación
+    GET    /salud                      → hilos, cola y caché de plantillas
+
+Los trabajos corren en un pool acotado de hilos que toman de una cola
+también acotada. La plantilla BUK se parsea una vez y se comparte entre
+trabajos vía la caché de plantillas, igual que entre sesiones de la app.
+"""
+import argparse
+import base64
+import binascii
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cache_plantillas import CACHE_PLANTILLAS
+from exportar import FORMATOS_EXCEL
+from indice_siglas import TOLERANCIA_SUGERIDA
+from pipeline import bukizar
+from trabajos import Trabajo
+
+HILOS = int(os.environ.get('BUKIZADOR_SERVICIO_HILOS', '2'))
+MAX_COLA = int(os.environ.get('BUKIZADOR_SERVICIO_COLA', '8'))
+MAX_RETENIDOS = 100         # trabajos terminados que se conservan para consulta
+MAX_CUERPO = 200 * 1024 * 1024
+
+TIPOS_CONTENIDO = {
+    'csv': 'text/csv',
+    'xls': 'application/vnd.ms-excel',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class ColaLlena(Exception):
+    """No hay cupo en la cola de trabajos."""
+
+
+class ErrorServicio(Exception):
+    """Respuesta de error del servicio (código HTTP y mensaje)."""
+
+    def __init__(self, codigo, mensaje):
+        super().__init__(f"{codigo}: {mensaje}")
+        self.codigo = codigo
+        self.mensaje = mensaje
+
+
+class ServicioTrabajos:
+    """Pool de `hilos` trabajadores sobre una cola de a lo más `max_cola` trabajos en espera."""
+
+    def __init__(self, hilos=HILOS, max_cola=MAX_COLA, max_retenidos=MAX_RETENIDOS):
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._trabajos = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_retenidos = max_retenidos
+        self._hilos = [
+            threading.Thread(target=self._trabajador, name=f"servicio-{i}", daemon=True)
+            for i in range(hilos)
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def _trabajador(self):
+        while True:
+            trabajo = self._cola.get()
+            if trabajo is None:
+                return
+            try:
+                trabajo.ejecutar()
+            finally:
+                self._cola.task_done()
+
+    def enviar(self, funcion, *args, **kwargs):
+        """Encola un Trabajo nuevo; ColaLlena si no hay cupo."""
+        trabajo = Trabajo(funcion, *args, **kwargs)
+        try:
+            self._cola.put_nowait(trabajo)
+        except queue.Full:
+            raise ColaLlena() from None
+        with self._lock:
+            self._trabajos[trabajo.id] = trabajo
+            self._purgar()
+        return trabajo
+
+    def _purgar(self):
+        """Olvida los trabajos terminados más antiguos sobre el máximo retenido."""
+        terminados = [t_id for t_id, t in self._trabajos.items() if not t.activo]
+        for t_id in terminados[:max(0, len(terminados) - self.max_retenidos)]:
+            del self._trabajos[t_id]
+
+    def obtener(self, trabajo_id):
+        with self._lock:
+            return self._trabajos.get(trabajo_id)
+
+    def estadisticas(self):
+        with self._lock:
+            activos = sum(t.activo for t in self._trabajos.values())
+        return {
+            'hilos': len(self._hilos),
+            'en_cola': self._cola.qsize(),
+            'max_cola': self._cola.maxsize,
+            'activos': activos,
+            'cache_plantillas': CACHE_PLANTILLAS.estadisticas(),
+        }
+
+    def detener(self):
+        """Termina los hilos cuando acaban los trabajos ya encolados."""
+        for _ in self._hilos:
+            self._cola.put(None)
+        for hilo in self._hilos:
+            hilo.join()
+
+
+def _b64(payload, campo, obligatorio=True):
+    valor = payload.get(campo)
+    if valor is None:
+        if obligatorio:
+            raise ValueError(f"Falta el campo '{campo}'.")
+        return None
+    try:
+        return base64.b64decode(valor, validate=True)
+    except (binascii.Error, TypeError):
+        raise ValueError(f"'{campo}' no es base64 válido.") from None
+
+
+def argumentos_trabajo(payload):
+    """Traduce el JSON de POST /trabajos a (args, kwargs) de pipeline.bukizar."""
+    if not isinstance(payload, dict):
+        raise ValueError("El cuerpo debe ser un objeto JSON.")
+    bytes_360 = _b64(payload, 'turnos_360')
+    buk_bytes = _b64(payload, 'importador')
+    buk_nombre = payload.get('importador_nombre') or 'importador.xls'
+    catalogo = _b64(payload, 'catalogo', obligatorio=False)
+    hojas = payload.get('hojas')
+    if hojas is not None and (not isinstance(hojas, list) or not hojas or not all(isinstance(h, str) for h in hojas)):
+        raise ValueError("'hojas' debe ser una lista no vacía de nombres de hoja.")
+    tolerancia = payload.get('tolerancia', TOLERANCIA_SUGERIDA)
+    if isinstance(tolerancia, bool) or not isinstance(tolerancia, int) or tolerancia < 0:
+        raise ValueError("'tolerancia' debe ser un entero de minutos mayor o igual a 0.")
+    formato = payload.get('formato', 'auto')
+    if formato not in FORMATOS_EXCEL:
+        raise ValueError(f"'formato' debe ser uno de: {', '.join(FORMATOS_EXCEL)}.")
+    kwargs = {
+        'hojas': hojas,
+        'catalogo': (catalogo, payload.get('catalogo_nombre') or 'catalogo.xls') if catalogo is not None else None,
+        'tolerancia': tolerancia,
+        'formato': formato,
+        'correcciones_nombres': payload.get('correcciones_nombres'),
+        'resoluciones': payload.get('resoluciones'),
+    }
+    return (bytes_360, buk_bytes, buk_nombre), kwargs
+
+
+def estado_trabajo(trabajo):
+    """Vista JSON de un trabajo."""
+    estado = {
+        'id': trabajo.id,
+        'estado': trabajo.estado,
+        'etapa': trabajo.etapa,
+        'detalle': trabajo.detalle,
+        'fraccion': trabajo.fraccion,
+    }
+    if trabajo.estado == 'error':
+        estado['error'] = str(trabajo.error)
+    if trabajo.estado == 'terminado':
+        estado['formato'] = trabajo.resultado['formato']
+        estado['resumen'] = trabajo.resultado['resumen']
+        estado['nombres_sin_match'] = trabajo.resultado['nombres_sin_match']
+        estado['metricas'] = trabajo.resultado['metricas']
+    return estado
+
+
+class ManejadorBukizador(BaseHTTPRequestHandler):
+    """Rutas del servicio; `self.server.servicio` es el ServicioTrabajos."""
+
+    server_version = 'BUKizador/3'
+
+    def _responder(self, codigo, cuerpo, tipo='application/json', cabeceras=None):
+        if tipo == 'application/json':
+            cuerpo = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+            tipo = 'application/json; charset=utf-8'
+        self.send_response(codigo)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _error(self, codigo, mensaje, cabeceras=None):
+        self._responder(codigo, {'error': mensaje}, cabeceras=cabeceras)
+
+    def _trabajo_de_ruta(self, partes):
+        trabajo = self.server.servicio.obtener(partes[1])
+        if trabajo is None:
+            self._error(404, f"No existe el trabajo '{partes[1]}'.")
+        return trabajo
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/trabajos':
+            return self._error(404, "Ruta desconocida.")
+        try:
+            largo = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            largo = -1
+        if largo < 0:
+            return self._error(400, "Content-Length inválido.")
+        if largo > MAX_CUERPO:
+            return self._error(413, f"El cuerpo supera {MAX_CUERPO // 1024**2} MB.")
+        try:
+            args, kwargs = argumentos_trabajo(json.loads(self.rfile.read(largo) or b'null'))
+        except (ValueError, TypeError) as e:   # json.JSONDecodeError es ValueError
+            return self._error(400, str(e))
+        try:
+            trabajo = self.server.servicio.enviar(bukizar, *args, **kwargs)
+        except ColaLlena:
+            return self._error(503, "La cola de trabajos está llena; reintenta más tarde.", {'Retry-After': '5'})
+        self._responder(202, {'id': trabajo.id, 'estado': trabajo.estado, 'url': f"/trabajos/{trabajo.id}"})
+
+    def do_GET(self):
+        partes = self.path.strip('/').split('/')
+        if partes == ['salud']:
+            return self._responder(200, self.server.servicio.estadisticas())
+        if partes[0] != 'trabajos' or len(partes) not in (2, 3):
+            return self._error(404, "Ruta desconocida.")
+        trabajo = self._trabajo_de_ruta(partes)
+        if trabajo is None:
+            return
+        if len(partes) == 2:
+            return self._responder(200, estado_trabajo(trabajo))
+        if trabajo.estado != 'terminado':
+            return self._error(409, f"El trabajo está '{trabajo.estado}'.")
+        if partes[2] == 'importador':
+            ext = trabajo.resultado['formato']
+            return self._responder(
+                200, trabajo.resultado['importador'], TIPOS_CONTENIDO[ext],
+                {'Content-Disposition': f'attachment; filename="Importador_BUK_Cargado.{ext}"'},
+            )
+        if partes[2] == 'problemas':
+            return self._responder(200, {
+                'problemas': trabajo.resultado['problemas'],
+                'nombres_sin_match': trabajo.resultado['nombres_sin_match'],
+            })
+        self._error(404, "Ruta desconocida.")
+
+    def do_DELETE(self):
+        partes = self.path.strip('/').split('/')
+        if partes[0] != 'trabajos' or len(partes) != 2:
+            return self._error(404, "Ruta desconocida.")
+        trabajo = self._trabajo_de_ruta(partes)
+        if trabajo is not None:
+            trabajo.cancelar()
+            self._responder(202, estado_trabajo(trabajo))
+
+
+def crear_servidor(host='127.0.0.1', puerto=8765, hilos=HILOS, max_cola=MAX_COLA):
+    """ThreadingHTTPServer con su ServicioTrabajos (puerto 0 = uno libre)."""
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorBukizador)
+    servidor.daemon_threads = True
+    servidor.servicio = ServicioTrabajos(hilos, max_cola)
+    return servidor
+
+
+class ClienteBukizador:
+    """Cliente mínimo del servicio, solo con la biblioteca estándar."""
+
+    def __init__(self, url='http://127.0.0.1:8765'):
+        self.url = url.rstrip('/')
+
+    def _pedir(self, metodo, ruta, cuerpo=None):
+        datos = json.dumps(cuerpo).encode('utf-8') if cuerpo is not None else None
+        pedido = urllib.request.Request(
+            self.url + ruta, data=datos, method=metodo, headers={'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(pedido) as respuesta:
+                contenido = respuesta.read()
+                if respuesta.headers.get_content_type() == 'application/json':
+                    return json.loads(contenido)
+                return contenido
+        except urllib.error.HTTPError as e:
+            try:
+                mensaje = json.loads(e.read())['error']
+            except (ValueError, KeyError):
+                mensaje = e.reason
+            raise ErrorServicio(e.code, mensaje) from None
+
+    def enviar(self, ruta_360, ruta_importador, ruta_catalogo=None, **opciones):
+        """Sube los archivos y retorna el id del trabajo. `opciones` = hojas, tolerancia, formato, ..."""
+        cuerpo = dict(opciones)
+        with open(ruta_360, 'rb') as f:
+            cuerpo['turnos_360'] = base64.b64encode(f.read()).decode('ascii')
+        with open(ruta_importador, 'rb') as f:
+            cuerpo['importador'] = base64.b64encode(f.read()).decode('ascii')
+        cuerpo['importador_nombre'] = os.path.basename(ruta_importador)
+        if ruta_catalogo:
+            with open(ruta_catalogo, 'rb') as f:
+                cuerpo['catalogo'] = base64.b64encode(f.read()).decode('ascii')
+            cuerpo['catalogo_nombre'] = os.path.basename(ruta_catalogo)
+        return self._pedir('POST', '/trabajos', cuerpo)['id']
+
+    def estado(self, trabajo_id):
+        return self._pedir('GET', f"/trabajos/{trabajo_id}")
+
+    def esperar(self, trabajo_id, intervalo=0.5, timeout=600):
+        """Consulta el estado hasta que el trabajo deja de estar activo."""
+        for _ in range(int(timeout / intervalo)):
+            estado = self.estado(trabajo_id)
+            if estado['estado'] not in ('pendiente', 'ejecutando'):
+                return estado
+            time.sleep(intervalo)
+        raise TimeoutError(f"El trabajo {trabajo_id} no terminó en {timeout} s.")
+
+    def importador(self, trabajo_id):
+        return self._pedir('GET', f"/trabajos/{trabajo_id}/importador")
+
+    def problemas(self, trabajo_id):
+        return self._pedir('GET', f"/trabajos/{trabajo_id}/problemas")
+
+    def cancelar(self, trabajo_id):
+        return self._pedir('DELETE', f"/trabajos/{trabajo_id}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP local del BUKizador.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--hilos', type=int, default=HILOS, help="Trabajos en paralelo")
+    parser.add_argument('--cola', type=int, default=MAX_COLA, help="Trabajos en espera antes de responder 503")
+    args = parser.parse_args(argv)
+
+    servidor = crear_servidor(args.host, args.puerto, args.hilos, args.cola)
+    print(f"BUKizador escuchando en http://{args.host}:{servidor.server_address[1]} "
+          f"({args.hilos} hilos, cola de {args.cola})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Datos pesados de cada sesión de la app, fuera de `st.session_state`.
+
+Una pestaña abandonada deja sus DataFrames en memoria hasta que Streamlit
+descarta la sesión. En vez de guardarlos directo en la sesión, la app guarda
+un `DatoSesion`: una referencia liviana a una entrada de este gestor, que
+lleva la cuenta de lo que ocupa cada dato y:
+
+* vuelca a disco (pickle en un directorio temporal local) lo que lleva más
+  de `inactividad` segundos sin usarse, revisado por un hilo de fondo;
+* si la memoria de todas las sesiones supera `max_bytes`, vuelca primero los
+  datos usados hace más tiempo;
+* recarga el dato en cuanto la sesión vuelve a pedirlo (`dato.valor`);
+* borra entrada y archivo cuando la sesión muere (el `DatoSesion` deja de
+  existir) o tras `retencion` segundos sin uso.
+
+Un error de disco nunca rompe una sesión: el dato simplemente sigue en memoria.
+"""
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+
+from cache_plantillas import estimar_tamano
+
+# Un dato usado hace menos de esto no se vuelca por el tope: puede estar en uso en un rerun
+GRACIA_SEGUNDOS = 30
+
+
+class DatoExpirado(RuntimeError):
+    """El dato de la sesión se borró por inactividad (o su archivo ya no existe)."""
+
+
+class DatoSesion:
+    """Referencia a un dato del gestor; es lo que se guarda en `st.session_state`."""
+    __slots__ = ('clave', 'tamano', '_gestor', '__weakref__')
+
+    def __init__(self, gestor, clave, tamano):
+        self.clave = clave
+        self.tamano = tamano
+        self._gestor = gestor
+
+    @property
+    def valor(self):
+        """El dato, recargado desde disco si había sido volcado."""
+        return self._gestor.obtener(self.clave)
+
+
+class GestorSesiones:
+    """Datos de sesión con tope global de memoria, volcado a disco y recarga transparente."""
+
+    def __init__(self, raiz, max_bytes, inactividad, retencion):
+        self.raiz = raiz
+        self.max_bytes = max_bytes
+        self.inactividad = inactividad
+        self.retencion = retencion
+        self._entradas = {}   # clave → {'valor', 'bytes', 'acceso', 'ruta'}; valor None = en disco
+        self._bytes = 0       # solo lo que está en memoria
+        self._lock = threading.Lock()
+        self._barrido = None
+        self.volcados = 0
+        self.recargas = 0
+        self.expirados = 0
+
+    def _ruta(self, clave):
+        return os.path.join(self.raiz, f"{clave}.pkl")
+
+    def guardar(self, valor):
+        """Registra un dato nuevo y retorna su `DatoSesion`."""
+        self._iniciar_barrido()
+        clave = uuid.uuid4().hex
+        tamano = estimar_tamano(valor)
+        with self._lock:
+            self._entradas[clave] = {'valor': valor, 'bytes': tamano, 'acceso': time.monotonic(), 'ruta': None}
+            self._bytes += tamano
+        dato = DatoSesion(self, clave, tamano)
+        weakref.finalize(dato, self.liberar, clave)
+        self._respetar_tope()
+        return dato
+
+    def obtener(self, clave):
+        """Valor de una entrada (marcándola como usada); lo recarga de disco si hace falta."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                raise DatoExpirado("Los datos de esta sesión expiraron por inactividad. Presiona 'Comenzar de nuevo'.")
+            entrada['acceso'] = time.monotonic()
+            if entrada['valor'] is not None:
+                return entrada['valor']
+            ruta = entrada['ruta']
+        try:
+            with open(ruta, 'rb') as f:
+                valor = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            self.liberar(clave)
+            raise DatoExpirado(f"No se pudieron recuperar los datos de esta sesión ({e}). Presiona 'Comenzar de nuevo'.")
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                raise DatoExpirado("Los datos de esta sesión expiraron por inactividad. Presiona 'Comenzar de nuevo'.")
+            if entrada['valor'] is None:
+                entrada['valor'] = valor
+                entrada['ruta'] = None
+                self._bytes += entrada['bytes']
+                self.recargas += 1
+            valor = entrada['valor']
+        _borrar(ruta)
+        self._respetar_tope()
+        return valor
+
+    def liberar(self, clave):
+        """Olvida una entrada y borra su archivo (la sesión ya no la referencia)."""
+        with self._lock:
+            entrada = self._entradas.pop(clave, None)
+            if entrada is not None and entrada['valor'] is not None:
+                self._bytes -= entrada['bytes']
+        _borrar(self._ruta(clave))
+
+    def _volcar(self, clave):
+        """Escribe la entrada a disco y suelta la copia en memoria (salvo que se haya usado mientras)."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada['valor'] is None:
+                return
+            valor, acceso = entrada['valor'], entrada['acceso']
+        ruta = self._ruta(clave)
+        temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(self.raiz, exist_ok=True)
+            with open(temporal, 'wb') as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, ruta)
+        except (OSError, pickle.PicklingError):
+            _borrar(temporal)
+            return
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                liberada = True
+            else:
+                liberada = False
+                if entrada['valor'] is valor and entrada['acceso'] == acceso:
+                    entrada['valor'] = None
+                    entrada['ruta'] = ruta
+                    self._bytes -= entrada['bytes']
+                    self.volcados += 1
+        if liberada:
+            _borrar(ruta)
+
+    def _respetar_tope(self):
+        """Vuelca las entradas usadas hace más tiempo hasta quedar bajo `max_bytes`."""
+        while True:
+            with self._lock:
+                if self._bytes <= self.max_bytes:
+                    return
+                limite = time.monotonic() - GRACIA_SEGUNDOS
+                candidatas = [
+                    (e['acceso'], clave) for clave, e in self._entradas.items()
+                    if e['valor'] is not None and e['acceso'] < limite
+                ]
+            if not candidatas:
+                return
+            self._volcar(min(candidatas)[1])
+
+    def barrer(self):
+        """Vuelca lo inactivo y olvida lo que superó la retención."""
+        ahora = time.monotonic()
+        with self._lock:
+            inactivas = [c for c, e in self._entradas.items() if e['valor'] is not None and ahora - e['acceso'] > self.inactividad]
+            vencidas = [c for c, e in self._entradas.items() if ahora - e['acceso'] > self.retencion]
+        for clave in vencidas:
+            self.liberar(clave)
+            self.expirados += 1
+        for clave in inactivas:
+            if clave not in vencidas:
+                self._volcar(clave)
+        self._respetar_tope()
+
+    def _iniciar_barrido(self):
+        """Hilo de fondo que barre periódicamente; al iniciarlo se limpian restos de procesos anteriores."""
+        with self._lock:
+            if self._barrido is not None:
+                return
+            self._barrido = threading.Thread(target=self._barrer_siempre, name='barrido-sesiones', daemon=True)
+        self._limpiar_huerfanos()
+        self._barrido.start()
+
+    def _barrer_siempre(self):
+        intervalo = max(1.0, min(60.0, self.inactividad / 2))
+        while True:
+            time.sleep(intervalo)
+            self.barrer()
+
+    def _limpiar_huerfanos(self):
+        """Borra volcados de procesos que ya no existen (más antiguos que la retención)."""
+        limite = time.time() - self.retencion
+        try:
+            with os.scandir(self.raiz) as it:
+                for e in it:
+                    if e.name.endswith(('.pkl', '.tmp')) and e.stat().st_mtime < limite:
+                        _borrar(e.path)
+        except OSError:
+            pass
+
+    def estadisticas(self):
+        """Contadores de uso para mostrar en la interfaz."""
+        with self._lock:
+            en_memoria = sum(1 for e in self._entradas.values() if e['valor'] is not None)
+            return {
+                'entradas': len(self._entradas),
+                'en_memoria': en_memoria,
+                'en_disco': len(self._entradas) - en_memoria,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'volcados': self.volcados,
+                'recargas': self.recargas,
+                'expirados': self.expirados,
+            }
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except OSError:
+        pass
+
+
+SESIONES = GestorSesiones(
+    os.environ.get('BUKIZADOR_SESIONES_DIR', os.path.join(tempfile.gettempdir(), 'bukizador_sesiones')),
+    int(os.environ.get('BUKIZADOR_SESIONES_MB', '256')) * 1024 * 1024,
+    float(os.environ.get('BUKIZADOR_SESIONES_INACTIVIDAD_MIN', '10')) * 60,
+    float(os.environ.get('BUKIZADOR_SESIONES_RETENCION_H', '24')) * 3600,
+)
@@ -0,0 +1,149 @@
+"""
+Snapshots en disco de hojas 360 ya parseadas.
+
+Cada hoja parseada (formato largo: Nombre_Input, Fecha, Turno_Raw, Rol,
+Hoja, Mes_Hoja) se guarda en un directorio con un arreglo numpy de
+códigos por columna más sus categorías en `meta.json`. Al recargar, los
+códigos se abren con memory-map y se expanden con un solo `take`, sin
+volver a decodificar el Excel. El directorio tiene tope de tamaño y
+desaloja los snapshots menos usados.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+COLUMNAS_TEXTO = ['Nombre_Input', 'Fecha', 'Turno_Raw', 'Rol', 'Hoja']
+
+
+def _codificar(serie):
+    """(códigos int32 con -1 para nulos, lista de categorías) de una columna."""
+    valores = np.array([None if pd.isna(v) else str(v) for v in serie], dtype=object)
+    codigos, categorias = pd.factorize(valores, use_na_sentinel=True)
+    return codigos.astype(np.int32), [str(c) for c in categorias]
+
+
+def _decodificar(codigos, categorias):
+    """Inverso de `_codificar`: el -1 cae en el None agregado al final."""
+    tabla = np.empty(len(categorias) + 1, dtype=object)
+    tabla[:len(categorias)] = categorias
+    tabla[-1] = None
+    return tabla[np.asarray(codigos)]
+
+
+class SnapshotsTurnos:
+    """Directorio de snapshots con tope de bytes y desalojo LRU por mtime."""
+
+    def __init__(self, raiz, max_bytes):
+        self.raiz = raiz
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _ruta(self, clave):
+        return os.path.join(self.raiz, clave)
+
+    def meta(self, clave):
+        """Metadatos del snapshot (filas, rango de fechas) o None si no existe."""
+        try:
+            with open(os.path.join(self._ruta(clave), 'meta.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def cargar(self, clave):
+        """DataFrame guardado bajo `clave`, o None si no hay snapshot válido."""
+        meta = self.meta(clave)
+        if meta is None:
+            return None
+        ruta = self._ruta(clave)
+        try:
+            if meta['filas'] == 0:
+                df = pd.DataFrame()
+            else:
+                datos = {}
+                for col in COLUMNAS_TEXTO:
+                    codigos = np.load(os.path.join(ruta, f"{col}.npy"), mmap_mode='r')
+                    datos[col] = _decodificar(codigos, meta['categorias'][col])
+                mes = np.load(os.path.join(ruta, 'Mes_Hoja.npy'), mmap_mode='r')
+                if (mes < 0).any():
+                    datos['Mes_Hoja'] = np.where(mes < 0, np.nan, mes).astype(float)
+                else:
+                    datos['Mes_Hoja'] = np.asarray(mes, dtype=np.int64)
+                df = pd.DataFrame(datos)
+            os.utime(os.path.join(ruta, 'meta.json'))
+            return df
+        except (OSError, ValueError, KeyError):
+            # Snapshot corrupto o de otra versión: se descarta y se re-parsea
+            shutil.rmtree(ruta, ignore_errors=True)
+            return None
+
+    def guardar(self, clave, df):
+        """
+        Escribe el snapshot de forma atómica (directorio temporal + rename).
+        Un disco lleno o sin permisos no interrumpe el procesamiento: el
+        snapshot simplemente no queda guardado.
+        """
+        tmp = os.path.join(self.raiz, f".tmp-{uuid.uuid4().hex}")
+        try:
+            os.makedirs(tmp)
+            meta = {'filas': int(len(df)), 'categorias': {}}
+            if len(df):
+                for col in COLUMNAS_TEXTO:
+                    codigos, categorias = _codificar(df[col])
+                    np.save(os.path.join(tmp, f"{col}.npy"), codigos)
+                    meta['categorias'][col] = categorias
+                mes = pd.to_numeric(df['Mes_Hoja'], errors='coerce').fillna(-1).to_numpy(dtype=np.int16)
+                np.save(os.path.join(tmp, 'Mes_Hoja.npy'), mes)
+                fechas = df['Fecha'].dropna()
+                meta['fecha_min'] = str(fechas.min())
+                meta['fecha_max'] = str(fechas.max())
+                meta['n_fechas'] = int(fechas.nunique())
+            with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            try:
+                os.rename(tmp, self._ruta(clave))
+            except OSError:
+                # Otra sesión escribió la misma clave primero
+                shutil.rmtree(tmp, ignore_errors=True)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.desalojar()
+
+    def desalojar(self):
+        """Borra los snapshots menos usados hasta quedar bajo `max_bytes`."""
+        with self._lock:
+            try:
+                nombres = [n for n in os.listdir(self.raiz) if not n.startswith('.')]
+            except OSError:
+                return
+            entradas = []
+            total = 0
+            for nombre in nombres:
+                ruta = os.path.join(self.raiz, nombre)
+                try:
+                    tamano = sum(e.stat().st_size for e in os.scandir(ruta))
+                    uso = os.stat(os.path.join(ruta, 'meta.json')).st_mtime
+                except OSError:
+                    continue
+                entradas.append((uso, tamano, ruta))
+                total += tamano
+            for _, tamano, ruta in sorted(entradas):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(ruta, ignore_errors=True)
+                total -= tamano
+
+
+SNAPSHOTS = SnapshotsTurnos(
+    os.environ.get('BUKIZADOR_SNAPSHOTS_DIR', os.path.join(tempfile.gettempdir(), 'bukizador_snapshots')),
+    int(os.environ.get('BUKIZADOR_SNAPSHOTS_MB', '256')) * 1024 * 1024,
+)
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Los módulos viven en la raíz del repo; cachés y métricas van a un directorio temporal
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_TMP = tempfile.mkdtemp(prefix='bukizador_tests_')
+os.environ.setdefault('BUKIZADOR_SNAPSHOTS_DIR', os.path.join(_TMP, 'snapshots'))
+os.environ.setdefault('BUKIZADOR_SESIONES_DIR', os.path.join(_TMP, 'sesiones'))
+os.environ.setdefault('BUKIZADOR_METRICAS_JSONL', '')
@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from cache_plantillas import CachePlantillas
+
+
+def test_carga_fallida_no_queda_en_curso():
+    cache = CachePlantillas(1024 * 1024)
+    intentos = []
+
+    def cargar():
+        intentos.append(1)
+        if len(intentos) == 1:
+            raise ValueError("importador corrupto")
+        return {'ok': True}
+
+    with pytest.raises(ValueError, match='corrupto'):
+        cache.obtener_o_cargar('k', cargar)
+    assert cache._cargando == {}
+    assert cache.obtener('k') is None
+
+    assert cache.obtener_o_cargar('k', cargar) == {'ok': True}
+    assert len(intentos) == 2
+    assert cache._cargando == {}
+
+
+def test_quien_esperaba_una_carga_fallida_la_reintenta():
+    cache = CachePlantillas(1024 * 1024)
+    cargando = threading.Event()
+    seguir = threading.Event()
+    resultados = {}
+
+    def cargar_falla():
+        cargando.set()
+        seguir.wait(5)
+        raise ValueError("importador corrupto")
+
+    def primera():
+        try:
+            cache.obtener_o_cargar('k', cargar_falla)
+        except ValueError as e:
+            resultados['primera'] = e
+
+    def segunda():
+        resultados['segunda'] = cache.obtener_o_cargar('k', lambda: 'plantilla')
+
+    h1 = threading.Thread(target=primera)
+    h1.start()
+    assert cargando.wait(5)
+    h2 = threading.Thread(target=segunda)
+    h2.start()
+    seguir.set()
+    h1.join(5)
+    h2.join(5)
+
+    assert isinstance(resultados['primera'], ValueError)
+    assert resultados['segunda'] == 'plantilla'
+    assert cache.obtener('k') == 'plantilla'
+    assert cache._cargando == {}
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pandas as pd
+
+from incremental import heredar_ejecucion
+
+PLANTILLA = SimpleNamespace(
+    nombres=['ANA PEREZ', 'LUIS SOTO'],
+    nombre_a_rut={'ANA PEREZ': '1-9', 'LUIS SOTO': '2-7'},
+)
+
+
+def _turnos(*filas):
+    return pd.DataFrame(
+        [(n, f, t, 'ANFITRION') for n, f, t in filas],
+        columns=['Nombre_Input', 'Fecha', 'Turno_Raw', 'Rol'],
+    )
+
+
+DF_PREV = _turnos(
+    ('Ana Perez', '2025-03-01', '08:00-19:00'),
+    ('Desconocido X', '2025-03-01', '08:00-19:00'),
+    ('Omitido Y', '2025-03-01', '08:00-19:00'),
+)
+DF_NUEVO = _turnos(
+    ('Ana Perez', '2025-03-01', '08:00-19:00'),
+    ('Desconocido X', '2025-03-01', '20:00-08:00'),
+    ('Omitido Y', '2025-03-01', '08:00-19:00'),
+    ('Nueva Z', '2025-03-02', '08:00-19:00'),
+)
+NOMBRES = DF_NUEVO['Nombre_Input'].unique().tolist()
+
+
+def test_pendientes_sin_resolver_vuelven_a_matching():
+    # Revisión pedida en 'correccion': 'Desconocido X' aún no tenía corrección
+    previa = {'df_all_turnos': DF_PREV, 'mapa_nombres': {'Ana Perez': 'ANA PEREZ'},
+              'pendientes': ['Desconocido X', 'Omitido Y']}
+    mapa, nuevos, _, reporte = heredar_ejecucion(previa, DF_NUEVO, NOMBRES, PLANTILLA, {})
+    assert mapa == {'Ana Perez': 'ANA PEREZ'}
+    assert nuevos == ['Desconocido X', 'Omitido Y', 'Nueva Z']
+    assert reporte['nombres_nuevos'] == nuevos
+
+
+def test_omitidos_tras_confirmar_no_se_vuelven_a_preguntar():
+    # Revisión pedida en 'descarga': quien quedó fuera del mapa se omitió a propósito
+    previa = {'df_all_turnos': DF_PREV, 'mapa_nombres': {'Ana Perez': 'ANA PEREZ', 'Desconocido X': 'LUIS SOTO'},
+              'pendientes': []}
+    mapa, nuevos, _, _ = heredar_ejecucion(previa, DF_NUEVO, NOMBRES, PLANTILLA, {})
+    assert mapa == {'Ana Perez': 'ANA PEREZ', 'Desconocido X': 'LUIS SOTO'}
+    assert nuevos == ['Nueva Z']
+
+
+def test_destino_que_ya_no_existe_vuelve_a_matching():
+    previa = {'df_all_turnos': DF_PREV, 'mapa_nombres': {'Ana Perez': 'ANA PEREZ', 'Desconocido X': 'EX EMPLEADO'}}
+    mapa, nuevos, _, _ = heredar_ejecucion(previa, DF_NUEVO, NOMBRES, PLANTILLA, {})
+    assert 'Desconocido X' not in mapa
+    assert nuevos == ['Desconocido X', 'Nueva Z']
+
+
+def test_resoluciones_de_celdas_tocadas_se_descartan():
+    previa = {
+        'df_all_turnos': DF_PREV,
+        'mapa_nombres': {'Ana Perez': 'ANA PEREZ', 'Desconocido X': 'LUIS SOTO'},
+        'resoluciones_problemas': {'1-9__2025-03-01': {'tipo': 'omitir'}, '2-7__2025-03-01': {'tipo': 'omitir'}},
+        'hashes_hojas': {'Marzo': 'a'},
+    }
+    _, _, resoluciones, reporte = heredar_ejecucion(previa, DF_NUEVO, NOMBRES, PLANTILLA, {'Marzo': 'b'})
+    assert resoluciones == {'1-9__2025-03-01': {'tipo': 'omitir'}}
+    assert reporte['modificadas'] == 1 and reporte['agregadas'] == 1
+    assert reporte['hojas_cambiadas'] == ['Marzo']
@@ -0,0 +1,76 @@
+import pytest
+
+from indice_siglas import IndiceSiglas, TOLERANCIA_SUGERIDA
+
+MAPA = {
+    ('08:00', '19:00', 'ANFITRION'): 'ANFDIU1',
+    ('08:00', '19:00', 'AGENTE'): 'AGEDIU1',
+    ('20:00', '08:00', 'ANFITRION'): 'ANFNOC1',
+    ('23:55', '06:00', 'AGENTE'): 'AGENOC2',
+    ('09:00', '18:00', 'COORDINADOR'): 'COO1',
+    ('09:04', '18:00', 'COORDINADOR'): 'COO2',
+    ('xx', '18:00', 'OTRO'): 'MALO',
+}
+
+
+@pytest.fixture(scope='module')
+def indice():
+    return IndiceSiglas(MAPA)
+
+
+def test_ignora_horarios_invalidos(indice):
+    # Horarios distintos del catálogo completo: 08:00-19:00 se repite en dos roles
+    assert len(indice) == 5
+
+
+def test_tolerancia_cero_no_busca(indice):
+    assert indice.buscar('08:00', '19:00', 'ANFITRION', 0) is None
+
+
+def test_borde_de_tolerancia(indice):
+    assert indice.buscar('08:10', '19:00', 'ANFITRION', 10) == ('ANFDIU1', 10)
+    assert indice.buscar('08:11', '19:00', 'ANFITRION', 10) is None
+    # El desvío es el mayor entre entrada y salida
+    assert indice.buscar('08:05', '19:11', 'ANFITRION', 10) is None
+
+
+def test_prefiere_el_rol(indice):
+    assert indice.buscar('08:05', '19:00', 'AGENTE', 10) == ('AGEDIU1', 5)
+    # Sin horario del rol cae al catálogo completo
+    assert indice.buscar('08:05', '19:00', 'SUPERVISOR', 10)[1] == 5
+
+
+def test_turno_nocturno_cruza_medianoche(indice):
+    assert indice.buscar('19:55', '08:05', 'ANFITRION', 10) == ('ANFNOC1', 5)
+    # 00:03 queda a 8 min de 23:55 (desplazado ±24 h)
+    assert indice.buscar('00:03', '06:00', 'AGENTE', 10) == ('AGENOC2', 8)
+
+
+def test_desempate_por_menor_desvio(indice):
+    assert indice.buscar('09:03', '18:00', 'COORDINADOR', 10) == ('COO2', 1)
+    assert indice.buscar('09:01', '18:00', 'COORDINADOR', 10) == ('COO1', 1)
+
+
+@pytest.mark.parametrize('entrada,salida', [('', '18:00'), (None, '18:00'), ('9h', '18:00')])
+def test_entradas_invalidas(indice, entrada, salida):
+    assert indice.buscar(entrada, salida, 'COORDINADOR', 10) is None
+
+
+def test_catalogo_vacio():
+    vacio = IndiceSiglas({})
+    assert len(vacio) == 0
+    assert vacio.buscar('08:00', '19:00', 'ANFITRION', 10) is None
+
+
+def test_misma_tolerancia_por_defecto_en_todas_las_entradas(monkeypatch):
+    # Un ensayo y la corrida real sobre los mismos archivos deben codificar igual
+    import inspect
+    import cli
+    from pipeline import bukizar, validar
+
+    assert inspect.signature(validar).parameters['tolerancia'].default == TOLERANCIA_SUGERIDA
+    assert inspect.signature(bukizar).parameters['tolerancia'].default == TOLERANCIA_SUGERIDA
+    recibidos = []
+    monkeypatch.setattr(cli, 'comando_validar', lambda args: recibidos.append(args.tolerancia) or 0)
+    assert cli.main(['validar', 'turnos.xlsx', 'importador.xls']) == 0
+    assert recibidos == [TOLERANCIA_SUGERIDA]
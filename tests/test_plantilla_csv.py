@@ -0,0 +1,60 @@
+import pytest
+
+from pipeline import leer_plantilla_csv, construir_esquema
+
+HEADER = 'Nombre del Colaborador;RUT;Área;Supervisor;01-03-2025;02-03-2025'
+
+
+def _csv(*lineas, fin='\r\n', encoding='utf-8'):
+    return fin.join(lineas).encode(encoding) + fin.encode(encoding)
+
+
+def test_separador_sobrante_al_final():
+    datos = _csv(
+        HEADER,
+        'ANA PEREZ;00012345-6;OPS;JEFE;;;',
+        'LUIS SOTO;7654321-K;OPS;JEFE;;;',
+    )
+    header, df, formato = leer_plantilla_csv(datos)
+    assert header == HEADER.split(';')
+    assert df.shape == (2, 6)
+    assert df['RUT'].tolist() == ['00012345-6', '7654321-K']   # texto, sin perder ceros
+    assert df['01-03-2025'].isna().all()
+    assert formato['delimitador'] == ';'
+    assert formato['fin_linea'] == '\r\n'
+
+
+def test_filas_cortas_se_completan():
+    header, df, _ = leer_plantilla_csv(_csv(HEADER, 'ANA PEREZ;1-9;OPS'))
+    assert df.shape == (1, 6)
+    assert df['Supervisor'].isna().all()
+
+
+def test_preambulo_y_latin1():
+    datos = _csv('Empresa: Aeropuerto', ';;;', HEADER, 'JOSÉ MUÑOZ;1-9;OPS;JEFE;;', fin='\n', encoding='latin-1')
+    header, df, formato = leer_plantilla_csv(datos)
+    assert formato['encoding'] == 'latin-1'
+    assert formato['fin_linea'] == '\n'
+    assert formato['preambulo'] == [['Empresa: Aeropuerto'], ['', '', '', '']]
+    assert df['Nombre del Colaborador'].tolist() == ['JOSÉ MUÑOZ']
+    assert construir_esquema(header).fechas_iso == ['2025-03-01', '2025-03-02']
+
+
+def test_coma_y_bom():
+    datos = '﻿' + HEADER.replace(';', ',') + '\nANA,1-9,OPS,JEFE,,\n'
+    header, df, formato = leer_plantilla_csv(datos.encode('utf-8'))
+    assert formato['delimitador'] == ','
+    assert formato['encoding'] == 'utf-8-sig'
+    assert header[0] == 'Nombre del Colaborador'
+    assert len(df) == 1
+
+
+def test_sin_filas_de_datos():
+    header, df, _ = leer_plantilla_csv(_csv(HEADER))
+    assert list(df.columns) == header
+    assert df.empty
+
+
+def test_sin_header():
+    with pytest.raises(ValueError, match='encabezado'):
+        leer_plantilla_csv(_csv('a;b;c', '1;2;3'))
@@ -0,0 +1,97 @@
+import pandas as pd
+
+from indice_siglas import IndiceSiglas
+from pipeline import (
+    COLUMNAS_FIJAS, PlantillaBUK, celdas_importador, combinar_plantillas, construir_esquema,
+    detectar_problemas, estado_colaboradores, llenar_plantilla, recortar_grilla,
+)
+
+
+def _plantilla(nombre, ruts, fechas):
+    """Importador mínimo: un colaborador por RUT y las fechas DD-MM-YYYY dadas."""
+    header = COLUMNAS_FIJAS + fechas
+    df = pd.DataFrame([[f"P{r}", r, 'OPS', 'JEFE'] + [None] * len(fechas) for r in ruts], columns=header, dtype=object)
+    return PlantillaBUK(
+        hash=nombre, nombre=nombre, is_xls=True, header=header, df_data=df,
+        nombres=df['Nombre del Colaborador'].tolist(),
+        nombre_a_rut=dict(zip(df['Nombre del Colaborador'], df['RUT'])),
+        mapa_siglas={}, indice_siglas=IndiceSiglas({}), esquema=construir_esquema(header),
+    )
+
+
+def _revisar_todo(combinada):
+    """Un turno no codificado por cada (RUT, fecha) de la plantilla combinada."""
+    return pd.DataFrame(
+        [(r, iso, 'Op', 'REVISAR:99:00-99:00') for r in combinada.df_data['RUT'] for iso in combinada.esquema.fechas_iso],
+        columns=['RUT', 'Fecha', 'Rol', 'Sigla'],
+    )
+
+
+def test_celdas_que_no_exporta_ningun_importador_no_son_problema():
+    # 'b' está en ambas: el 02-03 es último día de s1 pero primero de s2
+    s1 = _plantilla('s1', ['a', 'b'], ['01-03-2025', '02-03-2025'])
+    s2 = _plantilla('s2', ['b', 'c'], ['02-03-2025', '03-03-2025'])
+    combinada = combinar_plantillas([s1, s2], 'x')
+    df_con_match = _revisar_todo(combinada)
+
+    df_output = llenar_plantilla(combinada.df_data, combinada.esquema, df_con_match, combinada.celdas_fijas)
+    claves = {p['key'] for p in detectar_problemas(df_output, combinada.esquema, df_con_match)}
+
+    assert 'a__2025-03-02' not in claves   # último día de s1, único importador de 'a'
+    assert 'c__2025-03-03' not in claves   # último día de s2
+    assert 'b__2025-03-02' in claves       # s2 lo exporta tal cual
+    assert 'b__2025-03-03' not in claves
+    assert 'a__2025-03-03' not in claves   # fuera de los importadores de 'a'
+    assert 'c__2025-03-01' not in claves
+    assert claves == {'a__2025-03-01', 'b__2025-03-01', 'b__2025-03-02', 'c__2025-03-02'}
+    assert df_output.set_index('RUT').loc['a', '03-03-2025'] == 'L'
+
+    estado = estado_colaboradores(df_output, combinada.esquema, df_con_match).set_index('RUT')['Estado']
+    assert estado.to_dict() == {'a': '🔴 1 turnos con error', 'b': '🔴 2 turnos con error', 'c': '🔴 1 turnos con error'}
+
+    # Cada importador sigue recibiendo su último día en 'D'
+    grilla_s1 = recortar_grilla(df_output, combinada.esquema, s1).set_index('RUT')
+    assert grilla_s1['02-03-2025'].tolist() == ['D', 'D']
+    grilla_s2 = recortar_grilla(df_output, combinada.esquema, s2).set_index('RUT')
+    assert grilla_s2.loc['b', '02-03-2025'].startswith('REVISAR:')
+    assert grilla_s2['03-03-2025'].tolist() == ['D', 'D']
+
+
+def test_llenar_sin_turnos_deja_todo_libre():
+    # Ningún nombre del 360 tuvo match: la grilla sale en 'L' salvo el último día
+    s1 = _plantilla('s1', ['a', 'b'], ['01-03-2025', '02-03-2025'])
+    sin_turnos = pd.DataFrame(columns=['RUT', 'Fecha', 'Rol', 'Sigla'], dtype=object)
+    df_output = llenar_plantilla(s1.df_data, s1.esquema, sin_turnos)
+    assert df_output['01-03-2025'].tolist() == ['L', 'L']
+    assert df_output['02-03-2025'].tolist() == ['D', 'D']
+    assert detectar_problemas(df_output, s1.esquema, sin_turnos) == []
+
+
+def test_celdas_importador_cuenta_como_el_llenado():
+    s1 = _plantilla('s1', ['a', 'b'], ['01-03-2025', '02-03-2025', '03-03-2025'])
+    turnos = pd.DataFrame([
+        ('a', '2025-03-01', 'AGENTE', 'REVISAR:x'),
+        ('a', '2025-03-01', 'ANFITRION', 'REVISAR:y'),   # mismo día con otro rol: gana el primero
+        ('a', '2025-03-03', 'AGENTE', 'REVISAR:x'),      # último día: siempre 'D'
+        ('b', '2025-02-28', 'AGENTE', 'REVISAR:x'),      # fuera de la plantilla
+        ('b', '2025-03-02', 'AGENTE', 'AGE1'),
+        (None, '2025-03-02', 'AGENTE', 'REVISAR:x'),     # sin RUT
+    ], columns=['RUT', 'Fecha', 'Rol', 'Sigla'])
+    celdas = celdas_importador(turnos, s1)
+    assert list(zip(celdas['RUT'], celdas['Fecha'], celdas['Sigla'])) == [
+        ('a', '2025-03-01', 'REVISAR:x'), ('b', '2025-03-02', 'AGE1'),
+    ]
+    df_output = llenar_plantilla(s1.df_data, s1.esquema, turnos)
+    n_revisar = celdas['Sigla'].str.startswith('REVISAR:').sum()
+    assert n_revisar == len(detectar_problemas(df_output, s1.esquema, turnos))
+
+
+def test_celdas_importador_en_combinada_omite_celdas_fijas():
+    s1 = _plantilla('s1', ['a', 'b'], ['01-03-2025', '02-03-2025'])
+    s2 = _plantilla('s2', ['b', 'c'], ['02-03-2025', '03-03-2025'])
+    combinada = combinar_plantillas([s1, s2], 'x')
+    df_con_match = _revisar_todo(combinada)
+    celdas = celdas_importador(df_con_match, combinada)
+    df_output = llenar_plantilla(combinada.df_data, combinada.esquema, df_con_match, combinada.celdas_fijas)
+    claves = {p['key'] for p in detectar_problemas(df_output, combinada.esquema, df_con_match)}
+    assert {f"{r}__{f}" for r, f in zip(celdas['RUT'], celdas['Fecha'])} == claves
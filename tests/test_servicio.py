@@ -0,0 +1,121 @@
+import base64
+import datetime
+import http.client
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+from indice_siglas import TOLERANCIA_SUGERIDA
+from servicio import ClienteBukizador, ErrorServicio, argumentos_trabajo, crear_servidor
+
+
+def _payload(**extra):
+    datos = base64.b64encode(b'x').decode('ascii')
+    return {'turnos_360': datos, 'importador': datos, 'importador_nombre': 'buk.xls', **extra}
+
+
+def test_defaults_iguales_a_la_app():
+    args, kwargs = argumentos_trabajo(_payload())
+    assert args == (b'x', b'x', 'buk.xls')
+    assert kwargs['hojas'] is None
+    assert kwargs['tolerancia'] == TOLERANCIA_SUGERIDA
+
+
+def test_hojas_lista_de_textos():
+    _, kwargs = argumentos_trabajo(_payload(hojas=['Marzo', 'Abril']))
+    assert kwargs['hojas'] == ['Marzo', 'Abril']
+
+
+@pytest.mark.parametrize('hojas', ['Marzo', [], ['Marzo', 3], {'a': 1}])
+def test_hojas_invalidas(hojas):
+    with pytest.raises(ValueError, match='hojas'):
+        argumentos_trabajo(_payload(hojas=hojas))
+
+
+@pytest.mark.parametrize('tolerancia', [-1, '10', None, 2.5, True])
+def test_tolerancia_invalida(tolerancia):
+    with pytest.raises(ValueError, match='tolerancia'):
+        argumentos_trabajo(_payload(tolerancia=tolerancia))
+
+
+def test_campos_obligatorios_y_base64():
+    with pytest.raises(ValueError, match='importador'):
+        argumentos_trabajo({'turnos_360': 'eA=='})
+    with pytest.raises(ValueError, match='base64'):
+        argumentos_trabajo(_payload(turnos_360='no es base64!'))
+    with pytest.raises(ValueError):
+        argumentos_trabajo(['no', 'es', 'dict'])
+
+
+def test_formato_invalido():
+    with pytest.raises(ValueError, match='formato'):
+        argumentos_trabajo(_payload(formato='pdf'))
+
+
+# ── Servicio levantado en un puerto libre y manejado con el cliente ──
+
+@pytest.fixture
+def servidor():
+    servidor = crear_servidor(puerto=0, hilos=1, max_cola=2)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+    servidor.servicio.detener()
+
+
+@pytest.fixture
+def archivos(tmp_path):
+    """360 de una hoja, plantilla CSV de 5 días y catálogo turnosSemanales en CSV."""
+    fechas = [datetime.datetime(2025, 3, d) for d in range(1, 6)]
+    hoja = pd.DataFrame([
+        ['NOMBRE', *fechas],
+        ['JUAN PEREZ', '08:00 - 19:00', '08:00 - 19:00', '07:00 - 15:00', None, '08:00 - 19:00'],
+    ])
+    ruta_360 = tmp_path / 'turnos.xlsx'
+    with pd.ExcelWriter(ruta_360) as writer:
+        hoja.to_excel(writer, sheet_name='AGENTES MARZO', header=False, index=False)
+    ruta_buk = tmp_path / 'importador.csv'
+    ruta_buk.write_text(
+        'Nombre del Colaborador;RUT;Área;Supervisor;' + ';'.join(f.strftime('%d-%m-%Y') for f in fechas) + '\n'
+        'JUAN PEREZ;11111111-1;OPS;JEFE;;;;;\n', encoding='utf-8',
+    )
+    ruta_catalogo = tmp_path / 'turnosSemanales.csv'
+    ruta_catalogo.write_text(
+        'Nombre;Sigla;Día;Entrada;Salida;Colación inicio;Colación fin\n'
+        'AGENTE DIURNO;AGEDIU1;Lunes;08:00;19:00;-;-\n', encoding='utf-8',
+    )
+    return str(ruta_360), str(ruta_buk), str(ruta_catalogo)
+
+
+def test_trabajo_completo_con_el_cliente(servidor, archivos):
+    cliente = ClienteBukizador(f"http://127.0.0.1:{servidor.server_address[1]}")
+    trabajo = cliente.enviar(*archivos, tolerancia=0)
+    estado = cliente.esperar(trabajo, intervalo=0.05, timeout=30)
+    assert estado['estado'] == 'terminado', estado.get('error')
+    assert estado['formato'] == 'csv'
+
+    filas = cliente.importador(trabajo).decode('utf-8').splitlines()
+    assert filas[1].split(';')[4:] == ['AGEDIU1', 'AGEDIU1', 'REVISAR:07:00 - 15:00', 'L', 'D']
+    problemas = cliente.problemas(trabajo)['problemas']
+    assert [(p['fecha'], p['turno']) for p in problemas] == [('2025-03-03', '07:00 - 15:00')]
+
+
+def test_pedidos_invalidos_responden_400(servidor, archivos):
+    puerto = servidor.server_address[1]
+    cliente = ClienteBukizador(f"http://127.0.0.1:{puerto}")
+    with pytest.raises(ErrorServicio) as e:
+        cliente.enviar(*archivos, formato='pdf')
+    assert e.value.codigo == 400 and 'formato' in e.value.mensaje
+
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=10)
+    conexion.putrequest('POST', '/trabajos')
+    conexion.putheader('Content-Length', 'mucho')
+    conexion.endheaders()
+    respuesta = conexion.getresponse()
+    assert respuesta.status == 400
+    assert 'Content-Length' in json.loads(respuesta.read())['error']
+    conexion.close()
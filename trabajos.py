@@ -0,0 +1,84 @@
+"""
+Ejecución de trabajos largos en segundo plano.
+
+Un `Trabajo` envuelve una función del pipeline, la corre en un hilo y
+guarda su progreso (etapa, detalle, fracción) para que la interfaz lo
+consulte en cada rerun sin quedar bloqueada.
+"""
+import threading
+import traceback
+import uuid
+
+from pipeline import ProcesoCancelado
+
+
+class Trabajo:
+    """
+    Trabajo de fondo con progreso y cancelación.
+
+    La función recibe los argumentos dados más `progreso` y `cancelado`
+    (un threading.Event), igual que `pipeline.procesar_carga`.
+    Estados: 'pendiente', 'ejecutando', 'terminado', 'error', 'cancelado'.
+    """
+
+    def __init__(self, funcion, *args, **kwargs):
+        self.id = uuid.uuid4().hex
+        self.estado = 'pendiente'
+        self.etapa = ''
+        self.detalle = ''
+        self.fraccion = 0.0
+        self.eventos = []
+        self.resultado = None
+        self.error = None
+        self.traza = None
+        self._funcion = funcion
+        self._args = args
+        self._kwargs = kwargs
+        self._cancelar = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def iniciar(self):
+        """Lanza el trabajo en un hilo daemon propio."""
+        self._hilo = threading.Thread(target=self.ejecutar, name=f"trabajo-{self.id[:8]}", daemon=True)
+        self._hilo.start()
+        return self
+
+    def ejecutar(self):
+        """Corre el trabajo en el hilo actual, capturando resultado o error."""
+        with self._lock:
+            if self._cancelar.is_set():
+                self.estado = 'cancelado'
+                return
+            self.estado = 'ejecutando'
+        try:
+            resultado = self._funcion(*self._args, progreso=self._progreso, cancelado=self._cancelar, **self._kwargs)
+        except ProcesoCancelado:
+            with self._lock:
+                self.estado = 'cancelado'
+        except Exception as e:
+            with self._lock:
+                self.error = e
+                self.traza = traceback.format_exc()
+                self.estado = 'error'
+        else:
+            with self._lock:
+                self.resultado = resultado
+                self.fraccion = 1.0
+                self.estado = 'terminado'
+
+    def _progreso(self, etapa, detalle='', fraccion=None):
+        with self._lock:
+            self.etapa = etapa
+            self.detalle = detalle
+            if fraccion is not None:
+                self.fraccion = min(max(float(fraccion), 0.0), 1.0)
+            self.eventos.append((etapa, detalle))
+
+    def cancelar(self):
+        """Pide la cancelación; el pipeline la atiende en el siguiente punto de control."""
+        self._cancelar.set()
+
+    @property
+    def activo(self):
+        return self.estado in ('pendiente', 'ejecutando')